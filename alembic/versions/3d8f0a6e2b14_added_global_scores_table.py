@@ -0,0 +1,45 @@
+"""added global scores table
+
+Revision ID: 3d8f0a6e2b14
+Revises: e52b8d7c1f39
+Create Date: 2026-10-18 15:12:48.730164+00:00
+
+Keeps each user's total score across every guild, which games add to as they
+complete. The table is filled in from the existing guild scoreboards.
+"""
+
+# pylint: disable=no-member
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# Revision identifiers, used by Alembic.
+revision = '3d8f0a6e2b14'
+down_revision = 'e52b8d7c1f39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrades the database a single revision."""
+
+    op.create_table(
+        "global_scores",
+        sa.Column("discord_user_id", sa.BigInteger, primary_key=True),
+        sa.Column("score", sa.BigInteger, nullable=False),
+        sa.Index("global_scores_score_idx", "score", "discord_user_id"),
+    )
+
+    op.execute(
+        "INSERT INTO global_scores (discord_user_id, score) "
+        "SELECT user_scores.key::bigint, SUM(user_scores.value::bigint) "
+        "FROM scoreboards, jsonb_each_text(scoreboards.scores) user_scores "
+        "GROUP BY user_scores.key")
+
+
+def downgrade():
+    """Downgrades the database a single revision."""
+
+    op.drop_table("global_scores")
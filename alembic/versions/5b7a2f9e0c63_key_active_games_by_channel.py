@@ -0,0 +1,64 @@
+"""key active games by channel
+
+Revision ID: 5b7a2f9e0c63
+Revises: 8c4e1b7d9a52
+Create Date: 2026-10-18 17:48:22.604731+00:00
+
+Guilds can run a game in each of their trivia channels, so active games are
+keyed by guild and channel instead of only by guild. The channel is copied out
+of each game's state, which only holds live games since finished ones are
+moved into the game history.
+
+Downgrading keeps the most recently started game of each guild.
+"""
+
+# pylint: disable=no-member
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# Revision identifiers, used by Alembic.
+revision = '5b7a2f9e0c63'
+down_revision = '8c4e1b7d9a52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrades the database a single revision."""
+
+    op.add_column(
+        "active_games", sa.Column("channel_id", sa.BigInteger, nullable=True))
+
+    op.execute("LOCK TABLE active_games IN EXCLUSIVE MODE")
+    op.execute(
+        "UPDATE active_games "
+        "SET channel_id = (game_state->>'channel_id')::bigint")
+
+    op.alter_column("active_games", "channel_id", nullable=False)
+    op.drop_index("active_games_discord_guild_id_idx", "active_games")
+    op.create_index(
+        "active_games_discord_guild_id_channel_id_idx",
+        "active_games",
+        ["discord_guild_id", "channel_id"],
+        unique=True)
+
+
+def downgrade():
+    """Downgrades the database a single revision."""
+
+    op.execute("LOCK TABLE active_games IN EXCLUSIVE MODE")
+    op.execute(
+        "DELETE FROM active_games WHERE id NOT IN ("
+        "SELECT MAX(id) FROM active_games GROUP BY discord_guild_id)")
+
+    op.drop_index(
+        "active_games_discord_guild_id_channel_id_idx", "active_games")
+    op.create_index(
+        "active_games_discord_guild_id_idx",
+        "active_games",
+        ["discord_guild_id"],
+        unique=True)
+    op.drop_column("active_games", "channel_id")
@@ -0,0 +1,44 @@
+"""added question rotations table
+
+Revision ID: 7f3e2a91c4d5
+Revises: c033216d2d8a
+Create Date: 2026-10-18 09:12:40.518204+00:00
+"""
+
+# pylint: disable=no-member
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# Revision identifiers, used by Alembic.
+revision = '7f3e2a91c4d5'
+down_revision = 'c033216d2d8a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrades the database a single revision."""
+
+    op.create_table(
+        "question_rotations",
+        sa.Column("id", sa.BigInteger, primary_key=True),
+        sa.Column("guild_id", sa.BigInteger, nullable=False),
+        sa.Column("seed", sa.BigInteger, nullable=False),
+        sa.Column("cursor", sa.Integer, nullable=False),
+        sa.Column("domain_bits", sa.SmallInteger, nullable=False),
+        sa.ForeignKeyConstraint(
+            ["guild_id"],
+            ["guilds.id"],
+            ondelete="CASCADE",
+        ),
+        sa.Index("question_rotations_guild_id_idx", "guild_id", unique=True),
+    )
+
+
+def downgrade():
+    """Downgrades the database a single revision."""
+
+    op.drop_table("question_rotations")
@@ -0,0 +1,46 @@
+"""added daily scores table
+
+Revision ID: 8c4e1b7d9a52
+Revises: 3d8f0a6e2b14
+Create Date: 2026-10-18 16:31:09.518207+00:00
+
+Rolls up scores per guild, day and user so weekly and monthly scoreboards can
+be summed from a range of rows. Guild scoreboards don't record when points
+were earned, so the rollups start out empty.
+"""
+
+# pylint: disable=no-member
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# Revision identifiers, used by Alembic.
+revision = '8c4e1b7d9a52'
+down_revision = '3d8f0a6e2b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrades the database a single revision."""
+
+    op.create_table(
+        "daily_scores",
+        sa.Column("discord_guild_id", sa.BigInteger, primary_key=True),
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("discord_user_id", sa.BigInteger, primary_key=True),
+        sa.Column("score", sa.Integer, nullable=False),
+        sa.ForeignKeyConstraint(
+            ["discord_guild_id"],
+            ["guilds.discord_guild_id"],
+            ondelete="CASCADE",
+        ),
+    )
+
+
+def downgrade():
+    """Downgrades the database a single revision."""
+
+    op.drop_table("daily_scores")
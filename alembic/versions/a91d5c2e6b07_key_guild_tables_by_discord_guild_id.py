@@ -0,0 +1,118 @@
+"""key guild tables by discord guild id
+
+Revision ID: a91d5c2e6b07
+Revises: 7f3e2a91c4d5
+Create Date: 2026-10-18 11:40:02.117386+00:00
+
+Replaces the surrogate guild_id foreign key of active_games, scoreboards and
+question_rotations with the Discord guild ID itself, so helpers no longer need
+to look up guilds.id before every read and write.
+
+The backfill runs in small batches outside of the migration's transaction so
+it doesn't hold locks on the tables while it runs. Each table is then locked
+briefly to catch up on rows written during the backfill before the column is
+made non-nullable.
+"""
+
+# pylint: disable=no-member
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# Revision identifiers, used by Alembic.
+revision = 'a91d5c2e6b07'
+down_revision = '7f3e2a91c4d5'
+branch_labels = None
+depends_on = None
+
+TABLES = ("active_games", "scoreboards", "question_rotations")
+BATCH_SIZE = 5000
+
+
+def backfill(table: str, target: str, source: str, current: str, key: str):
+    """Copies a guild key into a new column in batches.
+
+    :param str table: Table being backfilled.
+    :param str target: Column of the table that is filled in.
+    :param str source: Column of guilds that is copied into the target.
+    :param str current: Column of the table that references guilds.
+    :param str key: Column of guilds that is currently referenced.
+    """
+
+    query = sa.text(
+        "UPDATE {table} SET {target} = guilds.{source} FROM guilds "
+        "WHERE {table}.{current} = guilds.{key} AND {table}.id IN ("
+        "SELECT id FROM {table} WHERE {target} IS NULL LIMIT :batch_size)"
+        .format(table=table, target=target, source=source, current=current,
+                key=key))
+
+    conn = op.get_bind()
+    while conn.execute(query, batch_size=BATCH_SIZE).rowcount > 0:
+        pass
+
+
+def upgrade():
+    """Upgrades the database a single revision."""
+
+    for table in TABLES:
+        op.add_column(
+            table, sa.Column("discord_guild_id", sa.BigInteger, nullable=True))
+
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            backfill(table, "discord_guild_id", "discord_guild_id",
+                     "guild_id", "id")
+
+    for table in TABLES:
+        op.execute("LOCK TABLE {} IN EXCLUSIVE MODE".format(table))
+        backfill(table, "discord_guild_id", "discord_guild_id",
+                 "guild_id", "id")
+
+        op.alter_column(table, "discord_guild_id", nullable=False)
+        op.create_index(
+            "{}_discord_guild_id_idx".format(table),
+            table,
+            ["discord_guild_id"],
+            unique=True)
+        op.create_foreign_key(
+            "{}_discord_guild_id_fkey".format(table),
+            table,
+            "guilds",
+            ["discord_guild_id"],
+            ["discord_guild_id"],
+            ondelete="CASCADE")
+
+        # Dropping the column also drops its index and foreign key.
+        op.drop_column(table, "guild_id")
+
+
+def downgrade():
+    """Downgrades the database a single revision."""
+
+    for table in TABLES:
+        op.add_column(
+            table, sa.Column("guild_id", sa.BigInteger, nullable=True))
+
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            backfill(table, "guild_id", "id", "discord_guild_id",
+                     "discord_guild_id")
+
+    for table in TABLES:
+        op.execute("LOCK TABLE {} IN EXCLUSIVE MODE".format(table))
+        backfill(table, "guild_id", "id", "discord_guild_id",
+                 "discord_guild_id")
+
+        op.alter_column(table, "guild_id", nullable=False)
+        op.create_index(
+            "{}_guild_id_idx".format(table), table, ["guild_id"], unique=True)
+        op.create_foreign_key(
+            "{}_guild_id_fkey".format(table),
+            table,
+            "guilds",
+            ["guild_id"],
+            ["id"],
+            ondelete="CASCADE")
+        op.drop_column(table, "discord_guild_id")
@@ -0,0 +1,74 @@
+"""added game history table
+
+Revision ID: e52b8d7c1f39
+Revises: a91d5c2e6b07
+Create Date: 2026-10-18 14:05:37.402915+00:00
+
+Finished games used to stay in active_games forever. They're now moved into
+game_history, which only keeps their results and is partitioned by month so
+old history can be dropped a partition at a time. Monthly partitions are
+created by the bot, rows outside of them land in the default partition.
+
+Finished games already in active_games are moved into the default partition.
+Downgrading drops the history, as active_games can't hold games without their
+questions.
+"""
+
+# pylint: disable=no-member
+
+import sqlalchemy as sa
+import sqlalchemy.dialects.postgresql as postgresql
+
+from alembic import op
+
+
+# Revision identifiers, used by Alembic.
+revision = 'e52b8d7c1f39'
+down_revision = 'a91d5c2e6b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrades the database a single revision."""
+
+    op.create_table(
+        "game_history",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column(
+            "finished_at",
+            sa.DateTime(timezone=True),
+            primary_key=True,
+            server_default=sa.func.now()),
+        sa.Column("discord_guild_id", sa.BigInteger, nullable=False),
+        sa.Column("channel_id", sa.BigInteger, nullable=False),
+        sa.Column("stopped", sa.Boolean, nullable=False),
+        sa.Column("questions_asked", sa.SmallInteger, nullable=False),
+        sa.Column("scores", postgresql.JSONB(), nullable=False),
+        postgresql_partition_by="RANGE (finished_at)")
+    op.create_index(
+        "game_history_discord_guild_id_idx",
+        "game_history",
+        ["discord_guild_id", "finished_at"])
+    op.execute(
+        "CREATE TABLE game_history_default PARTITION OF game_history DEFAULT")
+
+    op.execute(
+        "WITH moved AS ("
+        "DELETE FROM active_games WHERE game_state->>'complete' = 'true' "
+        "RETURNING discord_guild_id, game_state) "
+        "INSERT INTO game_history (discord_guild_id, channel_id, stopped, "
+        "questions_asked, scores) "
+        "SELECT discord_guild_id, (game_state->>'channel_id')::bigint, "
+        "(game_state->>'current_question')::int "
+        "< jsonb_array_length(game_state->'questions'), "
+        "LEAST((game_state->>'current_question')::int, "
+        "jsonb_array_length(game_state->'questions')), "
+        "game_state->'scores' FROM moved")
+
+
+def downgrade():
+    """Downgrades the database a single revision."""
+
+    # Dropping the parent also drops its partitions.
+    op.drop_table("game_history")
@@ -0,0 +1,21 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks for Cho's hot paths.
+
+Run the suite with `python -m benchmarks run` from the repository root, and
+compare runs against a stored baseline with `python -m benchmarks compare`.
+"""
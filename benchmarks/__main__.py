@@ -0,0 +1,141 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Command-line interface for the benchmark suite.
+
+Examples:
+
+    python -m benchmarks run --save before
+    python -m benchmarks run --compare before
+    python -m benchmarks compare before after
+    python -m benchmarks load --guilds 100 --users 10 --ramp
+    python -m benchmarks memory --games 10000
+"""
+
+import argparse
+import logging
+import sys
+
+import benchmarks.suite  # noqa: F401 pylint: disable=unused-import
+
+from benchmarks import load, memory, runner
+
+LOGGER = logging.getLogger("cho.benchmarks")
+
+
+def print_comparison(rows: list):
+    """Prints a comparison table to stdout.
+
+    :param list rows:
+    """
+
+    print("{:<40} {:>14} {:>14} {:>9}  {}".format(
+        "benchmark", "baseline ns", "current ns", "change", "verdict"))
+
+    for name, before, after, change, verdict in rows:
+        print("{:<40} {:>14} {:>14} {:>9}  {}".format(
+            name,
+            "-" if before is None else "{:.0f}".format(before),
+            "-" if after is None else "{:.0f}".format(after),
+            "-" if change is None else "{:+.1%}".format(change),
+            verdict))
+
+
+def main():
+    """Entrypoint for the benchmark suite."""
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark Lorewalker Cho's hot paths.")
+    subparsers = parser.add_subparsers(dest="action")
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks.")
+    run_parser.add_argument(
+        "-k", "--only", action="append",
+        help="Only run benchmarks whose name starts with this prefix.")
+    run_parser.add_argument(
+        "--save", metavar="NAME", help="Store the results as a baseline.")
+    run_parser.add_argument(
+        "--compare", metavar="NAME",
+        help="Compare the results against a stored baseline.")
+    run_parser.add_argument(
+        "--threshold", type=float, default=0.05,
+        help="Relative change that counts as a regression.")
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare two stored baselines.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.05,
+        help="Relative change that counts as a regression.")
+
+    subparsers.add_parser("list", help="List the registered benchmarks.")
+
+    load_parser = subparsers.add_parser(
+        "load", help="Simulate concurrent games to find worker capacity.")
+    load.add_arguments(load_parser)
+
+    memory_parser = subparsers.add_parser(
+        "memory", help="Measure the memory held by concurrent games.")
+    memory.add_arguments(memory_parser)
+
+    args = parser.parse_args()
+    logging.basicConfig(format="%(message)s", level="WARNING")
+    LOGGER.setLevel("INFO")
+
+    if args.action == "list":
+        for name, (_, requires_db) in runner.BENCHMARKS.items():
+            print(name + (" (postgres)" if requires_db else ""))
+        return 0
+
+    if args.action == "compare":
+        rows = runner.compare(
+            runner.load_baseline(args.baseline),
+            runner.load_baseline(args.current),
+            threshold=args.threshold)
+        print_comparison(rows)
+        return int(any(row[4] == "slower" for row in rows))
+
+    if args.action == "load":
+        return 0 if load.run_load(args) else 1
+
+    if args.action == "memory":
+        memory.print_result(memory.measure_games(
+            args.games, args.players, args.answered))
+        return 0
+
+    if args.action != "run":
+        parser.print_help()
+        return 2
+
+    results = runner.run(args.only)
+
+    if args.save:
+        path = runner.save_baseline(args.save, results)
+        LOGGER.info("Saved baseline to %s", path)
+
+    if args.compare:
+        rows = runner.compare(
+            runner.load_baseline(args.compare), results,
+            threshold=args.threshold)
+        print_comparison(rows)
+        return int(any(row[4] == "slower" for row in rows))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,532 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Load harness that simulates many concurrent trivia games in one worker.
+
+A fake gateway builds messages from MESSAGE_CREATE payloads and dispatches
+them into a real Cho client the same way discord.py does, including keeping
+them in the client's message cache, and a REST stand-in
+answers `channel.send` after a simulated round trip. Each simulated guild
+starts a game and has a number of chatty users who guess (mostly wrong)
+answers. The harness ramps the number of guilds until latency or event loop
+lag breaks the configured SLO, and reports the last step that held as the
+worker's capacity. Passing --lean builds the client with the lean cache
+options, so running the harness with and without it compares the memory
+footprint of the two.
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import resource
+import time
+
+import discord
+import sqlalchemy as sa
+
+from sqlalchemy.pool import QueuePool
+
+import lorewalker_cho.game as game
+
+from lorewalker_cho.bot import get_lean_client_options
+
+from benchmarks.runner import throwaway_database
+from benchmarks.stubs import (
+    StubChannel, StubGuild, StubUser, build_stub_client, next_snowflake)
+
+CHATTER = [
+    "lol", "no idea", "is it arthas?", "thrall", "jaina proudmoore",
+    "uhh the lich king", "sylvanas", "illidan!!", "wait what", "gg",
+]
+
+LOGGER = logging.getLogger("cho.benchmarks")
+
+JOINED_AT = "2019-01-01T00:00:00+00:00"
+
+# Tracks the message a task is handling so replies can be attributed to it.
+MESSAGE_TIMING = contextvars.ContextVar("message_timing")
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Gets a percentile from a list of values (nearest rank).
+
+    :param list values:
+    :param float fraction:
+    :rtype: float
+    :return:
+    """
+
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def get_rss_bytes() -> int:
+    """Gets the current resident set size of the process.
+
+    :rtype: int
+    :return:
+    """
+
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = []
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.waits.append(time.perf_counter() - start)
+
+
+class LoadStats():
+    """Measurements collected during a single load step."""
+
+    def __init__(self):
+        self.latencies = []
+        self.loop_lags = []
+        self.sends = 0
+
+    def record_latency(self, timing: dict):
+        """Records the latency of a message the first time it's answered.
+
+        :param dict timing:
+        """
+
+        if not timing["done"]:
+            timing["done"] = True
+            self.latencies.append(time.perf_counter() - timing["start"])
+
+
+class FakeRestChannel(StubChannel):
+    """Trivia channel whose sends take a simulated REST round trip."""
+
+    def __init__(self, guild, stats: LoadStats, rest_latency: float):
+        super().__init__(guild)
+        self.stats = stats
+        self.rest_latency = rest_latency
+
+    async def send(self, content=None, **kwargs):
+        """Pretends to post a message, attributing latency to its trigger.
+
+        :param str content:
+        """
+
+        timing = MESSAGE_TIMING.get(None)
+        if timing is not None:
+            self.stats.record_latency(timing)
+
+        self.stats.sends += 1
+        await asyncio.sleep(self.rest_latency)
+
+
+def build_message_payload(guild, member, content: str) -> dict:
+    """Builds a MESSAGE_CREATE payload for a member's message.
+
+    :param StubGuild guild:
+    :param StubUser member:
+    :param str content:
+    :rtype: dict
+    :return:
+    """
+
+    return {
+        "id": str(next_snowflake()),
+        "channel_id": str(guild.trivia_channel.id),
+        "guild_id": str(guild.id),
+        "author": {
+            "id": str(member.id),
+            "username": member.name,
+            "discriminator": "0001",
+            "avatar": None,
+        },
+        "member": {
+            "roles": [],
+            "joined_at": JOINED_AT,
+            "deaf": False,
+            "mute": False,
+        },
+        "content": content,
+        "timestamp": JOINED_AT,
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+class FakeGateway():
+    """Feeds simulated guild traffic into a client's event dispatcher."""
+
+    def __init__(self, client, stats: LoadStats, guild_count: int,
+                 users_per_guild: int, message_rate: float,
+                 correct_chance: float, rest_latency: float):
+        """Creates the simulated guilds and their members.
+
+        :param c client:
+        :param LoadStats stats:
+        :param int guild_count:
+        :param int users_per_guild:
+        :param float message_rate: Messages per second sent by each user.
+        :param float correct_chance: Chance that a guess is correct.
+        :param float rest_latency: Simulated REST round trip in seconds.
+        :type c: LorewalkerChoClient
+        """
+
+        self.client = client
+        self.stats = stats
+        self.message_rate = message_rate
+        self.correct_chance = correct_chance
+        self.guilds = []
+
+        for _ in range(guild_count):
+            members = [StubUser(name="player{}".format(x))
+                       for x in range(users_per_guild)]
+            guild = StubGuild(members=members)
+            guild.trivia_channel = FakeRestChannel(
+                guild, stats, rest_latency)
+            guild.channels = {guild.trivia_channel.id: guild.trivia_channel}
+            self.guilds.append(guild)
+
+    def dispatch(self, guild, member, content: str):
+        """Dispatches a message event like the gateway would.
+
+        :param StubGuild guild:
+        :param StubUser member:
+        :param str content:
+        """
+
+        # pylint: disable=protected-access
+        state = self.client._connection
+        message = discord.Message(
+            state=state,
+            channel=guild.trivia_channel,
+            data=build_message_payload(guild, member, content))
+
+        MESSAGE_TIMING.set({"start": time.perf_counter(), "done": False})
+        self.client.dispatch("message", message)
+
+        # Mirrors ConnectionState.parse_message_create.
+        if state._messages is not None:
+            state._messages.append(message)
+
+    def pick_content(self, guild) -> str:
+        """Picks what a user says, sometimes the right answer.
+
+        :param StubGuild guild:
+        :rtype: str
+        :return:
+        """
+
+        game_state = self.client.active_games.get(
+            (guild.id, guild.trivia_channel.id))
+        if game_state and not game_state.complete \
+                and random.random() < self.correct_chance:
+            return game_state.get_question()["answers"][0]
+
+        return random.choice(CHATTER)
+
+    async def run_guild(self, guild, duration: float):
+        """Starts a game in a guild and chats in it until time is up.
+
+        :param StubGuild guild:
+        :param float duration:
+        """
+
+        members = list(guild.members.values())
+        deadline = time.perf_counter() + duration
+        guild_rate = self.message_rate * len(members)
+
+        # Stagger game starts so every guild doesn't ask at the same instant.
+        await asyncio.sleep(random.uniform(0, 1))
+        self.dispatch(guild, members[0], "!cho start")
+
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(random.expovariate(guild_rate))
+
+            if not self.client.is_game_in_progress(
+                    guild.id, guild.trivia_channel.id):
+                self.dispatch(guild, members[0], "!cho start")
+                continue
+
+            self.dispatch(
+                guild, random.choice(members), self.pick_content(guild))
+
+    async def run(self, duration: float):
+        """Runs traffic for every guild concurrently.
+
+        :param float duration:
+        """
+
+        await asyncio.gather(
+            *(self.run_guild(guild, duration) for guild in self.guilds))
+
+
+async def monitor_loop_lag(stats: LoadStats, interval=0.05):
+    """Samples how late the event loop wakes up from a sleep.
+
+    :param LoadStats stats:
+    :param float interval:
+    """
+
+    loop = asyncio.get_event_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        stats.loop_lags.append(max(0.0, loop.time() - start - interval))
+
+
+def instrument_client(client, stats: LoadStats):
+    """Wraps the client's on_message to record handler completion.
+
+    Latency is the time until the bot first replies to a message, or until
+    the handler returns if it doesn't reply. Replies are what users notice,
+    and correct answers keep the handler running through the next question.
+
+    :param c client:
+    :param LoadStats stats:
+    :type c: LorewalkerChoClient
+    """
+
+    on_message = client.on_message
+
+    async def timed_on_message(message):
+        try:
+            await on_message(message)
+        finally:
+            stats.record_latency(MESSAGE_TIMING.get())
+
+    client.on_message = timed_on_message
+
+
+async def run_step(engine, guild_count: int, args) -> dict:
+    """Runs a single load step with a fixed number of guilds.
+
+    :param e engine:
+    :param int guild_count:
+    :param a args: Parsed command-line arguments of the load command.
+    :type e: sqlalchemy.engine.Engine
+    :rtype: dict
+    :return:
+    """
+
+    stats = LoadStats()
+    client_options = get_lean_client_options() if args.lean else {}
+    client = build_stub_client(
+        engine, loop=asyncio.get_event_loop(), **client_options)
+    instrument_client(client, stats)
+
+    gateway = FakeGateway(
+        client, stats, guild_count, args.users, args.rate,
+        args.correct_chance, args.rest_latency)
+
+    engine.pool.waits = []
+    monitor = asyncio.ensure_future(monitor_loop_lag(stats))
+    start = time.perf_counter()
+
+    await gateway.run(args.duration)
+    elapsed = time.perf_counter() - start
+
+    monitor.cancel()
+
+    # Stop the simulated games so their timers don't bleed into the next step.
+    client.active_games.clear()
+    pending = [task for task in asyncio.all_tasks()
+               if task is not asyncio.current_task()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    pool_waits = engine.pool.waits
+
+    return {
+        "guilds": guild_count,
+        "users": guild_count * args.users,
+        "messages": len(stats.latencies),
+        "messages_per_sec": len(stats.latencies) / elapsed,
+        "latency_p50_ms": percentile(stats.latencies, 0.50) * 1000,
+        "latency_p99_ms": percentile(stats.latencies, 0.99) * 1000,
+        "loop_lag_p99_ms": percentile(stats.loop_lags, 0.99) * 1000,
+        "loop_lag_max_ms": max(stats.loop_lags or [0]) * 1000,
+        "pool_waits": sum(1 for x in pool_waits if x > 0.001),
+        "pool_wait_p99_ms": percentile(pool_waits, 0.99) * 1000,
+        "pool_overflow": engine.pool.overflow(),
+        "rss_mb": get_rss_bytes() / 2 ** 20,
+        "cached_messages": len(client.cached_messages),
+    }
+
+
+def meets_slo(result: dict, args) -> bool:
+    """Checks if a load step stayed within the latency and lag SLOs.
+
+    :param dict result:
+    :param a args:
+    :rtype: bool
+    :return:
+    """
+
+    return (
+        result["latency_p99_ms"] <= args.slo_latency_ms
+        and result["loop_lag_p99_ms"] <= args.slo_loop_lag_ms
+    )
+
+
+def print_result(result: dict):
+    """Prints a single step's measurements.
+
+    :param dict result:
+    """
+
+    print(
+        "{guilds:>6} guilds {users:>7} users | {messages_per_sec:>8.1f} msg/s "
+        "| p50 {latency_p50_ms:>7.1f} ms p99 {latency_p99_ms:>8.1f} ms "
+        "| lag p99 {loop_lag_p99_ms:>7.1f} ms max {loop_lag_max_ms:>7.1f} ms "
+        "| pool waits {pool_waits:>5} p99 {pool_wait_p99_ms:>6.1f} ms "
+        "overflow {pool_overflow:>3} | rss {rss_mb:>7.1f} MiB "
+        "cached messages {cached_messages:>5}"
+        .format(**result))
+
+
+def run_load(args) -> dict:
+    """Ramps up simulated guilds until the SLO breaks.
+
+    :param a args:
+    :rtype: dict
+    :return: The last step that met the SLO, or None if none did.
+    """
+
+    # Shorten the game timers so questions turn over during a short run.
+    game.SHORT_WAIT_SECS = args.short_wait
+    game.LONG_WAIT_SECS = args.long_wait
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    capacity = None
+
+    with throwaway_database() as scratch_engine:
+        if scratch_engine is None:
+            LOGGER.error("The load harness needs CHO_PG_HOST to be set.")
+            return None
+
+        engine = sa.create_engine(
+            scratch_engine.url,
+            poolclass=TimedQueuePool,
+            pool_size=args.pool_size,
+            max_overflow=args.pool_overflow)
+
+        guild_count = args.guilds
+        while guild_count <= args.max_guilds:
+            result = loop.run_until_complete(
+                run_step(engine, guild_count, args))
+            print_result(result)
+
+            if not meets_slo(result, args):
+                break
+
+            capacity = result
+            if not args.ramp:
+                break
+
+            guild_count *= 2
+
+        engine.dispose()
+
+    loop.close()
+
+    if capacity:
+        print(
+            "Capacity per worker: {guilds} concurrent games, {users} users, "
+            "{messages_per_sec:.0f} messages/s (p99 {latency_p99_ms:.1f} ms, "
+            "rss {rss_mb:.0f} MiB)".format(**capacity))
+    else:
+        print("Capacity per worker: SLO was not met at the starting load.")
+
+    return capacity
+
+
+def add_arguments(parser):
+    """Adds the load harness arguments to an argparse parser.
+
+    :param a parser:
+    :type a: argparse.ArgumentParser
+    """
+
+    parser.add_argument(
+        "-g", "--guilds", type=int, default=50,
+        help="Number of guilds (concurrent games) to start with.")
+    parser.add_argument(
+        "-u", "--users", type=int, default=10,
+        help="Number of chatty users in each guild.")
+    parser.add_argument(
+        "-r", "--rate", type=float, default=0.2,
+        help="Messages per second sent by each user.")
+    parser.add_argument(
+        "--correct-chance", type=float, default=0.05,
+        help="Chance that a message is the correct answer.")
+    parser.add_argument(
+        "--rest-latency", type=float, default=0.05,
+        help="Simulated channel.send round trip in seconds.")
+    parser.add_argument(
+        "-d", "--duration", type=float, default=20.0,
+        help="Seconds to run each load step for.")
+    parser.add_argument(
+        "--ramp", action="store_true", default=False,
+        help="Double the guild count each step until the SLO breaks.")
+    parser.add_argument(
+        "--max-guilds", type=int, default=10000,
+        help="Stop ramping past this many guilds.")
+    parser.add_argument(
+        "--slo-latency-ms", type=float, default=250.0,
+        help="Maximum p99 on_message latency that counts as healthy.")
+    parser.add_argument(
+        "--slo-loop-lag-ms", type=float, default=100.0,
+        help="Maximum p99 event loop lag that counts as healthy.")
+    parser.add_argument(
+        "--short-wait", type=float, default=1.0,
+        help="Seconds between questions during the simulation.")
+    parser.add_argument(
+        "--long-wait", type=float, default=5.0,
+        help="Seconds a question stays open during the simulation.")
+    parser.add_argument(
+        "--pool-size", type=int, default=6,
+        help="SQLAlchemy pool size, matching SQLALCHEMY_POOL_SIZE.")
+    parser.add_argument(
+        "--pool-overflow", type=int, default=10,
+        help="SQLAlchemy pool overflow, matching SQLALCHEMY_POOL_MAX.")
+    parser.add_argument(
+        "--lean", action="store_true", default=False,
+        help="Build the client with the lean cache options, like cho --lean.")
@@ -0,0 +1,133 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Measures how much memory active games hold with tracemalloc.
+
+Games are created the way the bot holds them (one per channel in a dict),
+played partway through so they have scores, and the traced allocations are
+compared against a snapshot taken before any were created.
+"""
+
+import gc
+import logging
+import random
+import tracemalloc
+
+from lorewalker_cho.game_state import GameState
+
+from benchmarks.stubs import next_snowflake
+
+LOGGER = logging.getLogger("cho.benchmarks")
+
+
+def create_games(count: int, players: int, answered: int) -> dict:
+    """Creates games that are partway through with a few scoring players.
+
+    :param int count:
+    :param int players: Players that score in each game.
+    :param int answered: Questions answered in each game.
+    :rtype: dict
+    :return: Games keyed by guild and channel ID, like
+        GameMixin.active_games.
+    """
+
+    games = {}
+
+    for _ in range(count):
+        guild_id = next_snowflake()
+        game_state = GameState(None, guild_id, channel_id=next_snowflake())
+        user_ids = [next_snowflake() for _ in range(players)]
+
+        for _ in range(answered):
+            game_state.bump_score(random.choice(user_ids))
+            game_state.step()
+
+        games[game_state.key] = game_state
+
+    return games
+
+
+def measure_games(count: int, players: int, answered: int) -> dict:
+    """Measures the traced memory held by a number of active games.
+
+    :param int count:
+    :param int players:
+    :param int answered:
+    :rtype: dict
+    :return:
+    """
+
+    # Load the question bank and warm any caches before the first snapshot,
+    # as those are shared by every game rather than held by one.
+    create_games(1, players, answered)
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    games = create_games(count, players, answered)
+    gc.collect()
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "lineno")
+    total = sum(stat.size_diff for stat in stats)
+
+    result = {
+        "games": len(games),
+        "total_bytes": total,
+        "bytes_per_game": total / len(games),
+        "top": [
+            (str(stat.traceback), stat.size_diff)
+            for stat in stats[:5]
+        ],
+    }
+
+    return result
+
+
+def print_result(result: dict):
+    """Prints a memory measurement.
+
+    :param dict result:
+    """
+
+    print("{games} games: {total:.1f} MiB, {per_game:.0f} bytes per game".format(
+        games=result["games"],
+        total=result["total_bytes"] / 1024 / 1024,
+        per_game=result["bytes_per_game"]))
+
+    for location, size in result["top"]:
+        print("  {:>10.1f} KiB  {}".format(size / 1024, location))
+
+
+def add_arguments(parser):
+    """Adds the memory measurement arguments to an argparse parser.
+
+    :param a parser:
+    :type a: argparse.ArgumentParser
+    """
+
+    parser.add_argument(
+        "-n", "--games", type=int, default=10000,
+        help="Number of concurrent games to hold.")
+    parser.add_argument(
+        "-p", "--players", type=int, default=5,
+        help="Number of scoring players in each game.")
+    parser.add_argument(
+        "-a", "--answered", type=int, default=5,
+        help="Number of questions answered in each game.")
@@ -0,0 +1,262 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains the benchmark registry, timing loop and baseline storage."""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+
+from collections import OrderedDict
+
+import sqlalchemy as sa
+
+from lorewalker_cho.sql.schema import METADATA
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            "baselines")
+
+MIN_BATCH_SECS = 0.2
+REPEAT = 5
+
+LOGGER = logging.getLogger("cho.benchmarks")
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name, requires_db=False):
+    """Registers a benchmark setup function.
+
+    The decorated function receives a BenchContext and returns the callable
+    (or coroutine function) that is timed. Anything it needs to prepare should
+    happen before it returns so setup isn't included in the measurement.
+    """
+
+    def decorator(func):
+        BENCHMARKS[name] = (func, requires_db)
+        return func
+
+    return decorator
+
+
+class BenchContext():
+    """Shared state handed to every benchmark setup function."""
+
+    def __init__(self, loop, engine=None):
+        """Initializes the context.
+
+        :param l loop:
+        :param e engine: Engine bound to a throwaway database, if any.
+        :type l: asyncio.AbstractEventLoop
+        :type e: sqlalchemy.engine.Engine
+        """
+
+        self.loop = loop
+        self.engine = engine
+
+
+@contextlib.contextmanager
+def throwaway_database():
+    """Creates a scratch postgres database with Cho's schema.
+
+    The database lives on the server at CHO_PG_HOST and is dropped when the
+    context exits. Nothing is yielded if CHO_PG_HOST isn't set.
+    """
+
+    host = os.environ.get("CHO_PG_HOST")
+    if not host:
+        yield None
+        return
+
+    dbname = "cho_bench_{}".format(os.getpid())
+    admin_engine = sa.create_engine(
+        "postgresql+psycopg2://:@/postgres?host={}".format(host),
+        isolation_level="AUTOCOMMIT")
+    admin_engine.execute("CREATE DATABASE {}".format(dbname))
+
+    engine = sa.create_engine(
+        "postgresql+psycopg2://:@/{}?host={}".format(dbname, host))
+
+    try:
+        METADATA.create_all(engine)
+        yield engine
+    finally:
+        engine.dispose()
+        admin_engine.execute("DROP DATABASE IF EXISTS {}".format(dbname))
+        admin_engine.dispose()
+
+
+def _time_batch(loop, func, number: int) -> int:
+    """Runs a benchmark callable number times and returns elapsed ns.
+
+    :param l loop:
+    :param callable func:
+    :param int number:
+    :type l: asyncio.AbstractEventLoop
+    :rtype: int
+    :return:
+    """
+
+    if asyncio.iscoroutinefunction(func):
+        async def batch():
+            for _ in range(number):
+                await func()
+
+        start = time.perf_counter_ns()
+        loop.run_until_complete(batch())
+        return time.perf_counter_ns() - start
+
+    start = time.perf_counter_ns()
+    for _ in range(number):
+        func()
+    return time.perf_counter_ns() - start
+
+
+def measure(loop, func) -> dict:
+    """Times a benchmark callable, calibrating the batch size first.
+
+    :param l loop:
+    :param callable func:
+    :type l: asyncio.AbstractEventLoop
+    :rtype: dict
+    :return: Per-operation timings in nanoseconds.
+    """
+
+    number = 1
+    while True:
+        elapsed = _time_batch(loop, func, number)
+        if elapsed >= MIN_BATCH_SECS * 1e9 or number >= 1 << 20:
+            break
+        number *= 2
+
+    per_op = [_time_batch(loop, func, number) / number for _ in range(REPEAT)]
+
+    return {
+        "number": number,
+        "min_ns": min(per_op),
+        "median_ns": statistics.median(per_op),
+        "stdev_ns": statistics.stdev(per_op),
+    }
+
+
+def run(names=None) -> dict:
+    """Runs the registered benchmarks.
+
+    :param list names: Only run benchmarks starting with these names.
+    :rtype: dict
+    :return: Results keyed by benchmark name.
+    """
+
+    results = OrderedDict()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    with throwaway_database() as engine:
+        context = BenchContext(loop, engine)
+
+        for name, (setup, requires_db) in BENCHMARKS.items():
+            if names and not any(name.startswith(x) for x in names):
+                continue
+            if requires_db and engine is None:
+                LOGGER.warning("Skipping %s, CHO_PG_HOST isn't set.", name)
+                continue
+
+            results[name] = measure(loop, setup(context))
+            LOGGER.info(
+                "%-40s %12.0f ns/op", name, results[name]["median_ns"])
+
+    loop.close()
+
+    return results
+
+
+def save_baseline(name: str, results: dict) -> str:
+    """Stores benchmark results as a named baseline.
+
+    :param str name:
+    :param dict results:
+    :rtype: str
+    :return: Path the baseline was written to.
+    """
+
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = os.path.join(BASELINE_DIR, "{}.json".format(name))
+
+    with open(path, "w") as baseline_file:
+        json.dump({
+            "name": name,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "machine": platform.node(),
+            "results": results,
+        }, baseline_file, indent=2)
+
+    return path
+
+
+def load_baseline(name: str) -> dict:
+    """Loads the results of a named baseline (or a path to one).
+
+    :param str name:
+    :rtype: dict
+    :return:
+    """
+
+    path = name
+    if not os.path.exists(path):
+        path = os.path.join(BASELINE_DIR, "{}.json".format(name))
+
+    with open(path, "r") as baseline_file:
+        return json.load(baseline_file)["results"]
+
+
+def compare(baseline: dict, current: dict, threshold=0.05) -> list:
+    """Compares two sets of results by median time per operation.
+
+    :param dict baseline:
+    :param dict current:
+    :param float threshold: Relative change needed to flag a benchmark.
+    :rtype: list
+    :return: Rows of (name, baseline ns, current ns, change, verdict).
+    """
+
+    rows = []
+
+    for name in sorted(set(baseline) | set(current)):
+        if name not in baseline or name not in current:
+            rows.append((name, baseline.get(name, {}).get("median_ns"),
+                         current.get(name, {}).get("median_ns"), None, "n/a"))
+            continue
+
+        before = baseline[name]["median_ns"]
+        after = current[name]["median_ns"]
+        change = (after - before) / before
+
+        if change > threshold:
+            verdict = "slower"
+        elif change < -threshold:
+            verdict = "faster"
+        else:
+            verdict = "same"
+
+        rows.append((name, before, after, change, verdict))
+
+    return rows
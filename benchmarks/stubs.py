@@ -0,0 +1,146 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Stand-ins for the discord.py objects that Cho's handlers touch.
+
+These only implement the attributes and coroutines used by the bot, which is
+enough to drive `on_message` without a gateway connection.
+"""
+
+import itertools
+
+import discord
+
+from lorewalker_cho.bot import build_client
+
+SNOWFLAKES = itertools.count(100000000000000000)
+
+
+def next_snowflake() -> int:
+    """Generates a unique fake Discord ID.
+
+    :rtype: int
+    :return:
+    """
+
+    return next(SNOWFLAKES)
+
+
+class StubPermissions():
+    """Stand-in for discord.Permissions."""
+
+    def __init__(self, administrator=False):
+        self.administrator = administrator
+
+
+class StubUser():
+    """Stand-in for discord.User and discord.Member."""
+
+    def __init__(self, user_id: int = None, name="player"):
+        self.id = user_id if user_id is not None else next_snowflake()
+        self.name = name
+        self.display_name = name
+        self.bot = False
+
+    def __str__(self):
+        return "{}#0001".format(self.name)
+
+
+class StubChannel():
+    """Stand-in for discord.TextChannel that records sent messages."""
+
+    def __init__(self, guild, channel_id: int = None, name="trivia"):
+        self.id = channel_id if channel_id is not None else next_snowflake()
+        self.name = name
+        self.guild = guild
+        self.sent = 0
+
+    def permissions_for(self, member):
+        """Grants administrator to everyone, it's a benchmark after all.
+
+        :param m member:
+        :type m: StubUser
+        :rtype: StubPermissions
+        :return:
+        """
+
+        return StubPermissions(administrator=True)
+
+    async def send(self, content=None, **kwargs):
+        """Pretends to post a message in the channel.
+
+        :param str content:
+        """
+
+        self.sent += 1
+
+
+class StubGuild():
+    """Stand-in for discord.Guild with a single trivia channel."""
+
+    def __init__(self, guild_id: int = None, members=()):
+        self.id = guild_id if guild_id is not None else next_snowflake()
+        self.members = {member.id: member for member in members}
+        self.trivia_channel = StubChannel(self)
+        self.channels = {self.trivia_channel.id: self.trivia_channel}
+
+    def get_channel(self, channel_id: int):
+        """Looks up a channel by ID.
+
+        :param int channel_id:
+        :rtype: StubChannel
+        :return:
+        """
+
+        return self.channels.get(channel_id)
+
+    def get_member(self, user_id: int):
+        """Looks up a member by ID.
+
+        :param int user_id:
+        :rtype: StubUser
+        :return:
+        """
+
+        return self.members.get(user_id)
+
+
+class StubMessage():
+    """Stand-in for discord.Message."""
+
+    def __init__(self, content: str, author: StubUser, channel: StubChannel):
+        self.id = next_snowflake()
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+
+
+def build_stub_client(engine, redis_client=None, **kwargs):
+    """Builds a Cho client that is "logged in" without connecting.
+
+    :param e engine:
+    :param r redis_client:
+    :type e: sqlalchemy.engine.Engine
+    :rtype: LorewalkerChoClient
+    :return:
+    """
+
+    client_class = build_client(discord.Client)
+    client = client_class(engine, redis_client, **kwargs)
+    client._connection.user = StubUser(name="Lorewalker Cho")
+
+    return client
@@ -0,0 +1,393 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks covering the bot's per-message and per-question hot paths."""
+
+# pylint: disable=unused-argument
+
+import datetime
+
+import sqlalchemy as sa
+
+import lorewalker_cho.utils as utils
+import lorewalker_cho.sql.active_game as sql_active_game
+import lorewalker_cho.sql.daily_score as sql_daily_score
+import lorewalker_cho.sql.global_score as sql_global_score
+import lorewalker_cho.sql.guild as sql_guild
+import lorewalker_cho.sql.scoreboard as sql_scoreboard
+
+from lorewalker_cho.game_state import GameState
+from lorewalker_cho.sql.schema import DAILY_SCORES, GLOBAL_SCORES, GUILDS
+
+from benchmarks.runner import benchmark
+from benchmarks.stubs import (
+    StubGuild, StubMessage, StubUser, build_stub_client, next_snowflake)
+
+SCORES = {str(next_snowflake()): score for score in range(25)}
+
+
+def _create_game_state(engine=None, guild_id=None) -> GameState:
+    """Creates a game with a known question for answer checks.
+
+    :param e engine:
+    :param int guild_id:
+    :type e: sqlalchemy.engine.Engine
+    :rtype: GameState
+    :return:
+    """
+
+    game_state = GameState(
+        engine,
+        guild_id or next_snowflake(),
+        channel_id=next_snowflake(),
+        save_to_db=engine is not None)
+    game_state.questions[0] = {
+        "topic": "Wrath of the Lich King",
+        "text": "Who was the lich that served the Lich King in Naxxramas?",
+        "answers": ["Kel'Thuzad", "Kel Thuzad", "Kelthuzad"],
+    }
+    game_state.scores = {
+        int(user_id): score for user_id, score in SCORES.items()}
+
+    return game_state
+
+
+@benchmark("utils.levenshtein_ratio.short")
+def bench_levenshtein_ratio_short(context):
+    """Ratio between a short guess and answer."""
+
+    return lambda: utils.levenshtein_ratio("Thral", "Thrall")
+
+
+@benchmark("utils.levenshtein_ratio.long")
+def bench_levenshtein_ratio_long(context):
+    """Ratio between a chatty message and a long answer."""
+
+    return lambda: utils.levenshtein_ratio(
+        "i'm pretty sure it was the lady katrana prestor",
+        "Lady Katrana Prestor")
+
+
+@benchmark("game_state.check_answer.incorrect")
+def bench_check_answer_incorrect(context):
+    """An incorrect guess has to be compared against every alias."""
+
+    game_state = _create_game_state()
+    return lambda: game_state.check_answer("arthas menethil")
+
+
+@benchmark("game_state.check_answer.correct")
+def bench_check_answer_correct(context):
+    """A correct guess matching the first alias."""
+
+    game_state = _create_game_state()
+    return lambda: game_state.check_answer("kel'thuzad")
+
+
+@benchmark("game_state.check_answer.variant")
+def bench_check_answer_variant(context):
+    """A correct guess spelled like none of the aliases."""
+
+    game_state = _create_game_state()
+    return lambda: game_state.check_answer("kel thuzzad")
+
+
+def _burst_guesses(count: int) -> list:
+    """Builds a burst of incorrect guesses followed by a correct one.
+
+    :param int count:
+    :rtype: list
+    :return:
+    """
+
+    wrong = [
+        "arthas", "is it arthas menethil?", "the lich king", "anub'arak",
+        "sapphiron lol", "no idea", "maexxna", "noth the plaguebringer",
+    ]
+    guesses = [wrong[index % len(wrong)] for index in range(count - 1)]
+
+    return guesses + ["kel thuzad"]
+
+
+@benchmark("game_state.check_answer.burst")
+def bench_check_answer_burst(context):
+    """A 200 guess burst checked one message at a time."""
+
+    game_state = _create_game_state()
+    guesses = _burst_guesses(200)
+
+    def check_answers():
+        for guess in guesses:
+            if game_state.check_answer(guess):
+                return
+
+    return check_answers
+
+
+@benchmark("game_state.check_answers.burst")
+def bench_check_answers_burst(context):
+    """The same 200 guess burst checked as one vectorized batch."""
+
+    game_state = _create_game_state()
+    guesses = _burst_guesses(200)
+
+    return lambda: game_state.check_answers(guesses)
+
+
+@benchmark("game_state.init.new")
+def bench_game_state_init_new(context):
+    """Starting a new game, which selects questions from the bank."""
+
+    guild_id = next_snowflake()
+    channel_id = next_snowflake()
+
+    return lambda: GameState(None, guild_id, channel_id=channel_id)
+
+
+@benchmark("game_state.init.existing")
+def bench_game_state_init_existing(context):
+    """Rebuilding a game from a saved state, as done on resume."""
+
+    guild_id = next_snowflake()
+    existing_game = _create_game_state().serialize()
+
+    return lambda: GameState(None, guild_id, existing_game=existing_game)
+
+
+@benchmark("game_state.serialize")
+def bench_game_state_serialize(context):
+    """Converting a game state into its stored representation."""
+
+    game_state = _create_game_state()
+    return game_state.serialize
+
+
+@benchmark("sql.get_guild", requires_db=True)
+def bench_sql_get_guild(context):
+    """Guild config lookup that runs for every message."""
+
+    guild_id = next_snowflake()
+    sql_guild.create_guild(context.engine, guild_id, {"prefix": "!"})
+
+    return lambda: sql_guild.get_guild(context.engine, guild_id)
+
+
+@benchmark("sql.get_guild.adhoc", requires_db=True)
+def bench_sql_get_guild_adhoc(context):
+    """Guild config lookup building and compiling a new statement per call.
+
+    This is how helpers ran before statements were prebuilt, and is kept as a
+    reference point for the per-call overhead of `sql.get_guild`.
+    """
+
+    guild_id = next_snowflake()
+    sql_guild.create_guild(context.engine, guild_id, {"prefix": "!"})
+
+    def get_guild():
+        query = sa.select([GUILDS.c.config]) \
+            .where(GUILDS.c.discord_guild_id == guild_id) \
+            .limit(1)
+        return context.engine.execute(query).first()
+
+    return get_guild
+
+
+@benchmark("sql.start_game", requires_db=True)
+def bench_sql_start_game(context):
+    """Starting a persisted game, which advances the rotation and saves."""
+
+    guild_id = next_snowflake()
+    sql_guild.create_guild(context.engine, guild_id)
+    channel_id = next_snowflake()
+
+    return lambda: GameState(
+        context.engine, guild_id, channel_id=channel_id, save_to_db=True)
+
+
+@benchmark("sql.register_guilds", requires_db=True)
+def bench_sql_register_guilds(context):
+    """Registering and loading a 2500 guild shard, as done on ready."""
+
+    guild_ids = [next_snowflake() for _ in range(2500)]
+
+    def register_guilds():
+        sql_guild.create_guilds(context.engine, guild_ids)
+        return sql_guild.get_guilds(context.engine, guild_ids)
+
+    return register_guilds
+
+
+@benchmark("sql.save_game_state", requires_db=True)
+def bench_sql_save_game_state(context):
+    """Saving an in-progress game, which runs after every question."""
+
+    guild_id = next_snowflake()
+    sql_guild.create_guild(context.engine, guild_id)
+    game_state = _create_game_state(context.engine, guild_id)
+
+    return lambda: sql_active_game.save_game_state(context.engine, game_state)
+
+
+@benchmark("sql.get_game_state", requires_db=True)
+def bench_sql_get_game_state(context):
+    """Loading a single saved game."""
+
+    guild_id = next_snowflake()
+    sql_guild.create_guild(context.engine, guild_id)
+    game_state = _create_game_state(context.engine, guild_id)
+
+    return lambda: sql_active_game.get_game_state(
+        context.engine, guild_id, game_state.channel_id)
+
+
+@benchmark("sql.get_incomplete_games", requires_db=True)
+def bench_sql_get_incomplete_games(context):
+    """Loading every unfinished game, as done on resume."""
+
+    return lambda: sql_active_game.get_incomplete_games(context.engine)
+
+
+@benchmark("sql.save_scoreboard", requires_db=True)
+def bench_sql_save_scoreboard(context):
+    """Saving a guild scoreboard at the end of a game."""
+
+    guild_id = next_snowflake()
+    sql_guild.create_guild(context.engine, guild_id)
+
+    return lambda: sql_scoreboard.save_scoreboard(
+        context.engine, guild_id, SCORES)
+
+
+@benchmark("sql.get_scoreboard", requires_db=True)
+def bench_sql_get_scoreboard(context):
+    """Loading a guild scoreboard."""
+
+    guild_id = next_snowflake()
+    sql_guild.create_guild(context.engine, guild_id)
+    sql_scoreboard.save_scoreboard(context.engine, guild_id, SCORES)
+
+    return lambda: sql_scoreboard.get_scoreboard(context.engine, guild_id)
+
+
+@benchmark("sql.add_global_scores", requires_db=True)
+def bench_sql_add_global_scores(context):
+    """Adding a game's scores to the global scoreboard."""
+
+    scores = {int(user_id): score for user_id, score in SCORES.items()}
+
+    return lambda: sql_global_score.add_scores(context.engine, scores)
+
+
+@benchmark("sql.get_global_scoreboard", requires_db=True)
+def bench_sql_get_global_scoreboard(context):
+    """Loading the top players out of 100k with global scores."""
+
+    with context.engine.connect() as conn:
+        conn.execute(GLOBAL_SCORES.insert(None), [
+            {"discord_user_id": next_snowflake(), "score": score % 500}
+            for score in range(100000)
+        ])
+        conn.execute("ANALYZE global_scores")
+
+    return lambda: sql_global_score.get_top_scores(context.engine)
+
+
+@benchmark("sql.get_window_scores", requires_db=True)
+def bench_sql_get_window_scores(context):
+    """Loading a guild's monthly top players out of a year of rollups."""
+
+    guild_id = next_snowflake()
+    sql_guild.create_guild(context.engine, guild_id)
+
+    today = sql_daily_score.get_today()
+    user_ids = [next_snowflake() for _ in range(50)]
+
+    with context.engine.connect() as conn:
+        conn.execute(DAILY_SCORES.insert(None), [
+            {
+                "discord_guild_id": guild_id,
+                "day": today - datetime.timedelta(days=days_ago),
+                "discord_user_id": user_id,
+                "score": (days_ago + index) % 7,
+            }
+            for days_ago in range(365)
+            for index, user_id in enumerate(user_ids)
+        ])
+        conn.execute("ANALYZE daily_scores")
+
+    return lambda: sql_daily_score.get_window_scores(
+        context.engine, guild_id, sql_daily_score.WINDOW_MONTH)
+
+
+def _setup_client(context, with_game=False):
+    """Creates a stub client and guild for on_message benchmarks.
+
+    :param BenchContext context:
+    :param bool with_game:
+    :rtype: tuple
+    :return: The client, guild and a member of the guild.
+    """
+
+    member = StubUser(name="Thrall")
+    guild = StubGuild(members=[member])
+    client = build_stub_client(context.engine, loop=context.loop)
+    sql_guild.create_guild(context.engine, guild.id)
+
+    if with_game:
+        game_state = client.create_game(guild.id, guild.trivia_channel.id)
+        game_state.waiting = True
+
+    return client, guild, member
+
+
+@benchmark("on_message.chatter", requires_db=True)
+def bench_on_message_chatter(context):
+    """A regular message in a guild with no game running."""
+
+    client, guild, member = _setup_client(context)
+    message = StubMessage(
+        "anyone up for some mythic+?", member, guild.trivia_channel)
+
+    async def on_message():
+        await client.on_message(message)
+
+    return on_message
+
+
+@benchmark("on_message.guess", requires_db=True)
+def bench_on_message_guess(context):
+    """An incorrect guess while a question is waiting for answers."""
+
+    client, guild, member = _setup_client(context, with_game=True)
+    message = StubMessage("arthas?", member, guild.trivia_channel)
+
+    async def on_message():
+        await client.on_message(message)
+
+    return on_message
+
+
+@benchmark("on_message.command", requires_db=True)
+def bench_on_message_command(context):
+    """A help command, which goes through command dispatch."""
+
+    client, guild, member = _setup_client(context)
+    message = StubMessage("!cho help", member, guild.trivia_channel)
+
+    async def on_message():
+        await client.on_message(message)
+
+    return on_message
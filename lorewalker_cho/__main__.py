@@ -26,19 +26,34 @@ import os
 import sys
 
 import discord
-import redis
 import sqlalchemy as sa
 
 PARENT_PATH = os.path.dirname((os.path.dirname(os.path.realpath(__file__))))
 sys.path.append(PARENT_PATH)
 
 import lorewalker_cho.config as config
+import lorewalker_cho.hot_state as hot_state
+import lorewalker_cho.member_names as member_names
+import lorewalker_cho.metrics as metrics
+import lorewalker_cho.sql.game_history as sql_game_history
+import lorewalker_cho.sql.tracing as tracing
 
-from lorewalker_cho.bot import build_client
+from lorewalker_cho.bot import build_client, get_lean_client_options
+from lorewalker_cho.redis_client import AsyncRedis
 
 DISCORD_TOKEN = os.environ["CHO_DISCORD_TOKEN"]
 SQLALCHEMY_POOL_SIZE = int(os.environ.get("SQLALCHEMY_POOL_SIZE", 6))
 SQLALCHEMY_POOL_MAX = int(os.environ.get("SQLALCHEMY_POOL_MAX", 10))
+REDIS_POOL_SIZE = int(os.environ.get("CHO_REDIS_POOL_SIZE", 10))
+REDIS_TIMEOUT_SECS = float(os.environ.get("CHO_REDIS_TIMEOUT", 0.5))
+SLOW_QUERY_MS = float(os.environ.get("CHO_SLOW_QUERY_MS", 100))
+HOT_STATE_TTL_SECS = int(
+    os.environ.get("CHO_HOT_STATE_TTL", hot_state.DEFAULT_TTL_SECS))
+HISTORY_RETENTION_MONTHS = int(os.environ.get(
+    "CHO_HISTORY_RETENTION_MONTHS",
+    sql_game_history.DEFAULT_RETENTION_MONTHS))
+MEMBER_NAME_CACHE_SIZE = int(os.environ.get(
+    "CHO_MEMBER_NAME_CACHE_SIZE", member_names.DEFAULT_CACHE_SIZE))
 
 LOGGER = logging.getLogger("cho")
 
@@ -53,6 +68,15 @@ def main():
         help="Enable debug logging.")
     parser.add_argument(
         "-l", "--log", help="Specify a log file path to log to.")
+    parser.add_argument(
+        "--log-json", action='store_true', default=False,
+        help="Output logs as JSON objects.")
+    parser.add_argument(
+        "--debug-sample-rate", type=float, default=1.0,
+        help="Fraction of per-message debug logs to keep.")
+    parser.add_argument(
+        "--debug-max-per-sec", type=float, default=50.0,
+        help="Maximum per-message debug logs written each second.")
     parser.add_argument(
         "--autoshard", action='store_true', default=False,
         help="Enable autosharding")
@@ -61,9 +85,39 @@ def main():
         help="Number of shards for sharding.")
     parser.add_argument(
         "-s", "--shard-id", default=0, help="Discord shard id.")
+    parser.add_argument(
+        "-m", "--metrics-port", type=int,
+        help="Serve Prometheus metrics over HTTP on this port.")
+    parser.add_argument(
+        "--slow-query-ms", type=float, default=SLOW_QUERY_MS,
+        help="Log SQL statements that take longer than this.")
+    parser.add_argument(
+        "--hot-state", action='store_true', default=False,
+        help="Keep live game progress in Redis instead of postgres.")
+    parser.add_argument(
+        "--hot-state-ttl", type=int, default=HOT_STATE_TTL_SECS,
+        help="Seconds live game progress is kept in Redis without updates.")
+    parser.add_argument(
+        "--history-retention-months", type=int,
+        default=HISTORY_RETENTION_MONTHS,
+        help="Months of finished games to keep, or 0 to keep them forever.")
+    parser.add_argument(
+        "--lean", action='store_true', default=False,
+        help="Turn off the message and member caches and unused intents.")
+    parser.add_argument(
+        "--profile-dir",
+        help="Directory to write profiles to, the log's directory by default.")
+    parser.add_argument(
+        "--member-name-cache-size", type=int, default=MEMBER_NAME_CACHE_SIZE,
+        help="Member names seen in messages to remember for scoreboards.")
     args = parser.parse_args()
 
-    config.setup_logging(debug=args.debug, logpath=args.log)
+    log_listener = config.setup_logging(
+        debug=args.debug,
+        logpath=args.log,
+        json_logs=args.log_json,
+        debug_sample_rate=args.debug_sample_rate,
+        debug_max_per_sec=args.debug_max_per_sec)
 
     LOGGER.info(
         "Starting Lorewalker Cho worker (%s)",
@@ -76,14 +130,17 @@ def main():
     sqlalchemy_url = config.get_postgres_url()
     engine = sa.create_engine(
         sqlalchemy_url,
+        poolclass=metrics.InstrumentedQueuePool,
         pool_size=SQLALCHEMY_POOL_SIZE,
         max_overflow=SQLALCHEMY_POOL_MAX
     )
+    tracing.attach_tracing(engine, slow_query_ms=args.slow_query_ms)
     engine.connect()
     LOGGER.info("Started connection pool with size: %d", SQLALCHEMY_POOL_SIZE)
 
     redis_url = os.environ.get("CHO_REDIS_URL") or "redis://localhost:6379"
-    redis_client = redis.Redis.from_url(redis_url)
+    redis_client = AsyncRedis(
+        redis_url, maxsize=REDIS_POOL_SIZE, timeout=REDIS_TIMEOUT_SECS)
 
     # We use a special function called 'build_client' that will dynamically set
     # the base class of our bot's client class. We need to do this to make
@@ -97,11 +154,29 @@ def main():
     shard_count = (
         int(args.shard_count) if args.shard_count is not None else None)
 
+    client_options = get_lean_client_options() if args.lean else {}
+    profile_dir = args.profile_dir or (
+        os.path.dirname(os.path.abspath(args.log)) if args.log else None)
+
     discord_client = client_class(
-        engine, redis_client, shard_id=shard_id, shard_count=shard_count)
+        engine,
+        redis_client,
+        shard_id=shard_id,
+        shard_count=shard_count,
+        hot_state_ttl=args.hot_state_ttl if args.hot_state else None,
+        history_retention_months=args.history_retention_months,
+        member_name_cache_size=args.member_name_cache_size,
+        profile_dir=profile_dir,
+        **client_options)
+
+    if args.metrics_port:
+        metrics.start_metrics_server(args.metrics_port, engine, discord_client)
+
     discord_client.run(DISCORD_TOKEN)
 
+    tracing.log_query_stats()
     LOGGER.info("Shutting down... good bye!")
+    log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -18,23 +18,53 @@
 
 import asyncio
 import logging
+import os
 import shlex
+import signal
 import traceback
 
 import discord
-import redis
 
 from discord.message import Message
-from redis import Redis
 from sqlalchemy.engine import Engine
 
+import lorewalker_cho.member_names as member_names
+import lorewalker_cho.metrics as metrics
+import lorewalker_cho.profiling as profiling
 import lorewalker_cho.utils as utils
+import lorewalker_cho.sql.game_history as sql_game_history
 import lorewalker_cho.sql.guild as sql_guild
 
 from lorewalker_cho.commands import CommandsMixin
-from lorewalker_cho.game import GameMixin
+from lorewalker_cho.control import ControlMixin
+from lorewalker_cho.game import CHECKPOINT_TIMEOUT_SECS, GameMixin
+from lorewalker_cho.redis_client import AsyncRedis, RedisUnavailable
+
+DEFAULT_STATUS = "!cho help"
 
 LOGGER = logging.getLogger("cho")
+MESSAGE_LOGGER = logging.getLogger("cho.messages")
+
+
+def get_lean_client_options() -> dict:
+    """Gets discord.Client options that keep only what Cho needs cached.
+
+    Cho only needs guilds, their channels and the messages it's sent, so
+    the message cache is turned off, members aren't cached or chunked and
+    the gateway only sends guild and message events. Member names are
+    remembered from messages instead.
+
+    :rtype: dict
+    :return:
+    """
+
+    return {
+        "max_messages": None,
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "intents": discord.Intents(
+            guilds=True, guild_messages=True, dm_messages=True),
+    }
 
 
 def build_client(base):
@@ -50,17 +80,34 @@ def build_client(base):
     :return:
     """
 
-    class LorewalkerChoClient(CommandsMixin, GameMixin, base):
+    class LorewalkerChoClient(CommandsMixin, ControlMixin, GameMixin, base):
         """Discord client wrapper that uses functionality from cho.py."""
 
         def __init__(
-                self, engine: Engine, redis_client: Redis, *args, **kwargs):
+                self,
+                engine: Engine,
+                redis_client: AsyncRedis,
+                *args,
+                hot_state_ttl: int = None,
+                history_retention_months: int = None,
+                member_name_cache_size: int = None,
+                profile_dir: str = None,
+                **kwargs):
             """Initializes the ChoClient with a sqlalchemy connection pool.
 
             :param e engine: SQLAlchemy engine to make queries with.
             :param r redis_client: Redis for caching non-persistant data.
+            :param int hot_state_ttl: Keep live game progress in Redis for
+                this many seconds instead of saving it to postgres after every
+                question. Disabled if not set.
+            :param int history_retention_months: Months of finished games to
+                keep in the game history, or 0 to keep them forever.
+            :param int member_name_cache_size: Number of member names seen in
+                messages to remember for scoreboards.
+            :param str profile_dir: Directory profiler output is written to,
+                the working directory if not set.
             :type e: sqlalchemy.engine.Engine
-            :type r: redis.Redis
+            :type r: redis_client.AsyncRedis
             :rtype: LorewalkerCho
             :return:
             """
@@ -71,6 +118,91 @@ def build_client(base):
             self.redis = redis_client
             self.guild_configs = {}
             self.active_games = {}
+            self.answer_batches = {}
+            self.hot_state_ttl = hot_state_ttl
+            self.stale_hot_games = set()
+            self.games_paused = False
+            self.draining = False
+            self.control_task = None
+            self.history_retention_months = (
+                history_retention_months
+                if history_retention_months is not None
+                else sql_game_history.DEFAULT_RETENTION_MONTHS)
+            self.history_task = None
+            self.loop_lag_task = None
+            self.reaper_task = None
+            self.profiler = profiling.Profiler(
+                profile_dir or os.getcwd(), "cho-{}".format(os.getpid()))
+            self.member_names = member_names.MemberNameCache(
+                member_name_cache_size
+                if member_name_cache_size is not None
+                else member_names.DEFAULT_CACHE_SIZE)
+
+        async def start(self, *args, **kwargs):
+            """Connects to Discord, draining games on SIGTERM.
+
+            Client.run stops the event loop on SIGTERM, which would drop
+            every question that's in flight. The handler is replaced once
+            the loop is running so games are checkpointed first.
+            """
+
+            try:
+                self.loop.add_signal_handler(
+                    signal.SIGTERM,
+                    lambda: asyncio.ensure_future(self.drain()))
+                self.loop.add_signal_handler(
+                    signal.SIGUSR1,
+                    lambda: asyncio.ensure_future(
+                        self.handle_profile_signal("cpu")))
+                self.loop.add_signal_handler(
+                    signal.SIGUSR2,
+                    lambda: asyncio.ensure_future(
+                        self.handle_profile_signal("memory")))
+            except (AttributeError, NotImplementedError):
+                pass
+
+            await super().start(*args, **kwargs)
+
+        async def handle_profile_signal(self, kind: str):
+            """Toggles CPU sampling or takes a memory snapshot.
+
+            SIGUSR1 starts and stops the CPU sampler, SIGUSR2 takes a memory
+            snapshot (starting tracemalloc with the first one).
+
+            :param str kind: Either "cpu" or "memory".
+            """
+
+            try:
+                if kind == "cpu":
+                    self.profiler.toggle_cpu()
+                else:
+                    await self.profiler.take_memory_snapshot(self.loop)
+            except OSError:
+                LOGGER.exception("Unable to write %s profile", kind)
+
+        async def drain(self):
+            """Stops starting new games, checkpoints the active ones and
+            disconnects.
+            """
+
+            if self.draining:
+                return
+
+            self.draining = True
+            self.games_paused = True
+            LOGGER.info("Draining before shutting down")
+
+            try:
+                await asyncio.wait_for(
+                    self.checkpoint_games(), CHECKPOINT_TIMEOUT_SECS)
+            except asyncio.TimeoutError:
+                LOGGER.error(
+                    "Timed out checkpointing games after %d seconds",
+                    CHECKPOINT_TIMEOUT_SECS)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Unable to checkpoint games")
+
+            await self.close()
 
         async def on_ready(self):
             """Called when the bot has successfully connected to Discord."""
@@ -78,9 +210,43 @@ def build_client(base):
             LOGGER.info("Client logged in as \"%s\"", self.user)
 
             await self.set_status()
+            await self.load_games_paused()
+
+            # on_ready fires again after reconnects, but the subscription
+            # outlives those so only one listener is ever needed.
+            if self.control_task is None:
+                self.control_task = asyncio.ensure_future(
+                    self.listen_for_control_messages())
+            if self.history_task is None:
+                self.history_task = asyncio.ensure_future(
+                    self.maintain_game_history())
+            if self.reaper_task is None:
+                self.reaper_task = asyncio.ensure_future(
+                    self.reap_orphaned_games())
+            if self.loop_lag_task is None:
+                self.loop_lag_task = asyncio.ensure_future(
+                    metrics.monitor_loop_lag())
+
+            # Guilds are registered again as commands arrive, so a failure
+            # here shouldn't keep games from being resumed.
+            try:
+                await self.register_guilds(self.guilds)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Unable to register guilds")
 
             asyncio.ensure_future(self.resume_incomplete_games())
 
+        async def on_guild_join(self, guild: discord.Guild):
+            """Called when the bot is added to a new guild.
+
+            :param g guild:
+            :type g: discord.Guild
+            """
+
+            LOGGER.info("Joined guild: %s", guild.id)
+            await self.register_guilds([guild])
+
+        @metrics.time_coroutine(metrics.ON_MESSAGE_LATENCY, "on_message")
         async def on_message(self, message: Message):
             """Called whenever the bot receives a message from Discord.
 
@@ -92,7 +258,7 @@ def build_client(base):
             if self.user.id == message.author.id:
                 return
 
-            LOGGER.debug(
+            MESSAGE_LOGGER.debug(
                 "Message from \"%s\": %s",
                 message.author, message.content
             )
@@ -109,21 +275,32 @@ def build_client(base):
                 return
 
             guild_id = message.guild.id
+            self.member_names.remember(
+                guild_id, message.author.id, message.author.display_name)
 
             # Gets the configured prefix if there is one. If there isn't one a
             # default that's hardcoded is used instead.
-            results = sql_guild.get_guild(self.engine, guild_id)
-            if results:
-                _, config = results
-                prefix = utils.get_prefix(config)
-            else:
-                prefix = utils.get_prefix(None)
+            prefix = utils.get_prefix(self.get_guild_config(guild_id))
 
             if utils.is_command(message, prefix):
                 await self.handle_command(message)
-            elif self.is_game_in_progress(guild_id):
+            elif self.is_game_in_progress(guild_id, message.channel.id):
                 await self.handle_message_response(message)
 
+        async def close(self):
+            """Closes the Discord connection and the Redis pool."""
+
+            await super().close()
+
+            # Keep what was sampled if the worker stops mid-profile.
+            try:
+                self.profiler.stop_cpu()
+            except OSError:
+                LOGGER.exception("Unable to write cpu profile")
+
+            if self.redis is not None:
+                await self.redis.close()
+
         async def on_error(self, event_name, *args, **kwargs):
             """Logs exceptions to the bot's log."""
 
@@ -139,15 +316,13 @@ def build_client(base):
 
             guild_id = message.guild.id
 
-            # This is a good opportunity to make sure the guild we're getting a
-            # command from is setup properly in the database.
-            guild_query_results = sql_guild.get_guild(self.engine, guild_id)
-            if not guild_query_results:
+            # Guilds are registered on ready and on join, but a command could
+            # still arrive before registration finishes.
+            config = self.get_guild_config(guild_id)
+            if config is None:
                 LOGGER.info("Got command from new guild: %s", guild_id)
                 sql_guild.create_guild(self.engine, guild_id)
-                config = {}
-            else:
-                _, config = guild_query_results
+                config = self.guild_configs[guild_id] = {}
 
             # Split arguments as if they're in a shell-like syntax using shlex.
             # This allows for arguments to be quoted so strings with spaces can
@@ -167,21 +342,23 @@ def build_client(base):
             # Process commands that are marked for global usage.
             for global_command, func in utils.GLOBAL_COMMANDS.items():
                 if global_command == command:
-                    await func(self, message, args, config)
+                    with metrics.time_command(command):
+                        await func(self, message, args, config)
                     return
 
             # Anything not handled must be done in the configured channel.
             if not utils.is_message_from_trivia_channel(message, config):
                 await message.channel.send(
                     "Sorry, I can't be summoned into this channel. Please go "
-                    "to the trivia channel for this server."
+                    "to one of the trivia channels for this server."
                 )
                 return
 
             # Process commands that are marked for channel-only usage.
             for channel_command, func in utils.CHANNEL_COMMANDS.items():
                 if channel_command == command:
-                    await func(self, message, args, config)
+                    with metrics.time_command(command):
+                        await func(self, message, args, config)
                     return
 
             await message.channel.send(
@@ -196,28 +373,92 @@ def build_client(base):
             :type m: discord.message.Message
             """
 
-            guild_id = guild_id = message.guild.id
-
-            guild_query_results = sql_guild.get_guild(self.engine, guild_id)
-            if guild_query_results:
-                _, config = guild_query_results
-            else:
-                config = {}
+            config = self.get_guild_config(message.guild.id) or {}
 
             if utils.is_message_from_trivia_channel(message, config):
                 await self.process_answer(message)
 
-        async def set_status(self):
-            """Sets bot status to the saved one, or the default if missing."""
+        async def register_guilds(self, guilds: list):
+            """Registers guilds in bulk and warms their cached configs.
 
-            status = "!cho help"
+            Runs in the default executor as a shard can serve thousands of
+            guilds, and the gateway heartbeat shouldn't wait on the copy.
+
+            :param list guilds:
+            """
+
+            guild_ids = [guild.id for guild in guilds]
+            if not guild_ids:
+                return
+
+            def register():
+                created = sql_guild.create_guilds(self.engine, guild_ids)
+                return created, sql_guild.get_guilds(self.engine, guild_ids)
+
+            created, results = await self.loop.run_in_executor(None, register)
+            self.guild_configs.update(results)
+
+            LOGGER.info(
+                "Registered %d guilds (%d new)", len(guild_ids), created)
+
+        def get_member_name(self, guild: discord.Guild, user_id: int) -> str:
+            """Gets a member's display name without fetching the member.
+
+            Names seen in messages are checked first, as the member cache is
+            mostly empty without the members intent.
+
+            :param g guild:
+            :param int user_id:
+            :type g: discord.Guild
+            :rtype: str
+            :return: The name, or None if the member isn't known.
+            """
+
+            name = self.member_names.get(guild.id, user_id)
+            if name is not None:
+                return name
+
+            member = guild.get_member(user_id)
+            return member.display_name if member else None
+
+        def get_guild_config(self, guild_id: int) -> dict:
+            """Gets a guild's config, loading it from the database once.
+
+            Guilds that aren't in the database are cached as None so chatter
+            in unregistered guilds doesn't cost a query per message. Cached
+            configs are dropped through the control channel when changed.
+
+            :param int guild_id:
+            :rtype: dict
+            :return: The guild's config, or None if it isn't registered.
+            """
 
             try:
-                saved_status = self.redis.get("cho:status")
-                if saved_status:
-                    status = saved_status.decode()
-            except redis.ConnectionError as exc:
-                LOGGER.warning(exc)
+                return self.guild_configs[guild_id]
+            except KeyError:
+                pass
+
+            results = sql_guild.get_guild(self.engine, guild_id)
+            config = results[1] if results else None
+            self.guild_configs[guild_id] = config
+
+            return config
+
+        async def set_status(self, status: str = None):
+            """Sets bot status to the given or saved one, or the default.
+
+            :param str status:
+            """
+
+            if status is None:
+                status = DEFAULT_STATUS
+
+                try:
+                    saved_status = await self.redis.get("cho:status")
+                    if saved_status:
+                        status = saved_status.decode()
+                except RedisUnavailable as exc:
+                    LOGGER.warning(exc)
 
             LOGGER.debug("Setting status to \"%s\"", status)
 
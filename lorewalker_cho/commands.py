@@ -16,18 +16,28 @@
 
 """Contains functions that are called when Cho commands are received."""
 
+import heapq
 import logging
+import math
 import re
 
 import discord
-import redis
 
+import lorewalker_cho.control as control
+import lorewalker_cho.stats as stats
+import lorewalker_cho.sql.daily_score as sql_daily_score
+import lorewalker_cho.sql.global_score as sql_global_score
 import lorewalker_cho.sql.guild as sql_guild
 import lorewalker_cho.sql.scoreboard as sql_scoreboard
 
+from lorewalker_cho.redis_client import RedisUnavailable
 from lorewalker_cho.utils import cho_command
 
+CMD_DIAG = "diag"
 CMD_HELP = "help"
+CMD_MAINTENANCE = "maintenance"
+CMD_PROFILE = "profile"
+CMD_RELOAD_QUESTIONS = "reload-questions"
 CMD_SCOREBOARD = "scoreboard"
 CMD_SET_CHANNEL = "set-channel"
 CMD_SET_PREFIX = "set-prefix"
@@ -35,6 +45,8 @@ CMD_SET_STATUS = "set-status"
 CMD_START = "start"
 CMD_STOP = "stop"
 
+SCOREBOARD_GLOBAL = "global"
+
 DISCORD_CHANNEL_REGEX = re.compile(r"^<#([0-9]*)>$")
 ALLOWED_PREFIXES = {"!", "&", "?", "|", "^", "%"}
 
@@ -74,12 +86,15 @@ class CommandsMixin():
         embed.add_field(
             name=CMD_SCOREBOARD,
             value="Shows the server's scoreboard which shows all points "
-                  "earned by members of the server.",
+                  "earned by members of the server. Add 'week' or 'month' "
+                  "for this week's or month's top players, or 'global' to "
+                  "see the top players across every server.",
             inline=True)
         embed.add_field(
             name=CMD_SET_CHANNEL,
-            value="Changes the channel that the bot hosts trivia games in. "
-                  "Server admins only.",
+            value="Changes the channels that the bot hosts trivia games "
+                  "in, each of which can run its own game. Server admins "
+                  "only.",
             inline=True)
         embed.add_field(
             name=CMD_SET_PREFIX,
@@ -106,10 +121,17 @@ class CommandsMixin():
         :type m: discord.message.Message
         """
 
-        if self.is_game_in_progress(message.guild.id):
+        if self.is_game_in_progress(message.guild.id, message.channel.id):
             await message.channel.send(
-                "A game is already active in the trivia channel. If you "
-                "want to participate please go in there."
+                "A game is already active in this channel. If you want to "
+                "start another one, try one of the other trivia channels."
+            )
+            return
+
+        if self.games_paused:
+            await message.channel.send(
+                "I'm not starting any new games right now as I'm getting "
+                "some maintenance done. Please try again in a little while."
             )
             return
 
@@ -133,13 +155,14 @@ class CommandsMixin():
         """
 
         guild_id = message.guild.id
+        channel_id = message.channel.id
 
-        if self.is_game_in_progress(guild_id):
+        if self.is_game_in_progress(guild_id, channel_id):
             LOGGER.info(
-                "Stopping game in guild %s, requested by %s",
-                guild_id, message.author
+                "Stopping game in guild %s channel %s, requested by %s",
+                guild_id, channel_id, message.author
             )
-            await self.stop_game(guild_id)
+            await self.stop_game(guild_id, channel_id)
 
             await message.channel.send(
                 "I'm stopping the game for now. Maybe we can play another time?"
@@ -161,42 +184,102 @@ class CommandsMixin():
         :type m: discord.message.Message
         """
 
-        guild_id = message.guild.id
-        guild = self.get_guild(guild_id)
+        window = args[2].lower() if len(args) > 2 else None
+
+        if window == SCOREBOARD_GLOBAL:
+            await self.send_global_scoreboard(message.channel)
+            return
+
+        guild = message.guild
+        guild_id = guild.id
 
-        guild_scoreboard = sql_scoreboard.get_scoreboard(self.engine, guild_id)
-        if not guild_scoreboard:
-            guild_scoreboard = {}
+        if window in sql_daily_score.WINDOWS:
+            scores = sql_daily_score.get_window_scores(
+                self.engine, guild_id, window)
+            scoreboard_message = (
+                "Here are this {}'s top players for this server:\n"
+                .format(window))
         else:
-            guild_scoreboard = guild_scoreboard[0]
+            guild_scoreboard = sql_scoreboard.get_scoreboard(
+                self.engine, guild_id)
+            if not guild_scoreboard:
+                guild_scoreboard = {}
+            else:
+                guild_scoreboard = guild_scoreboard[0]
+
+            # The all-time board keeps every player the guild ever had, so
+            # only its top players fit in a message.
+            scores = heapq.nlargest(
+                sql_daily_score.DEFAULT_LIMIT,
+                guild_scoreboard.items(),
+                key=lambda item: item[1])
+            scoreboard_message = "Here is the scoreboard for this server:\n"
 
-        scoreboard_message = "Here is the scoreboard for this server:\n"
         score_count = 0
 
-        for user_id, score in guild_scoreboard.items():
-            member = guild.get_member(int(user_id))
-            if not member:
-                continue
+        for user_id, score in scores:
+            # Players that haven't spoken since the shard started aren't
+            # known by name, so they're mentioned without pinging them.
+            name = self.get_member_name(guild, int(user_id))
+            if name is not None:
+                name = "**{}**".format(name)
+            else:
+                name = "<@!{}>".format(user_id)
 
             if score != 1:
                 plural = "s"
             else:
                 plural = ""
 
-            scoreboard_message += "\n- **{}**: {} point{}".format(
-                member.display_name, score, plural)
+            scoreboard_message += "\n- {}: {} point{}".format(
+                name, score, plural)
             score_count += 1
 
         if score_count > 0:
-            await message.channel.send(scoreboard_message)
+            await message.channel.send(
+                scoreboard_message,
+                allowed_mentions=discord.AllowedMentions.none())
         else:
             await message.channel.send(
                 "Currently no scores are available. Try playing a game to "
                 "get some scores in the scoreboard.")
 
+    async def send_global_scoreboard(self, channel):
+        """Displays the top players across every guild.
+
+        Players are mentioned without pinging them, as most of them won't be
+        members of the guild asking.
+
+        :param c channel:
+        :type c: discord.channel.TextChannel
+        """
+
+        top_scores = sql_global_score.get_top_scores(self.engine)
+
+        if not top_scores:
+            await channel.send(
+                "Currently no scores are available. Try playing a game to "
+                "get some scores in the scoreboard.")
+            return
+
+        scoreboard_message = "Here are the top players across every server:\n"
+
+        for rank, (user_id, score) in enumerate(top_scores, start=1):
+            if score != 1:
+                plural = "s"
+            else:
+                plural = ""
+
+            scoreboard_message += "\n{}. <@!{}>: {} point{}".format(
+                rank, user_id, score, plural)
+
+        await channel.send(
+            scoreboard_message,
+            allowed_mentions=discord.AllowedMentions.none())
+
     @cho_command(CMD_SET_CHANNEL, admin_only=True)
     async def handle_set_channel(self, message, args, config):
-        """Updates the trivia channel configuration for the guild.
+        """Updates the trivia channels configuration for the guild.
 
         :param m message:
         :param list args:
@@ -206,27 +289,38 @@ class CommandsMixin():
 
         if len(args) < 3:
             await message.channel.send(
-                f"Please specify a channel when using \"{CMD_SET_CHANNEL}\"."
+                f"Please specify one or more channels when using "
+                f"\"{CMD_SET_CHANNEL}\"."
             )
             return
 
         guild_id = message.guild.id
-        trivia_channel_id = args[2]
-        trivia_channel_re_match = DISCORD_CHANNEL_REGEX.match(
-            trivia_channel_id
-        )
+        trivia_channel_ids = []
 
-        if not trivia_channel_re_match:
-            await message.channel.send(
-                "That doesn't look like a channel to me. Please try again."
+        for trivia_channel in args[2:]:
+            trivia_channel_re_match = DISCORD_CHANNEL_REGEX.match(
+                trivia_channel
             )
-            return
 
-        config["trivia_channel"] = int(trivia_channel_re_match.group(1))
+            if not trivia_channel_re_match:
+                await message.channel.send(
+                    "That doesn't look like a channel to me. Please try again."
+                )
+                return
+
+            trivia_channel_id = int(trivia_channel_re_match.group(1))
+            if trivia_channel_id not in trivia_channel_ids:
+                trivia_channel_ids.append(trivia_channel_id)
+
+        config.pop("trivia_channel", None)
+        config["trivia_channels"] = trivia_channel_ids
         sql_guild.update_guild_config(self.engine, guild_id, config)
+        await self.invalidate_guild_config(guild_id)
 
         await message.channel.send(
-            "The trivia channel is now in {}.".format(trivia_channel_id)
+            "Trivia games can now be played in {}.".format(", ".join(
+                "<#{}>".format(channel_id)
+                for channel_id in trivia_channel_ids))
         )
 
     @cho_command(CMD_SET_PREFIX, admin_only=True)
@@ -257,6 +351,7 @@ class CommandsMixin():
 
         config["prefix"] = new_prefix
         sql_guild.update_guild_config(self.engine, guild_id, config)
+        await self.invalidate_guild_config(guild_id)
 
         await message.channel.send(f"My prefix is now \"{new_prefix}\".")
 
@@ -285,9 +380,10 @@ class CommandsMixin():
         new_status = args[2]
 
         try:
-            self.redis.set("cho:status", new_status)
-            await self.set_status()
-        except redis.ConnectionError as exc:
+            await self.redis.set("cho:status", new_status)
+            await self.broadcast_control_message(
+                control.ACTION_SET_STATUS, status=new_status)
+        except RedisUnavailable as exc:
             LOGGER.warning(exc)
 
             await message.channel.send(
@@ -295,3 +391,192 @@ class CommandsMixin():
             )
         else:
             await message.channel.send(f"My status is now \"{new_status}\".")
+
+    @cho_command(CMD_MAINTENANCE, owner_only=True)
+    async def handle_maintenance(self, message, args, config):
+        """Pauses or resumes new games on every shard.
+
+        :param m message:
+        :param list args:
+        :param dict config:
+        :type m: discord.message.Message
+        """
+
+        if len(args) != 3 or args[2] not in ("on", "off"):
+            await message.channel.send(
+                "Please specify \"on\" or \"off\" when using "
+                f"\"{CMD_MAINTENANCE}\"."
+            )
+            return
+
+        if args[2] == "on":
+            action = control.ACTION_PAUSE_GAMES
+            self.games_paused = True
+        else:
+            action = control.ACTION_RESUME_GAMES
+            # A worker that's shutting down never takes new games again.
+            self.games_paused = self.draining
+
+        # The flag is saved like the status, so workers that start during
+        # maintenance pause too.
+        try:
+            if action == control.ACTION_PAUSE_GAMES:
+                await self.redis.set(control.GAMES_PAUSED_KEY, 1)
+            else:
+                await self.redis.delete(control.GAMES_PAUSED_KEY)
+            receivers = await self.broadcast_control_message(action)
+        except RedisUnavailable as exc:
+            LOGGER.warning(exc)
+
+            await message.channel.send(
+                "Unable to reach the other shards due to a redis connection "
+                "error, only this shard was updated."
+            )
+        else:
+            await message.channel.send(
+                f"Maintenance mode is now {args[2]} for {receivers} workers."
+            )
+
+    @cho_command(CMD_RELOAD_QUESTIONS, owner_only=True)
+    async def handle_reload_questions(self, message, args, config):
+        """Reloads the question bank on every shard without restarting.
+
+        The bank is loaded here first so a broken bank is reported to the
+        owner instead of only being logged by every shard.
+
+        :param m message:
+        :param list args:
+        :param dict config:
+        :type m: discord.message.Message
+        """
+
+        # Loading the bank runs the questions module, which can raise
+        # anything if it was generated wrong.
+        try:
+            bank, changed = await self.reload_question_bank()
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.exception("Unable to reload question bank")
+            await message.channel.send(
+                f"I couldn't load the new question bank: {exc}")
+            return
+
+        if not changed:
+            await message.channel.send(
+                f"The question bank is already up to date (version "
+                f"{bank.version}, {len(bank)} questions)."
+            )
+            return
+
+        try:
+            receivers = await self.broadcast_control_message(
+                control.ACTION_RELOAD_QUESTIONS)
+        except RedisUnavailable as exc:
+            LOGGER.warning(exc)
+
+            await message.channel.send(
+                "Unable to reach the other shards due to a redis connection "
+                "error, only this shard was updated."
+            )
+        else:
+            await message.channel.send(
+                f"Loaded version {bank.version} of the question bank "
+                f"({len(bank)} questions) and told {receivers} workers to "
+                f"reload it. Games in progress keep their questions."
+            )
+
+    @cho_command(CMD_DIAG, owner_only=True)
+    async def handle_diag(self, message, args, config):
+        """Reports the health of the shard the command was sent to.
+
+        :param m message:
+        :param list args:
+        :param dict config:
+        :type m: discord.message.Message
+        """
+
+        runtime_stats = stats.STATS
+        loop_lags = list(runtime_stats.loop_lags)
+        pool = self.engine.pool
+        pool_waits, checkouts, max_pool_wait = runtime_stats.get_pool_waits()
+
+        try:
+            redis_rtt = "{:.1f} ms".format(await self.redis.ping() * 1000)
+        except RedisUnavailable as exc:
+            redis_rtt = "unavailable ({})".format(exc)
+
+        lines = [
+            "Shard {}{}: {} active games{}".format(
+                self.shard_id if self.shard_id is not None else 0,
+                " (draining)" if self.draining else "",
+                len(self.active_games),
+                ", new games paused" if self.games_paused else ""),
+            "Gateway latency: {}".format(
+                "{:.1f} ms".format(self.latency * 1000)
+                if not math.isnan(self.latency) else "not connected"),
+            "Event loop lag: p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms "
+            "({} samples)".format(
+                stats.percentile(loop_lags, 0.50) * 1000,
+                stats.percentile(loop_lags, 0.99) * 1000,
+                max(loop_lags, default=0.0) * 1000,
+                len(loop_lags)),
+            "DB pool: {} of {} checked out, overflow {}, {} of the last {} "
+            "checkouts waited (max {:.1f} ms)".format(
+                pool.checkedout(), pool.size(), max(0, pool.overflow()),
+                pool_waits, checkouts, max_pool_wait * 1000),
+            "Redis round trip: {}".format(redis_rtt),
+            "Slowest recent handlers:",
+        ]
+
+        slowest = runtime_stats.get_slowest_handlers()
+        for secs, name in slowest:
+            lines.append("- {}: {:.1f} ms".format(name, secs * 1000))
+        if not slowest:
+            lines.append("- none yet")
+
+        await message.channel.send("```\n{}\n```".format("\n".join(lines)))
+
+    @cho_command(CMD_PROFILE, owner_only=True)
+    async def handle_profile(self, message, args, config):
+        """Starts or stops profiling the shard the command was sent to.
+
+        "cpu" toggles the CPU sampler, "memory" takes a memory snapshot and
+        "memory stop" stops tracing memory allocations.
+
+        :param m message:
+        :param list args:
+        :param dict config:
+        :type m: discord.message.Message
+        """
+
+        kind = args[2].lower() if len(args) > 2 else None
+        stop = len(args) > 3 and args[3].lower() == "stop"
+
+        if kind not in ("cpu", "memory"):
+            await message.channel.send(
+                f"Please specify \"cpu\" or \"memory\" when using "
+                f"\"{CMD_PROFILE}\"."
+            )
+            return
+
+        try:
+            if kind == "cpu":
+                path = self.profiler.toggle_cpu()
+            elif stop:
+                self.profiler.stop_memory()
+                path = None
+            else:
+                path = await self.profiler.take_memory_snapshot(self.loop)
+        except OSError as exc:
+            LOGGER.exception("Unable to write %s profile", kind)
+            await message.channel.send(
+                f"I couldn't write the {kind} profile: {exc}")
+            return
+
+        if path is not None:
+            await message.channel.send(f"Wrote the {kind} profile to {path}.")
+        elif kind == "cpu":
+            await message.channel.send(
+                f"Started CPU sampling, run \"{CMD_PROFILE} cpu\" again to "
+                f"stop it.")
+        else:
+            await message.channel.send("Stopped tracing memory allocations.")
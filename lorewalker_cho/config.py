@@ -16,11 +16,18 @@
 
 """Contains helper functions to get configuration data for the worker."""
 
+import json
 import os
+import queue
+import random
+import time
 
 import logging
 
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+FILE_LOGGERS = ("cho", "discord")
+MESSAGE_LOGGER_NAME = "cho.messages"
 
 
 def get_postgres_url():
@@ -35,32 +42,133 @@ def get_postgres_url():
     )
 
 
-def setup_logging(debug=False, logpath: str = None):
+class JsonFormatter(logging.Formatter):
+    """Formats log records as single line JSON objects."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        elif record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
+
+
+class LoggerNameFilter(logging.Filter):
+    """Only lets through records from a set of logger hierarchies."""
+
+    def __init__(self, names):
+        super().__init__()
+        self.filters = [logging.Filter(name) for name in names]
+
+    def filter(self, record):
+        return any(x.filter(record) for x in self.filters)
+
+
+class SampledFilter(logging.Filter):
+    """Samples and rate limits high volume records, like per-message logs.
+
+    A fraction of records is sampled, then a token bucket caps how many are
+    let through per second. The number of dropped records is prepended to the
+    next record that gets through so volume is still visible.
+    """
+
+    def __init__(self, sample_rate=1.0, max_per_sec=50.0):
+        """Initializes the filter.
+
+        :param float sample_rate: Fraction of records to keep.
+        :param float max_per_sec: Maximum records let through per second.
+        """
+
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_per_sec = max_per_sec
+        self.tokens = max_per_sec
+        self.last_refill = time.monotonic()
+        self.dropped = 0
+
+    def filter(self, record):
+        now = time.monotonic()
+        self.tokens = min(
+            self.max_per_sec,
+            self.tokens + (now - self.last_refill) * self.max_per_sec)
+        self.last_refill = now
+
+        if self.tokens < 1 or random.random() >= self.sample_rate:
+            self.dropped += 1
+            return False
+
+        self.tokens -= 1
+
+        if self.dropped:
+            record.msg = "[{} suppressed] {}".format(self.dropped, record.msg)
+            self.dropped = 0
+
+        return True
+
+
+def setup_logging(
+        debug=False,
+        logpath: str = None,
+        json_logs=False,
+        debug_sample_rate=1.0,
+        debug_max_per_sec=50.0) -> QueueListener:
     """Setup text logging for the bot.
 
+    Records are put on a queue by the loggers and written out by a listener
+    thread, so file writes and rotation never block the event loop.
+
     :param bool debug:
     :param str logpath:
+    :param bool json_logs: Output logs as JSON objects instead of text.
+    :param float debug_sample_rate: Fraction of per-message logs to keep.
+    :param float debug_max_per_sec: Per-message logs allowed each second.
+    :rtype: logging.handlers.QueueListener
+    :return: The started listener, which should be stopped on shutdown.
     """
 
     log_level = "DEBUG" if debug else "INFO"
     stdout_fmt = "[%(levelname)s] %(message)s"
     file_fmt = "%(asctime)-15s [%(levelname)s] %(message)s"
-    logging.basicConfig(format=stdout_fmt)
 
-    logger = logging.getLogger("cho")
-    logger.setLevel(log_level)
-    discord_logger = logging.getLogger("discord")
-    discord_logger.setLevel("INFO")  # No debug for Discord (for now).
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        JsonFormatter() if json_logs else logging.Formatter(stdout_fmt))
+    handlers = [stream_handler]
 
     if logpath:
-        handler = RotatingFileHandler(
+        file_handler = RotatingFileHandler(
             filename=logpath,
             encoding="utf-8",
             mode="a",
             maxBytes=10000000,
             backupCount=10)
-        handler.setFormatter(logging.Formatter(file_fmt))
-        handler.setLevel(log_level)
+        file_handler.setFormatter(
+            JsonFormatter() if json_logs else logging.Formatter(file_fmt))
+        file_handler.setLevel(log_level)
+        file_handler.addFilter(LoggerNameFilter(FILE_LOGGERS))
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(
+        log_queue, *handlers, respect_handler_level=True)
+    logging.getLogger().addHandler(QueueHandler(log_queue))
+
+    logger = logging.getLogger("cho")
+    logger.setLevel(log_level)
+    discord_logger = logging.getLogger("discord")
+    discord_logger.setLevel("INFO")  # No debug for Discord (for now).
+
+    message_logger = logging.getLogger(MESSAGE_LOGGER_NAME)
+    message_logger.addFilter(
+        SampledFilter(debug_sample_rate, debug_max_per_sec))
+
+    listener.start()
 
-        logger.addHandler(handler)
-        discord_logger.addHandler(handler)
+    return listener
@@ -0,0 +1,217 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains the control channel that broadcasts changes to every shard.
+
+Workers subscribe to a Redis pub/sub channel when they connect to Discord.
+Anything that has to apply to every shard, like the bot's status, pausing new
+games for maintenance or reloading the question bank, is published there
+instead of only being applied to the shard that received the command.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+
+from collections import OrderedDict
+
+from lorewalker_cho.redis_client import RedisUnavailable
+
+CONTROL_CHANNEL = "cho:control"
+GAMES_PAUSED_KEY = "cho:games-paused"
+RESUBSCRIBE_MIN_SECS = 1
+RESUBSCRIBE_MAX_SECS = 30
+
+ACTION_INVALIDATE_CONFIG = "invalidate-config"
+ACTION_PAUSE_GAMES = "pause-games"
+ACTION_RELOAD_QUESTIONS = "reload-questions"
+ACTION_RESUME_GAMES = "resume-games"
+ACTION_SET_STATUS = "set-status"
+
+WORKER_ID = "{}:{}".format(socket.gethostname(), os.getpid())
+
+LOGGER = logging.getLogger("cho")
+
+CONTROL_HANDLERS = OrderedDict()
+
+
+def control_handler(action):
+    """Marks a function as the handler of a control action."""
+
+    def decorator(func):
+        CONTROL_HANDLERS[action] = func
+        return func
+
+    return decorator
+
+
+class ControlMixin():
+    """Adds the cross-shard control channel to ChoClient."""
+
+    async def listen_for_control_messages(self):
+        """Handles control messages, resubscribing if Redis goes away."""
+
+        backoff = RESUBSCRIBE_MIN_SECS
+
+        while True:
+            try:
+                channel = await self.redis.subscribe(CONTROL_CHANNEL)
+            except RedisUnavailable as exc:
+                LOGGER.warning(
+                    "Unable to subscribe to control channel: %s", exc)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RESUBSCRIBE_MAX_SECS)
+                continue
+
+            LOGGER.info("Subscribed to control channel \"%s\"",
+                        CONTROL_CHANNEL)
+            backoff = RESUBSCRIBE_MIN_SECS
+
+            # Nothing awaits this task, so an error escaping the loop would
+            # silently cut the shard off from every later broadcast.
+            try:
+                while await channel.wait_message():
+                    payload = await channel.get()
+                    await self.handle_control_message(payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Error receiving control messages")
+
+            LOGGER.warning("Lost the control channel subscription.")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESUBSCRIBE_MAX_SECS)
+
+    async def handle_control_message(self, payload: bytes):
+        """Runs the handler of a received control message.
+
+        :param bytes payload:
+        """
+
+        try:
+            message = json.loads(payload)
+            action = message["action"]
+        except (ValueError, TypeError, KeyError):
+            LOGGER.warning("Ignoring malformed control message: %r", payload)
+            return
+
+        handler = CONTROL_HANDLERS.get(action)
+        if handler is None:
+            LOGGER.warning("Ignoring unknown control action: %s", action)
+            return
+
+        LOGGER.debug(
+            "Control message \"%s\" from %s", action, message.get("origin"))
+
+        try:
+            await handler(self, message)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Control action \"%s\" failed", action)
+
+    async def broadcast_control_message(self, action: str, **data) -> int:
+        """Publishes a control message to every shard, including this one.
+
+        :param str action:
+        :rtype: int
+        :return: Number of workers that received the message.
+        :raises RedisUnavailable:
+        """
+
+        data["action"] = action
+        data["origin"] = WORKER_ID
+
+        return await self.redis.publish(CONTROL_CHANNEL, json.dumps(data))
+
+    async def load_games_paused(self):
+        """Pauses new games if maintenance mode was turned on before this
+        worker subscribed to the control channel.
+        """
+
+        try:
+            if await self.redis.get(GAMES_PAUSED_KEY):
+                self.games_paused = True
+        except RedisUnavailable as exc:
+            LOGGER.warning(exc)
+
+    async def invalidate_guild_config(self, guild_id: int):
+        """Tells every shard to reload a guild's config after a change.
+
+        :param int guild_id:
+        """
+
+        try:
+            await self.broadcast_control_message(
+                ACTION_INVALIDATE_CONFIG, guild_id=guild_id)
+        except RedisUnavailable as exc:
+            LOGGER.warning(exc)
+
+    @control_handler(ACTION_SET_STATUS)
+    async def handle_set_status_control(self, message: dict):
+        """Changes the bot's status.
+
+        :param dict message:
+        """
+
+        await self.set_status(message["status"])
+
+    @control_handler(ACTION_INVALIDATE_CONFIG)
+    async def handle_invalidate_config_control(self, message: dict):
+        """Drops a guild's cached config so it's loaded again on next use.
+
+        :param dict message:
+        """
+
+        self.guild_configs.pop(message["guild_id"], None)
+
+    @control_handler(ACTION_PAUSE_GAMES)
+    async def handle_pause_games_control(self, message: dict):
+        """Stops accepting new games, letting running games finish.
+
+        :param dict message:
+        """
+
+        LOGGER.info("Pausing new games (requested by %s)",
+                    message.get("origin"))
+        self.games_paused = True
+
+    @control_handler(ACTION_RESUME_GAMES)
+    async def handle_resume_games_control(self, message: dict):
+        """Starts accepting new games again, unless the worker is shutting
+        down.
+
+        :param dict message:
+        """
+
+        if self.draining:
+            LOGGER.info("Not resuming new games while draining")
+            return
+
+        LOGGER.info("Resuming new games (requested by %s)",
+                    message.get("origin"))
+        self.games_paused = False
+
+    @control_handler(ACTION_RELOAD_QUESTIONS)
+    async def handle_reload_questions_control(self, message: dict):
+        """Reloads the question bank for new games.
+
+        :param dict message:
+        """
+
+        LOGGER.info("Reloading question bank (requested by %s)",
+                    message.get("origin"))
+        await self.reload_question_bank()
@@ -17,53 +17,101 @@
 """Contains logic for the trivia game in Cho."""
 
 import asyncio
+import datetime
 import logging
+import os
+import time
 
 from discord.channel import TextChannel
 from discord.guild import Guild
 
+import lorewalker_cho.hot_state as hot_state
+import lorewalker_cho.metrics as metrics
+import lorewalker_cho.question_bank as question_bank
 import lorewalker_cho.sql.active_game as sql_active_game
+import lorewalker_cho.sql.daily_score as sql_daily_score
+import lorewalker_cho.sql.game_history as sql_game_history
+import lorewalker_cho.sql.global_score as sql_global_score
 import lorewalker_cho.sql.scoreboard as sql_scoreboard
 
-from lorewalker_cho.game_state import GameState
+from lorewalker_cho.sql import repository
+
+from lorewalker_cho.game_state import (
+    GameState, get_question_bank, set_question_bank)
+from lorewalker_cho.redis_client import RedisUnavailable
 
 SHORT_WAIT_SECS = 5
 LONG_WAIT_SECS = 30
+ANSWER_BATCH_SECS = 0.005
+HISTORY_MAINTENANCE_SECS = 3600
+CHECKPOINT_TIMEOUT_SECS = 10
+ORPHAN_REAP_SECS = 60
+ORPHAN_GRACE_SECS = 300
+
+ORPHAN_MISSING_CHANNEL = "missing_channel"
+ORPHAN_NO_TIMER = "no_timer"
+ORPHAN_PAST_DEADLINE = "past_deadline"
+
+QUESTIONS_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "data", "questions.py")
 
 LOGGER = logging.getLogger("cho")
+MESSAGE_LOGGER = logging.getLogger("cho.messages")
 
 
 class GameMixin():
     """Adds trivia game logic to ChoClient. Gotta love compartmentalization."""
 
-    def __cleanup_game(self, guild_id: int):
-        """Removes the game state of a guild from memory.
+    def __cleanup_game(self, game_state: GameState):
+        """Removes a game state from memory.
 
-        :param int guild_id:
+        :param GameState game_state:
         """
 
-        del self.active_games[guild_id]
+        del self.active_games[game_state.key]
 
     async def resume_incomplete_games(self):
         """Resumes all inactive games, usually caused by the bot going down."""
 
-        incomplete_games = sql_active_game.get_incomplete_games(self.engine)
+        # Every shard sees every incomplete game, but only the shard that
+        # receives a guild's messages can play its games.
+        incomplete_games = [
+            (guild_id, existing_game) for guild_id, existing_game
+            in sql_active_game.get_incomplete_games(self.engine)
+            if self.is_guild_on_shard(guild_id)
+        ]
 
         LOGGER.info(
             "Found %d incomplete games that need to be resumed",
             len(incomplete_games))
 
+        # Games in hot state mode only write their progress to Redis, so
+        # prefer that over the state postgres had when the game started.
+        if self.hot_state_ttl is not None:
+            hot_games = await asyncio.gather(*(
+                self.get_hot_game_state(guild_id, existing_game["channel_id"])
+                for guild_id, existing_game in incomplete_games
+            ))
+            incomplete_games = [
+                (guild_id, hot_game or existing_game)
+                for (guild_id, existing_game), hot_game
+                in zip(incomplete_games, hot_games)
+            ]
+
         for guild_id, existing_game in incomplete_games:
             saved_game = GameState(
                 self.engine,
                 guild_id,
                 existing_game=existing_game,
-                save_to_db=True)
-            self.active_games[guild_id] = saved_game
+                save_to_db=True,
+                save_progress=self.hot_state_ttl is None)
+            self.active_games[saved_game.key] = saved_game
+            await self.save_hot_game_state(saved_game)
 
             # Resume the game if both the guild and the channel the game was
             # being played in both still exist, and either could have been
-            # deleted in-between the shard being stopped and resumed.
+            # deleted in-between the shard being stopped and resumed. Games
+            # that can't be resumed are archived by the orphan reaper.
 
             guild = self.get_guild(guild_id)
             if not guild:
@@ -73,7 +121,61 @@ class GameMixin():
             if not channel:
                 continue
 
-            asyncio.ensure_future(self.ask_question(channel, saved_game))
+            self.resume_game(channel, saved_game)
+
+    def resume_game(self, channel: TextChannel, game_state: GameState):
+        """Continues a saved game with the time it had left.
+
+        Questions that were asked before the game was saved aren't asked
+        again, their answer is revealed once their remaining time runs out.
+
+        :param c channel:
+        :param GameState game_state:
+        :type c: discord.channel.TextChannel
+        """
+
+        remaining = game_state.get_remaining_time()
+
+        if game_state.waiting:
+            game_state.timer = asyncio.ensure_future(
+                self.__close_question_later(channel, game_state, remaining))
+        else:
+            self.schedule_question(channel, game_state, remaining)
+
+    async def checkpoint_games(self):
+        """Saves every active game along with its question timer, then stops
+        playing them so they can be resumed by the next worker.
+
+        Games are taken out of play before they're saved, so pending timers
+        and answers can't change them after they're saved.
+        """
+
+        game_states = list(self.active_games.values())
+        self.active_games.clear()
+
+        if not game_states:
+            return
+
+        LOGGER.info("Checkpointing %d active games", len(game_states))
+
+        # Completed games were already moved into the game history and are
+        # only waiting for their cleanup, so saving them would bring their
+        # row back.
+        live_game_states = [
+            game_state for game_state in game_states
+            if not game_state.complete
+        ]
+        if live_game_states:
+            await self.loop.run_in_executor(
+                None, sql_active_game.save_game_states, self.engine,
+                live_game_states)
+
+        # Hot state is preferred on resume, so it needs the timers too.
+        if self.hot_state_ttl is not None:
+            await asyncio.gather(*(
+                self.save_hot_game_state(game_state, progress_only=True)
+                for game_state in game_states
+            ))
 
     async def start_game(self, guild: Guild, channel: TextChannel):
         """Starts a new trivia game.
@@ -85,57 +187,396 @@ class GameMixin():
         """
 
         new_game = self.create_game(guild.id, channel.id)
+        await self.save_hot_game_state(new_game)
+        self.schedule_question(channel, new_game, SHORT_WAIT_SECS)
 
-        await asyncio.sleep(SHORT_WAIT_SECS)
-        await self.ask_question(channel, new_game)
-
-    async def stop_game(self, guild_id: int):
-        """Stops a game in progress for a guild.
+    async def stop_game(self, guild_id: int, channel_id: int):
+        """Stops the game in progress in a channel.
 
         :param int guild_id:
+        :param int channel_id:
         """
 
-        game_state = self.get_game(guild_id)
+        game_state = self.get_game(guild_id, channel_id)
         game_state.stop_game()
 
-        self.__cleanup_game(guild_id)
+        self.__cleanup_game(game_state)
+        await self.save_hot_game_state(game_state)
+
+    async def get_hot_game_state(self, guild_id: int, channel_id: int) -> dict:
+        """Gets a channel's game state from Redis in hot state mode.
+
+        :param int guild_id:
+        :param int channel_id:
+        :rtype: dict
+        :return: The game state, or None if it isn't available.
+        """
+
+        try:
+            return await hot_state.get_game_state(
+                self.redis, guild_id, channel_id)
+        except RedisUnavailable as exc:
+            LOGGER.warning(
+                "Unable to load game in guild %s channel %s from Redis: %s",
+                guild_id, channel_id, exc)
+            return None
+
+    async def save_hot_game_state(self, game_state, progress_only=False):
+        """Saves a game state to Redis in hot state mode.
+
+        Completed and stopped games were already moved into the game
+        history, so their hash is deleted instead. If Redis is unavailable,
+        progress is saved to postgres instead so crash recovery still works,
+        and the next save to Redis writes the whole state again.
+
+        :param GameState game_state:
+        :param bool progress_only: Only save the fields changed by playing.
+        """
+
+        if self.hot_state_ttl is None:
+            return
+
+        key = game_state.key
+
+        try:
+            if game_state.complete:
+                await hot_state.clear_game_state(self.redis, *key)
+            else:
+                await hot_state.save_game_state(
+                    self.redis,
+                    game_state,
+                    self.hot_state_ttl,
+                    progress_only=(
+                        progress_only and key not in self.stale_hot_games))
+            self.stale_hot_games.discard(key)
+        except RedisUnavailable as exc:
+            LOGGER.warning(
+                "Unable to save game in guild %s channel %s to Redis: %s",
+                *key, exc)
+
+            if not game_state.complete:
+                self.stale_hot_games.add(key)
+                sql_active_game.save_game_state(self.engine, game_state)
+
+    async def reload_question_bank(self) -> tuple:
+        """Loads the question bank again and swaps it in for new games.
+
+        The bank is loaded and validated in the executor, so games keep being
+        played while it loads. Games in progress keep their questions.
+
+        :rtype: tuple
+        :return: The bank in use and whether it changed.
+        :raises ValueError: If the new bank isn't valid.
+        """
+
+        bank = await self.loop.run_in_executor(
+            None, question_bank.load_questions_file, QUESTIONS_PATH)
+
+        current_bank = get_question_bank()
+        if bank.version == current_bank.version:
+            LOGGER.info(
+                "Question bank is already at version %s", bank.version)
+            return current_bank, False
+
+        set_question_bank(bank)
+        LOGGER.info(
+            "Reloaded question bank from version %s to %s (%d questions)",
+            current_bank.version, bank.version, len(bank))
+
+        return bank, True
+
+    async def maintain_game_history(self):
+        """Periodically creates upcoming history partitions and drops expired
+        ones, for as long as the bot is running.
+        """
+
+        while True:
+            try:
+                created, dropped = await self.loop.run_in_executor(
+                    None,
+                    sql_game_history.maintain_partitions,
+                    self.engine,
+                    datetime.datetime.now(datetime.timezone.utc).date(),
+                    self.history_retention_months)
+
+                for month in created:
+                    LOGGER.info("Created game history partition for %s",
+                                month.strftime("%Y-%m"))
+                for month in dropped:
+                    LOGGER.info("Dropped game history partition for %s",
+                                month.strftime("%Y-%m"))
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Failed to maintain game history partitions")
+
+            await asyncio.sleep(HISTORY_MAINTENANCE_SECS)
+
+    def is_guild_on_shard(self, guild_id: int) -> bool:
+        """Checks if a guild's events are received by this worker.
+
+        :param int guild_id:
+        :rtype: bool
+        :return:
+        """
+
+        if not self.shard_count or self.shard_count <= 1:
+            return True
+
+        shard_id = (guild_id >> 22) % self.shard_count
+
+        # Autosharded clients run every shard unless they're given a list.
+        shard_ids = getattr(self, "shard_ids", None)
+        if shard_ids is not None:
+            return shard_id in shard_ids
+
+        return self.shard_id is None or shard_id == self.shard_id
+
+    def find_orphaned_games(self) -> dict:
+        """Finds active games that can't finish on their own.
+
+        A game is orphaned if its channel is gone, if nothing is scheduled
+        to ask or close its next question (the task failed, or the game was
+        never resumed), or if its question timer ran out long ago.
+
+        :rtype: dict
+        :return: Game states and the reason they're orphaned, keyed by game.
+        """
+
+        now = time.time()
+        orphans = {}
+
+        for key, game_state in self.active_games.items():
+            guild = self.get_guild(game_state.guild_id)
+            channel = guild.get_channel(game_state.channel_id) if guild else None
+
+            if channel is None:
+                reason = ORPHAN_MISSING_CHANNEL
+            elif game_state.timer is None or game_state.timer.done():
+                reason = ORPHAN_NO_TIMER
+            elif (game_state.deadline is not None
+                  and game_state.deadline < now - ORPHAN_GRACE_SECS):
+                reason = ORPHAN_PAST_DEADLINE
+            else:
+                continue
+
+            orphans[key] = (game_state, reason)
+
+        return orphans
+
+    async def reap_orphans(self, suspects: dict) -> dict:
+        """Archives games that were orphaned on this pass and the last one.
+
+        Games are only reaped once they've been orphaned for a whole reaper
+        interval, as a game is briefly without a timer while it's started.
+        Reaped games are archived as stopped without updating scoreboards,
+        the same as stopping them with the stop command.
+
+        :param dict suspects: Session IDs of the games that were orphaned on
+            the previous pass, keyed by game.
+        :rtype: dict
+        :return: Session IDs of the games orphaned on this pass that weren't
+            reaped, to pass to the next one.
+        """
+
+        orphans = self.find_orphaned_games()
+        metrics.ORPHANED_GAMES.set(len(orphans))
+
+        reaped = []
+        next_suspects = {}
+
+        for key, (game_state, reason) in orphans.items():
+            if suspects.get(key) != game_state.session_id:
+                next_suspects[key] = game_state.session_id
+                continue
+
+            reaped.append(game_state)
+            metrics.REAPED_GAMES.labels(reason).inc()
+            LOGGER.warning(
+                "Reaping orphaned game in guild %s channel %s (%s)",
+                *key, reason)
+
+            # Take the game out of play first so a late timer can't touch it.
+            self.__cleanup_game(game_state)
+            game_state.complete = True
+            if game_state.timer is not None:
+                game_state.timer.cancel()
+
+        if reaped:
+            await self.loop.run_in_executor(
+                None, sql_game_history.archive_games, self.engine, reaped)
+            await asyncio.gather(*(
+                self.save_hot_game_state(game_state)
+                for game_state in reaped
+            ))
+
+        return next_suspects
+
+    async def reap_orphaned_games(self):
+        """Periodically archives orphaned games, for as long as the bot is
+        running.
+        """
+
+        suspects = {}
+
+        while True:
+            await asyncio.sleep(ORPHAN_REAP_SECS)
+
+            try:
+                suspects = await self.reap_orphans(suspects)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Failed to reap orphaned games")
 
     async def process_answer(self, message):
         """Called when an answer is received from a user.
 
+        Answers are gathered per channel for a few milliseconds and checked
+        together, so a burst of guesses is scored in one pass instead of one
+        handler at a time.
+
         :param m message:
         :type m: discord.message.Message
         """
 
-        game_state = self.get_game(message.guild.id)
+        game_state = self.get_game(message.guild.id, message.channel.id)
 
         # Don't process the answer if the bot is currently in-between asking
         # questions. Without this multiple people can get the answer right
         # rather than just the first person.
         if not game_state.waiting:
-            LOGGER.debug("Ignoring answer: %s", message.content)
+            MESSAGE_LOGGER.debug("Ignoring answer: %s", message.content)
             return
 
-        if game_state.check_answer(message.content):
-            LOGGER.debug("Correct answer received: %s", message.content)
+        channel_id = message.channel.id
+        batch = self.answer_batches.get(channel_id)
 
-            user_id = message.author.id
-            question = game_state.get_question()
+        if batch is None:
+            batch = self.answer_batches[channel_id] = []
+            asyncio.ensure_future(self.__evaluate_answers_later(
+                message.channel, game_state, game_state.current_question))
 
-            game_state.waiting = False
-            game_state.bump_score(user_id)
-            game_state.step()
+        batch.append(message)
 
-            await message.channel.send(
-                "Correct, <@!{user_id}>! The answer is \"{answer}\".".format(
-                    user_id=user_id,
-                    answer=question["answers"][0],
-                ),
-            )
-            await asyncio.sleep(SHORT_WAIT_SECS)
-            await self.ask_question(message.channel, game_state)
-        else:
-            LOGGER.debug("Incorrect answer received: %s", message.content)
+    async def __evaluate_answers_later(
+            self,
+            channel: TextChannel,
+            game_state: GameState,
+            question_index: int):
+        """Waits for a channel's batch of answers to fill then checks it.
+
+        :param c channel:
+        :param GameState game_state:
+        :param int question_index: The question the answers were sent for.
+        :type c: discord.channel.TextChannel
+        """
+
+        try:
+            await asyncio.sleep(ANSWER_BATCH_SECS)
+            messages = self.answer_batches.pop(channel.id)
+            await self.evaluate_answers(
+                channel, game_state, question_index, messages)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception(
+                "Unable to check answers in guild %s", channel.guild.id)
+
+    async def evaluate_answers(
+            self,
+            channel: TextChannel,
+            game_state: GameState,
+            question_index: int,
+            messages: list):
+        """Awards the question to the earliest correct answer in a batch.
+
+        :param c channel:
+        :param GameState game_state:
+        :param int question_index: The question the answers were sent for.
+        :param list messages: Answer messages in the order they arrived.
+        :type c: discord.channel.TextChannel
+        """
+
+        # The question may have timed out or the game may have been stopped
+        # (or checkpointed) while the batch was filling.
+        if (not game_state.waiting
+                or game_state.current_question != question_index
+                or not self.is_same_game_in_progress(game_state)):
+            for message in messages:
+                MESSAGE_LOGGER.debug("Ignoring answer: %s", message.content)
+            return
+
+        correct_index = game_state.check_answers(
+            [message.content for message in messages])
+
+        for message in messages[:correct_index]:
+            MESSAGE_LOGGER.debug(
+                "Incorrect answer received: %s", message.content)
+
+        if correct_index is None:
+            return
+
+        message = messages[correct_index]
+        LOGGER.debug("Correct answer received: %s", message.content)
+
+        user_id = message.author.id
+        question = game_state.get_question()
+
+        # step() saves the game, so the timer it's saved with has to be the
+        # one for the next question rather than the one that just ended.
+        game_state.waiting = False
+        game_state.set_deadline(SHORT_WAIT_SECS)
+        game_state.bump_score(user_id)
+        game_state.step()
+        await self.save_hot_game_state(game_state, progress_only=True)
+
+        await channel.send(
+            "Correct, <@!{user_id}>! The answer is \"{answer}\".".format(
+                user_id=user_id,
+                answer=question["answers"][0],
+            ),
+        )
+        self.schedule_question(channel, game_state, SHORT_WAIT_SECS)
+
+    def schedule_question(
+            self,
+            channel: TextChannel,
+            game_state: GameState,
+            delay: float) -> asyncio.Task:
+        """Asks the next question after a delay without blocking the caller.
+
+        Questions are asked from their own task so the message or command
+        handler that triggered them can return right away, rather than staying
+        suspended for the rest of the game.
+
+        :param c channel:
+        :param GameState game_state:
+        :param float delay:
+        :type c: discord.channel.TextChannel
+        :rtype: asyncio.Task
+        :return:
+        """
+
+        game_state.set_deadline(delay)
+        game_state.timer = asyncio.ensure_future(
+            self.__ask_question_later(channel, game_state, delay))
+
+        return game_state.timer
+
+    async def __ask_question_later(self, channel, game_state, delay):
+        """Waits for a delay then asks the next question.
+
+        :param c channel:
+        :param GameState game_state:
+        :param float delay:
+        :type c: discord.channel.TextChannel
+        """
+
+        try:
+            await asyncio.sleep(delay)
+            await self.ask_question(channel, game_state)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception(
+                "Unable to ask question in guild %s", channel.guild.id)
 
     async def ask_question(self, channel, game_state):
         """Asks a trivia question in a Discord channel.
@@ -145,15 +586,13 @@ class GameMixin():
         :type c: discord.channel.Channel
         """
 
-        guild_id = channel.guild.id
-
         # This prevents questions from being asked after a game was ended
         # through the stop command before it ended naturally.
         #
         # This check also covers the rare edge-case where a game is stopped and
         # started again within the 10 second window between questions so that
         # the trivia game doesn't duplicate itself.
-        if not self.is_same_game_in_progress(guild_id, game_state):
+        if not self.is_same_game_in_progress(game_state):
             return
 
         if game_state.complete:
@@ -163,27 +602,69 @@ class GameMixin():
         question = game_state.get_question()
         last_correct_answers_total = game_state.correct_answers_total
         game_state.waiting = True
+        game_state.set_deadline(LONG_WAIT_SECS)
 
         await channel.send(question["text"])
-        await asyncio.sleep(LONG_WAIT_SECS)
+        await self.close_question(
+            channel, game_state, LONG_WAIT_SECS, last_correct_answers_total)
+
+    async def __close_question_later(self, channel, game_state, delay):
+        """Waits out the rest of a resumed question's time.
+
+        :param c channel:
+        :param GameState game_state:
+        :param float delay:
+        :type c: discord.channel.TextChannel
+        """
+
+        try:
+            await self.close_question(
+                channel, game_state, delay, game_state.correct_answers_total)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception(
+                "Unable to close question in guild %s", channel.guild.id)
+
+    async def close_question(
+            self,
+            channel: TextChannel,
+            game_state: GameState,
+            delay: float,
+            last_correct_answers_total: int):
+        """Reveals the answer once a question's time runs out, unless it was
+        answered correctly in the meantime.
+
+        :param c channel:
+        :param GameState game_state:
+        :param float delay:
+        :param int last_correct_answers_total: The game's correct answer
+            total from before the question was asked.
+        :type c: discord.channel.TextChannel
+        """
+
+        question = game_state.get_question()
+
+        await asyncio.sleep(delay)
 
         # Check again as it can happen here too.
-        if not self.is_same_game_in_progress(guild_id, game_state):
+        if not self.is_same_game_in_progress(game_state):
             return
 
         # If the correct answer total was not incremented, that means that no
         # one answered the question correctly. Give them the answer if so.
         if last_correct_answers_total == game_state.correct_answers_total:
             game_state.waiting = False
+            game_state.set_deadline(SHORT_WAIT_SECS)
             game_state.step()
+            await self.save_hot_game_state(game_state, progress_only=True)
 
             await channel.send(
                 "The correct answer was \"{answer}\".".format(
                     answer=question["answers"][0],
                 ),
             )
-            await asyncio.sleep(SHORT_WAIT_SECS)
-            await self.ask_question(channel, game_state)
+            self.schedule_question(channel, game_state, SHORT_WAIT_SECS)
 
     async def complete_game(self, channel, game_state):
         """Outputs the scoreboard and announces the winner of a game.
@@ -194,7 +675,7 @@ class GameMixin():
         """
 
         guild_id = channel.guild.id
-        self.__cleanup_game(guild_id)
+        self.__cleanup_game(game_state)
 
         score_fmt = "{emoji} <@!{user_id}> - {score} point{suffix}\n"
         scores = list(game_state.scores.items())
@@ -214,12 +695,6 @@ class GameMixin():
         ties = 0
         scoreboard = ""
 
-        guild_scoreboard = sql_scoreboard.get_scoreboard(self.engine, guild_id)
-        if not guild_scoreboard:
-            guild_scoreboard = {}
-        else:
-            guild_scoreboard = guild_scoreboard[0]
-
         for index, data in enumerate(scores):
             user_id, score = data
             if index > 0 and score >= highest_score:
@@ -232,13 +707,26 @@ class GameMixin():
                 suffix="s" if score != 0 else "",
             )
 
-            # Update the guild's scoreboard score for the current user. The
-            # score may not exist so default to zero.
-            guild_member_score = guild_scoreboard.get(str(user_id), 0)
-            guild_member_score += score
-            guild_scoreboard[str(user_id)] = guild_member_score
-
-        sql_scoreboard.save_scoreboard(self.engine, guild_id, guild_scoreboard)
+        # Update the guild's scoreboard, its daily rollups and the global
+        # scores on one connection and transaction.
+        with repository.transaction(self.engine) as conn:
+            guild_scoreboard = sql_scoreboard.get_scoreboard(conn, guild_id)
+            if not guild_scoreboard:
+                guild_scoreboard = {}
+            else:
+                guild_scoreboard = guild_scoreboard[0]
+
+            # Update the guild's scoreboard score for each user. The score may
+            # not exist so default to zero.
+            for user_id, score in scores:
+                guild_member_score = guild_scoreboard.get(str(user_id), 0)
+                guild_member_score += score
+                guild_scoreboard[str(user_id)] = guild_member_score
+
+            sql_scoreboard.save_scoreboard(conn, guild_id, guild_scoreboard)
+            sql_daily_score.add_daily_scores(
+                conn, guild_id, game_state.scores)
+            sql_global_score.add_scores(conn, game_state.scores)
 
         if ties == 0:
             await channel.send(
@@ -255,15 +743,16 @@ class GameMixin():
                 .format(str(ties + 1), scoreboard)
             )
 
-    def get_game(self, guild_id: int) -> GameState:
-        """Retrieves a guild's game state from memory.
+    def get_game(self, guild_id: int, channel_id: int) -> GameState:
+        """Retrieves a channel's game state from memory.
 
         :param int guild_id:
+        :param int channel_id:
         :rtype: GameState
         :return:
         """
 
-        return self.active_games[guild_id]
+        return self.active_games[(guild_id, channel_id)]
 
     def create_game(self, guild_id: int, channel_id: int) -> GameState:
         """Creates a new game state.
@@ -278,35 +767,35 @@ class GameMixin():
             self.engine,
             guild_id,
             channel_id=channel_id,
-            save_to_db=True)
+            save_to_db=True,
+            save_progress=self.hot_state_ttl is None)
 
-        self.active_games[guild_id] = new_game
+        self.active_games[new_game.key] = new_game
 
         return new_game
 
-    def is_game_in_progress(self, guild_id: int) -> bool:
-        """Checks if a game is in progress for a guild.
+    def is_game_in_progress(self, guild_id: int, channel_id: int) -> bool:
+        """Checks if a game is in progress in a channel.
 
         :param int guild_id:
+        :param int channel_id:
         :rtype: bool
         :return:
         """
 
-        return guild_id in self.active_games
+        return (guild_id, channel_id) in self.active_games
 
-    def is_same_game_in_progress(
-            self,
-            guild_id: int,
-            game_state: GameState) -> bool:
+    def is_same_game_in_progress(self, game_state: GameState) -> bool:
         """Checks if the game of the specified game state is running.
 
-        :param int guild_id:
         :param GameState game_state:
         :rtype: bool
         :return:
         """
 
+        active_game = self.active_games.get(game_state.key)
+
         return (
-            self.is_game_in_progress(guild_id)
-            and self.get_game(guild_id).uuid == game_state.uuid
+            active_game is not None
+            and active_game.session_id == game_state.session_id
         )
@@ -16,22 +16,92 @@
 
 """Contains logic for mutating game states."""
 
-import copy
-import random
-import uuid
+import contextlib
+import itertools
+import time
+
+import numpy as np
 
 from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import Connectable
 
+import lorewalker_cho.question_bank as question_bank
 import lorewalker_cho.utils as utils
 import lorewalker_cho.sql.active_game as sql_active_game
+import lorewalker_cho.sql.game_history as sql_game_history
+import lorewalker_cho.sql.rotation as sql_rotation
+
+from lorewalker_cho.sql import repository
 
 from lorewalker_cho.data.questions import DEFAULT_QUESTIONS
+from lorewalker_cho.rotation import QuestionRotation
 
 CURRENT_REVISION = 0
 
+# Replaced as a whole when the bank is reloaded. Games reference the questions
+# they were started with rather than the bank, so they keep playing those and
+# the previous bank is freed once the last of them finishes.
+QUESTION_BANK = question_bank.load_questions(DEFAULT_QUESTIONS)
+
+# Identifies each GameState object, so a stale game's tasks can tell that the
+# game they belong to was replaced.
+SESSION_IDS = itertools.count(1)
+
+# Below this many guess and answer pairs, numpy's per-call overhead costs more
+# than checking each guess one at a time.
+VECTORIZE_MIN_PAIRS = 300
+MAX_VECTORIZED_ANSWER_LEN = 63
+
+
+def get_question_bank() -> question_bank.QuestionBank:
+    """Gets the question bank new games draw their questions from.
+
+    :rtype: question_bank.QuestionBank
+    :return:
+    """
+
+    return QUESTION_BANK
+
+
+def set_question_bank(bank: question_bank.QuestionBank):
+    """Swaps in the question bank that new games draw their questions from.
+
+    Answer keys cached for the previous bank are dropped, games still playing
+    its questions compute theirs again as they're asked.
+
+    :param question_bank.QuestionBank bank:
+    """
+
+    global QUESTION_BANK  # pylint: disable=global-statement
+    QUESTION_BANK = bank
+    question_bank.get_answer_keys.cache_clear()
+
 
 class GameState():
-    """Python class representing a Cho game state."""
+    """Python class representing a Cho game state.
+
+    Thousands of these can be alive at once, so they're slotted, reference
+    questions in the shared bank instead of copying them and key scores by
+    integer user ID. The string keyed shape that's stored in postgres is only
+    built by serialize.
+    """
+
+    __slots__ = (
+        "engine",
+        "guild_id",
+        "save_to_db",
+        "save_progress",
+        "questions",
+        "current_question",
+        "complete",
+        "scores",
+        "channel_id",
+        "session_id",
+        "correct_answers_total",
+        "waiting",
+        "deadline",
+        "timer",
+    )
 
     def __init__(
             self,
@@ -39,7 +109,8 @@ class GameState():
             guild_id: int,
             channel_id: int = None,
             existing_game: dict = None,
-            save_to_db=False):
+            save_to_db=False,
+            save_progress=True):
         """Converts a game state dict into an object.
 
         :param e engine:
@@ -47,54 +118,107 @@ class GameState():
         :param int channel_id:
         :param dict existing_game:
         :param bool save_to_db:
+        :param bool save_progress: Save to the database after every question
+            rather than only when the game is started, stopped or completed.
         :type e: sqlalchemy.engine.Engine
         """
 
         self.engine = engine
         self.guild_id = guild_id
         self.save_to_db = save_to_db
-
-        if existing_game:
-            if CURRENT_REVISION != existing_game["revision"]:
-                raise ValueError("GameState revision mismatch.")
-
-            self.revision = CURRENT_REVISION
-            self.questions = existing_game["questions"]
-            self.current_question = existing_game["current_question"]
-            self.complete = existing_game["complete"]
-            self.scores = existing_game["scores"]
-            self.channel_id = existing_game["channel_id"]
-        else:
-            self.revision = CURRENT_REVISION
-            self.questions = self.__select_questions(DEFAULT_QUESTIONS)
-            self.current_question = 0
-            self.complete = False
-            self.scores = {}
-
-            if channel_id is not None:
-                self.channel_id = channel_id
+        self.save_progress = save_progress
+
+        with self.__transaction() as conn:
+            if existing_game:
+                if CURRENT_REVISION != existing_game["revision"]:
+                    raise ValueError("GameState revision mismatch.")
+
+                self.questions = [
+                    QUESTION_BANK.intern(question)
+                    for question in existing_game["questions"]
+                ]
+                self.current_question = existing_game["current_question"]
+                self.complete = existing_game["complete"]
+                self.scores = {
+                    int(user_id): score
+                    for user_id, score in existing_game["scores"].items()
+                }
+                self.channel_id = existing_game["channel_id"]
+                self.waiting = existing_game.get("waiting", False)
+                self.deadline = existing_game.get("deadline")
             else:
-                raise TypeError("Field channel_id is required for GameState.")
-
-        self.uuid = uuid.uuid4()
-        self.correct_answers_total = 0
-        self.waiting = False
+                self.questions = self.__select_questions(
+                    conn, QUESTION_BANK.questions)
+                self.current_question = 0
+                self.complete = False
+                self.scores = {}
+                self.waiting = False
+                self.deadline = None
+
+                if channel_id is not None:
+                    self.channel_id = channel_id
+                else:
+                    raise TypeError(
+                        "Field channel_id is required for GameState.")
+
+            self.session_id = next(SESSION_IDS)
+            self.correct_answers_total = 0
+
+            # The task that asks or closes the current question.
+            self.timer = None
+
+            if self.save_to_db:
+                sql_active_game.save_game_state(conn, self)
+
+    def __transaction(self):
+        """Opens a transaction when the game state is persisted.
+
+        Starting a game reads and advances the guild's rotation before saving
+        the new game, so all of it happens on one connection and either
+        commits or rolls back together.
+
+        :rtype: contextlib.AbstractContextManager
+        :return:
+        """
 
         if self.save_to_db:
-            sql_active_game.save_game_state(self.engine, self)
+            return repository.transaction(self.engine)
 
-    @staticmethod
-    def __select_questions(questions: list, count=10) -> list:
-        """Selects a bunch of random questions for a trivia session.
+        return contextlib.nullcontext()
+
+    def __select_questions(
+            self,
+            conn: Connectable,
+            questions: list,
+            count=10) -> list:
+        """Selects the next questions in the guild's rotation for a session.
 
+        Guilds walk through the question bank without repeats. The rotation is
+        only persisted when the game state is, otherwise a fresh rotation is
+        used which behaves like a plain shuffle.
+
+        :param c conn:
         :param list questions:
         :param int count:
+        :type c: sqlalchemy.engine.interfaces.Connectable
         """
 
-        cloned_questions = copy.deepcopy(questions)
-        random.shuffle(cloned_questions)
+        rotation = None
+
+        if self.save_to_db:
+            saved_rotation = sql_rotation.get_rotation(conn, self.guild_id)
+            if saved_rotation:
+                rotation = QuestionRotation(*saved_rotation)
+
+        if rotation is None:
+            rotation = QuestionRotation()
 
-        return cloned_questions[:count]
+        indices = rotation.draw(len(questions), count)
+
+        if self.save_to_db:
+            sql_rotation.save_rotation(conn, self.guild_id, rotation)
+
+        return [questions[index] for index in indices]
 
     def __complete_game(self):
         """Completes the game and determines the winner."""
@@ -113,24 +237,66 @@ class GameState():
             "questions": self.questions,
             "current_question": self.current_question,
             "complete": self.complete,
-            "scores": self.scores,
+            "scores": {
+                str(user_id): score for user_id, score in self.scores.items()
+            },
             "channel_id": self.channel_id,
+            "waiting": self.waiting,
+            "deadline": self.deadline,
         }
 
+    @property
+    def key(self) -> tuple:
+        """Identifies the game among the active ones, as a guild can run a
+        game in each of its trivia channels.
+
+        :rtype: tuple
+        :return: The guild and channel IDs.
+        """
+
+        return (self.guild_id, self.channel_id)
+
+    def set_deadline(self, delay: float):
+        """Records when the current wait (for the next question to be asked,
+        or for the current one to be answered) runs out.
+
+        The deadline is a wall clock timestamp so that it still holds after
+        the game is resumed by another process.
+
+        :param float delay: Seconds from now.
+        """
+
+        self.deadline = time.time() + delay
+
+    def get_remaining_time(self) -> float:
+        """Gets the seconds left until the deadline, which is zero if it has
+        passed or was never set.
+
+        :rtype: float
+        :return:
+        """
+
+        if self.deadline is None:
+            return 0
+
+        return max(0, self.deadline - time.time())
+
     def stop_game(self):
-        """Stops a game in progress."""
+        """Stops a game in progress and moves it into the game history."""
 
         self.__complete_game()
 
         if self.save_to_db:
-            sql_active_game.save_game_state(self.engine, self)
+            sql_game_history.archive_game(self.engine, self)
 
     def step(self):
         """Advances the game forward to the next question.
 
         This function will check if the game is complete and ensure the
         active game state is saved to the database as it's likely the game
-        state was mutated before this function was called.
+        state was mutated before this function was called. Completed games
+        are moved into the game history instead. Games that don't save
+        progress are only saved once they're complete.
         """
 
         self.current_question += 1
@@ -138,7 +304,12 @@ class GameState():
         if self.current_question >= len(self.questions):
             self.__complete_game()
 
-        if self.save_to_db:
+        if not self.save_to_db:
+            return
+
+        if self.complete:
+            sql_game_history.archive_game(self.engine, self)
+        elif self.save_progress:
             sql_active_game.save_game_state(self.engine, self)
 
     def bump_score(self, user_id: int, amount=1):
@@ -148,18 +319,18 @@ class GameState():
         :param int amount:
         """
 
-        user_score = self.scores.get(str(user_id), 0)
-
-        self.scores[str(user_id)] = user_score + amount
+        self.scores[user_id] = self.scores.get(user_id, 0) + amount
         self.correct_answers_total += 1
 
     def check_answer(self, answer: str, ratio=0.8) -> bool:
         """Checks an answer for correctness.
 
-        Any answers that fall below the given ratio are incorrect, while any
-        that are equal to or above are correct. The ratio is compared to the
-        levenshtein ratio of the answer and the current question's answer.
-        This allows for some degree of misspelling.
+        Answers that share a canonical key with one of the question's answers
+        are correct without any further work. Otherwise any answers that fall
+        below the given ratio are incorrect, while any that are equal to or
+        above are correct. The ratio is compared to the levenshtein ratio of
+        the answer and the current question's answer. This allows for some
+        degree of misspelling.
 
         :param str answer:
         :param float ratio:
@@ -168,14 +339,90 @@ class GameState():
         """
 
         question = self.get_question()
+        answer_keys = question_bank.get_answer_keys(tuple(question["answers"]))
+
+        if question_bank.matches_answer_keys(answer, answer_keys):
+            return True
+
+        return self.__matches_ratio(answer, question["answers"], ratio)
+
+    @staticmethod
+    def __matches_ratio(answer: str, correct_answers: list, ratio: float):
+        """Checks if an answer is close enough to any of the correct answers.
+
+        :param str answer:
+        :param list correct_answers:
+        :param float ratio:
+        :rtype: bool
+        :return:
+        """
+
+        answer_len = len(answer)
+        stripped_len = len(answer.lower().strip())
+
+        for correct_answer in correct_answers:
+            # The distance is at least the difference in (stripped) lengths,
+            # which is often enough to rule out a match without computing it.
+            total_len = answer_len + len(correct_answer)
+            length_gap = abs(
+                stripped_len - len(correct_answer.lower().strip()))
+            if (total_len - length_gap) / total_len < ratio:
+                continue
 
-        for correct_answer in question["answers"]:
             answer_ratio = utils.levenshtein_ratio(answer, correct_answer)
             if answer_ratio >= ratio:
                 return True
 
         return False
 
+    def check_answers(self, answers: list, ratio=0.8) -> int:
+        """Finds the first correct answer out of a batch of answers.
+
+        Every answer is first checked against the question's match keys.
+        Large batches are then scored against every accepted answer at once
+        with the vectorized levenshtein ratio, while small ones are checked
+        in order and stop at the first correct answer.
+
+        :param list answers: Answers in the order they were received.
+        :param float ratio:
+        :rtype: int
+        :return: The index of the first correct answer, or None.
+        """
+
+        correct_answers = self.get_question()["answers"]
+        answer_keys = question_bank.get_answer_keys(tuple(correct_answers))
+
+        # Guesses after the first key match can't be the earliest correct one,
+        # so only the guesses before it need edit distance.
+        for index, answer in enumerate(answers):
+            if question_bank.matches_answer_keys(answer, answer_keys):
+                key_match = index
+                break
+        else:
+            key_match = None
+
+        answers = answers[:key_match]
+        if not answers:
+            return key_match
+
+        vectorize = (
+            len(answers) * len(correct_answers) >= VECTORIZE_MIN_PAIRS
+            and all(len(correct_answer.lower().strip())
+                    <= MAX_VECTORIZED_ANSWER_LEN
+                    for correct_answer in correct_answers)
+        )
+
+        if not vectorize:
+            for index, answer in enumerate(answers):
+                if self.__matches_ratio(answer, correct_answers, ratio):
+                    return index
+            return key_match
+
+        ratios = utils.levenshtein_ratios(answers, correct_answers)
+        correct = np.flatnonzero((ratios >= ratio).any(axis=1))
+
+        return int(correct[0]) if correct.size else key_match
+
     def get_question(self) -> dict:
         """Returns the current question."""
 
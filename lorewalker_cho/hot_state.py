@@ -0,0 +1,125 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains helpers for keeping live game states in Redis.
+
+Each game is a hash with one JSON encoded field per serialized game state
+field, so progress updates only rewrite the fields that change as the game
+is played rather than the whole state including its questions.
+"""
+
+import json
+
+from lorewalker_cho.game_state import GameState
+from lorewalker_cho.redis_client import AsyncRedis
+
+DEFAULT_TTL_SECS = 3600
+
+# Fields a hash needs for its game to be resumed. The question timer is left
+# out as hashes saved before it was recorded don't have it.
+STATE_FIELDS = (
+    "revision",
+    "questions",
+    "current_question",
+    "complete",
+    "scores",
+    "channel_id",
+)
+
+# Fields that change as questions are answered, along with the question
+# timer that's recorded when games are checkpointed.
+PROGRESS_FIELDS = (
+    "current_question",
+    "complete",
+    "scores",
+    "waiting",
+    "deadline",
+)
+
+
+def get_game_key(guild_id: int, channel_id: int) -> str:
+    """Gets the Redis key of a channel's game state hash.
+
+    :param int guild_id:
+    :param int channel_id:
+    :rtype: str
+    :return:
+    """
+
+    return "cho:game:{}:{}".format(guild_id, channel_id)
+
+
+async def save_game_state(
+        redis: AsyncRedis,
+        game_state: GameState,
+        ttl: int,
+        progress_only=False):
+    """Saves a game state to its hash and refreshes the hash's expiry.
+
+    :param r redis:
+    :param GameState game_state:
+    :param int ttl: Seconds until the hash expires if it isn't saved again.
+    :param bool progress_only: Only write the fields that change as the game
+        is played, for games that have already been saved in full.
+    :type r: redis_client.AsyncRedis
+    """
+
+    state = game_state.serialize()
+    if progress_only:
+        state = {field: state[field] for field in PROGRESS_FIELDS}
+
+    fields = {field: json.dumps(value) for field, value in state.items()}
+    await redis.hset_many(
+        get_game_key(*game_state.key), fields, expire=ttl)
+
+
+async def get_game_state(
+        redis: AsyncRedis,
+        guild_id: int,
+        channel_id: int) -> dict:
+    """Gets a saved game state in the same shape as GameState.serialize.
+
+    :param r redis:
+    :param int guild_id:
+    :param int channel_id:
+    :type r: redis_client.AsyncRedis
+    :rtype: dict
+    :return: The game state, or None if there's no complete one saved.
+    """
+
+    fields = await redis.hgetall(get_game_key(guild_id, channel_id))
+    state = {
+        field.decode(): json.loads(value)
+        for field, value in fields.items()
+    }
+
+    # Progress written after the hash expired leaves a partial state.
+    if any(field not in state for field in STATE_FIELDS):
+        return None
+
+    return state
+
+
+async def clear_game_state(redis: AsyncRedis, guild_id: int, channel_id: int):
+    """Deletes a game state once postgres holds its final state.
+
+    :param r redis:
+    :param int guild_id:
+    :param int channel_id:
+    :type r: redis_client.AsyncRedis
+    """
+
+    await redis.delete(get_game_key(guild_id, channel_id))
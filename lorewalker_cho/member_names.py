@@ -0,0 +1,74 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains a bounded cache of member names seen in messages.
+
+Without the members intent discord.py keeps almost no members around, so
+names are remembered from the authors of messages instead. Only the people
+who talk in a guild end up on its scoreboard, so they're the ones whose names
+are needed.
+"""
+
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 10000
+
+
+class MemberNameCache():
+    """Display names of recently seen members, evicting the least recent."""
+
+    __slots__ = ("max_size", "names")
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        """Creates an empty cache.
+
+        :param int max_size: Names to keep, or 0 to keep none.
+        """
+
+        self.max_size = max_size
+        self.names = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def remember(self, guild_id: int, user_id: int, name: str):
+        """Records the name a member was last seen with.
+
+        :param int guild_id:
+        :param int user_id:
+        :param str name:
+        """
+
+        if self.max_size <= 0:
+            return
+
+        key = (guild_id, user_id)
+        self.names[key] = name
+        self.names.move_to_end(key)
+
+        if len(self.names) > self.max_size:
+            self.names.popitem(last=False)
+
+    def get(self, guild_id: int, user_id: int) -> str:
+        """Gets the name a member was last seen with.
+
+        :param int guild_id:
+        :param int user_id:
+        :rtype: str
+        :return: The name, or None if the member hasn't been seen recently.
+        """
+
+        return self.names.get((guild_id, user_id))
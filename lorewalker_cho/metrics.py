@@ -0,0 +1,166 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains the Prometheus metrics exported by the worker."""
+
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from lorewalker_cho.stats import STATS
+
+LOOP_LAG_INTERVAL_SECS = 0.5
+
+ON_MESSAGE_LATENCY = Histogram(
+    "cho_on_message_seconds",
+    "Time spent handling a message received from Discord.")
+COMMAND_LATENCY = Histogram(
+    "cho_command_seconds",
+    "Time spent handling a Cho command.",
+    ["command"])
+DB_QUERY_DURATION = Histogram(
+    "cho_db_query_seconds",
+    "Time spent in a sql helper function, including pool checkout.",
+    ["function"])
+POOL_CHECKOUT_WAIT = Histogram(
+    "cho_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool.",
+    buckets=(.0001, .0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 5))
+POOL_CHECKED_OUT = Gauge(
+    "cho_db_pool_checked_out",
+    "Connections currently checked out of the SQLAlchemy pool.")
+POOL_OVERFLOW = Gauge(
+    "cho_db_pool_overflow",
+    "Connections opened beyond the SQLAlchemy pool size.")
+ACTIVE_GAMES = Gauge(
+    "cho_active_games",
+    "Trivia games currently running on this worker.")
+ORPHANED_GAMES = Gauge(
+    "cho_orphaned_games",
+    "Active games found orphaned on the last reaper pass.")
+REAPED_GAMES = Counter(
+    "cho_reaped_games",
+    "Orphaned games archived by the reaper.",
+    ["reason"])
+CHANNEL_SEND_LATENCY = Histogram(
+    "cho_channel_send_seconds",
+    "Round trip time of sending a message to a Discord channel.")
+LOOP_LAG = Histogram(
+    "cho_event_loop_lag_seconds",
+    "How late the event loop wakes up from a sleep.",
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+
+LOGGER = logging.getLogger("cho")
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports how long checkouts wait for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            POOL_CHECKOUT_WAIT.observe(elapsed)
+            STATS.record_pool_wait(elapsed)
+
+
+def time_coroutine(histogram, name: str = None):
+    """Observes how long a coroutine function takes in a histogram.
+
+    Named coroutines are also recorded as handlers in the runtime stats.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                histogram.observe(elapsed)
+                if name is not None:
+                    STATS.record_handler(name, elapsed)
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def time_command(command: str):
+    """Observes how long a Cho command takes to handle.
+
+    :param str command:
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        COMMAND_LATENCY.labels(command).observe(elapsed)
+        STATS.record_handler("command:" + command, elapsed)
+
+
+async def monitor_loop_lag(interval=LOOP_LAG_INTERVAL_SECS):
+    """Samples event loop lag until cancelled.
+
+    :param float interval:
+    """
+
+    loop = asyncio.get_event_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+
+        lag = max(0.0, loop.time() - start - interval)
+        LOOP_LAG.observe(lag)
+        STATS.record_loop_lag(lag)
+
+
+def start_metrics_server(port: int, engine: Engine, client):
+    """Starts the /metrics HTTP endpoint and registers runtime gauges.
+
+    The server runs in a daemon thread so scrapes never block the event loop.
+
+    :param int port:
+    :param e engine:
+    :param c client:
+    :type e: sqlalchemy.engine.Engine
+    :type c: LorewalkerChoClient
+    """
+
+    POOL_CHECKED_OUT.set_function(engine.pool.checkedout)
+    POOL_OVERFLOW.set_function(lambda: max(0, engine.pool.overflow()))
+    ACTIVE_GAMES.set_function(lambda: len(client.active_games))
+
+    # Track channel.send latency at the HTTP layer, which is the one place
+    # every message the bot sends goes through.
+    client.http.send_message = time_coroutine(CHANNEL_SEND_LATENCY)(
+        client.http.send_message)
+
+    start_http_server(port)
+    LOGGER.info("Serving metrics on port %d", port)
@@ -0,0 +1,272 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains on-demand CPU and memory profiling for a live worker.
+
+The CPU profiler is a sampler: a daemon thread looks at the event loop
+thread's stack every few milliseconds and counts each stack it sees. The loop
+itself isn't instrumented, so it runs at full speed while being profiled.
+Samples are written in the folded format that flamegraph.pl and speedscope
+read.
+
+Memory snapshots use tracemalloc, which is started by the first snapshot and
+slows allocations down until it's stopped. Each snapshot is dumped for offline
+analysis and reported as a diff against the previous one, so repeated
+snapshots under load show what's growing.
+"""
+
+import collections
+import datetime
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+
+DEFAULT_SAMPLE_INTERVAL_SECS = 0.005
+TRACEMALLOC_FRAMES = 5
+TOP_ALLOCATIONS = 25
+
+# The sampler's own stacks would otherwise show up in every diff.
+TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+LOGGER = logging.getLogger("cho")
+
+
+def get_frame_name(frame) -> str:
+    """Gets the name a frame is counted under in folded stacks.
+
+    :param frame:
+    :rtype: str
+    :return:
+    """
+
+    code = frame.f_code
+    return "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+
+
+class StackSampler():
+    """Counts the stacks a thread is seen running at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval=DEFAULT_SAMPLE_INTERVAL_SECS):
+        """Creates a sampler that isn't running yet.
+
+        :param int thread_id: Identifier of the thread to sample.
+        :param float interval: Seconds between samples.
+        """
+
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def __run(self):
+        """Takes samples until the sampler is stopped."""
+
+        while not self.__stopped.wait(self.interval):
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            frame = frames.get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(get_frame_name(frame))
+                frame = frame.f_back
+
+            self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        """Starts sampling in a daemon thread."""
+
+        self.started_at = datetime.datetime.now()
+        self.__thread = threading.Thread(
+            target=self.__run, name="cho-sampler", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stops sampling and waits for the sampling thread to exit."""
+
+        self.__stopped.set()
+        self.__thread.join()
+
+    def write(self, path: str):
+        """Writes the counted stacks in the folded format, most common first.
+
+        :param str path:
+        """
+
+        with open(path, "w", encoding="utf-8") as folded:
+            for stack, count in self.counts.most_common():
+                folded.write("{} {}\n".format(stack, count))
+
+
+class Profiler():
+    """Starts and stops a worker's profilers and writes out their results."""
+
+    def __init__(self, directory: str, prefix: str):
+        """Creates a profiler that writes files to a directory.
+
+        :param str directory:
+        :param str prefix: Start of every file name, to tell workers apart.
+        """
+
+        self.directory = directory
+        self.prefix = prefix
+        self.sampler = None
+        self.previous_snapshot = None
+
+    def __get_path(self, kind: str, extension: str) -> str:
+        """Gets a timestamped path for a profiler output file.
+
+        :param str kind:
+        :param str extension:
+        :rtype: str
+        :return:
+        """
+
+        return os.path.join(self.directory, "{}-{}-{:%Y%m%d-%H%M%S}.{}".format(
+            self.prefix, kind, datetime.datetime.now(), extension))
+
+    def start_cpu(self, interval=DEFAULT_SAMPLE_INTERVAL_SECS):
+        """Starts sampling the calling thread, which runs the event loop.
+
+        :param float interval:
+        """
+
+        if self.sampler is not None:
+            return
+
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self.sampler.start()
+        LOGGER.info("Started CPU sampling every %.1f ms", interval * 1000)
+
+    def stop_cpu(self) -> str:
+        """Stops the CPU sampler and writes out its stacks.
+
+        :rtype: str
+        :return: Path of the folded stacks, or None if it wasn't running.
+        """
+
+        if self.sampler is None:
+            return None
+
+        sampler, self.sampler = self.sampler, None
+        sampler.stop()
+
+        path = self.__get_path("cpu", "folded")
+        sampler.write(path)
+        LOGGER.info(
+            "Wrote %d CPU samples over %s to %s",
+            sampler.samples, datetime.datetime.now() - sampler.started_at,
+            path)
+
+        return path
+
+    def toggle_cpu(self) -> str:
+        """Starts the CPU sampler, or stops it if it's already running.
+
+        :rtype: str
+        :return: Path of the folded stacks if the sampler was stopped.
+        """
+
+        if self.sampler is not None:
+            return self.stop_cpu()
+
+        self.start_cpu()
+        return None
+
+    async def take_memory_snapshot(self, loop) -> str:
+        """Takes a tracemalloc snapshot and reports what changed since the
+        last one.
+
+        The first snapshot starts tracemalloc, so it's only a baseline. Only
+        the snapshot itself is taken on the event loop. Filtering, dumping and
+        comparing it can take seconds on a busy worker, so that's done in the
+        executor.
+
+        :param l loop:
+        :type l: asyncio.AbstractEventLoop
+        :rtype: str
+        :return: Path of the report.
+        """
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.previous_snapshot = None
+            LOGGER.info("Started tracing memory allocations")
+
+        snapshot = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+
+        snapshot, path = await loop.run_in_executor(
+            None, self.__write_memory_report, snapshot, traced, peak)
+
+        self.previous_snapshot = snapshot
+        LOGGER.info("Wrote memory snapshot report to %s", path)
+
+        return path
+
+    def __write_memory_report(self, snapshot, traced: int, peak: int):
+        """Dumps a snapshot and writes a report comparing it to the previous
+        one.
+
+        :param s snapshot:
+        :param int traced: Bytes traced when the snapshot was taken.
+        :param int peak: Peak bytes traced when the snapshot was taken.
+        :type s: tracemalloc.Snapshot
+        :rtype: tuple
+        :return: The filtered snapshot and the path of the report.
+        """
+
+        snapshot = snapshot.filter_traces(TRACEMALLOC_FILTERS)
+        snapshot.dump(self.__get_path("memory", "snapshot"))
+
+        if self.previous_snapshot is not None:
+            stats = snapshot.compare_to(self.previous_snapshot, "lineno")
+            title = "Growth since the previous snapshot"
+        else:
+            stats = snapshot.statistics("lineno")
+            title = "Allocations since tracing started"
+
+        path = self.__get_path("memory", "txt")
+
+        with open(path, "w", encoding="utf-8") as report:
+            report.write("Traced {:.1f} KiB (peak {:.1f} KiB)\n\n".format(
+                traced / 1024, peak / 1024))
+            report.write("{}:\n".format(title))
+            for stat in stats[:TOP_ALLOCATIONS]:
+                report.write("{}\n".format(stat))
+
+        return snapshot, path
+
+    def stop_memory(self):
+        """Stops tracing memory allocations and forgets the last snapshot."""
+
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            LOGGER.info("Stopped tracing memory allocations")
+
+        self.previous_snapshot = None
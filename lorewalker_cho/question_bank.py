@@ -0,0 +1,234 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains the question bank loader and answer match keys."""
+
+import functools
+import hashlib
+import json
+import re
+import runpy
+import string
+import unicodedata
+
+# Guesses are keyed as they arrive, so recently seen ones (spam of the same
+# guess during a burst) are kept around.
+GUESS_KEYS_CACHE_SIZE = 4096
+
+ASCII_PUNCTUATION = str.maketrans("", "", string.punctuation)
+NON_WORD_CHARS = re.compile(r"[^\w\s]|_")
+
+
+def get_words(text: str) -> list:
+    """Splits text into lowercase alphanumeric words without accents.
+
+    Punctuation is dropped rather than treated as a separator, so "Kel'Thuzad"
+    is one word while "Kel Thuzad" is two.
+
+    :param str text:
+    :rtype: list
+    :return:
+    """
+
+    if text.isascii():
+        return text.lower().translate(ASCII_PUNCTUATION).split()
+
+    # Decomposing splits accents off into combining marks, which aren't word
+    # characters so they're dropped along with the punctuation.
+    text = unicodedata.normalize("NFKD", text)
+    return NON_WORD_CHARS.sub("", text.lower()).split()
+
+
+@functools.lru_cache(maxsize=GUESS_KEYS_CACHE_SIZE)
+def get_keys(text: str) -> tuple:
+    """Gets the keys that an answer or a guess is accepted by.
+
+    The only key is the canonical one, which ignores case, accents, spacing
+    and punctuation. Phonetic keys aren't used as unrelated names share them
+    too often ("Draenei" and "Tauren" are both "TRN"), so near misses are
+    left to edit distance.
+
+    :param str text:
+    :rtype: tuple
+    :return: Keys tagged with their kind.
+    """
+
+    return (("canonical", "".join(get_words(text))),)
+
+
+@functools.lru_cache(maxsize=None)
+def get_answer_keys(answers: tuple) -> frozenset:
+    """Gets the keys that accept a question's answers.
+
+    Cached by the answers themselves rather than by question, so games
+    resumed from the database share keys with the loaded bank. Answers only
+    ever come from a bank, and reloading the bank clears the cache, so it's
+    bounded by the size of the banks in use.
+
+    :param tuple answers:
+    :rtype: frozenset
+    :return:
+    """
+
+    keys = set()
+    for answer in answers:
+        keys.update(get_keys(answer))
+
+    keys.discard(("canonical", ""))
+    return frozenset(keys)
+
+
+def matches_answer_keys(guess: str, answer_keys: frozenset) -> bool:
+    """Checks if a guess hashes to one of a question's answer keys.
+
+    :param str guess:
+    :param frozenset answer_keys:
+    :rtype: bool
+    :return:
+    """
+
+    return not answer_keys.isdisjoint(get_keys(guess))
+
+
+def dedupe_answers(answers: list) -> list:
+    """Drops aliases that are already covered by an earlier alias's keys.
+
+    The first answer is always kept as it's the one shown to players.
+
+    :param list answers:
+    :rtype: list
+    :return:
+    """
+
+    kept = []
+    covered = frozenset()
+
+    for answer in answers:
+        answer_keys = get_answer_keys((answer,))
+        if kept and answer_keys <= covered:
+            continue
+
+        kept.append(answer)
+        covered |= answer_keys
+
+    return kept
+
+
+def get_question_key(question: dict) -> tuple:
+    """Gets a key that identifies a question by its text and answers.
+
+    :param dict question:
+    :rtype: tuple
+    :return:
+    """
+
+    return (question["text"], tuple(question["answers"]))
+
+
+class QuestionBank():
+    """A loaded set of questions shared by every game.
+
+    Games reference the bank's question dicts rather than copying them, so
+    they must be treated as read-only.
+    """
+
+    __slots__ = ("questions", "index", "version")
+
+    def __init__(self, questions: list):
+        """Indexes the questions and precomputes their answer keys.
+
+        :param list questions:
+        """
+
+        self.questions = questions
+        self.index = {}
+        self.version = hashlib.sha1(
+            json.dumps(questions, sort_keys=True).encode()).hexdigest()[:12]
+
+        for question in questions:
+            self.index[get_question_key(question)] = question
+            get_answer_keys(tuple(question["answers"]))
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def intern(self, question: dict) -> dict:
+        """Swaps a copy of a question (from a saved game) for the bank's own.
+
+        Questions that are no longer in the bank are returned as they are.
+
+        :param dict question:
+        :rtype: dict
+        :return:
+        """
+
+        return self.index.get(get_question_key(question), question)
+
+
+def load_questions(questions: list) -> QuestionBank:
+    """Loads a question bank, precomputing the match keys for each question.
+
+    :param list questions:
+    :rtype: QuestionBank
+    :return:
+    """
+
+    return QuestionBank(questions)
+
+
+def validate_questions(questions: list):
+    """Checks that questions have the shape games expect.
+
+    :param list questions:
+    :raises ValueError:
+    """
+
+    if not isinstance(questions, list) or not questions:
+        raise ValueError("The question bank must be a non-empty list.")
+
+    for index, question in enumerate(questions):
+        if not isinstance(question, dict):
+            raise ValueError("Question {} isn't a dict.".format(index))
+
+        for field in ("topic", "text"):
+            if not isinstance(question.get(field), str) or not question[field]:
+                raise ValueError(
+                    "Question {} has no {}.".format(index, field))
+
+        answers = question.get("answers")
+        if (not isinstance(answers, list) or not answers
+                or not all(isinstance(answer, str) and answer.strip()
+                           for answer in answers)):
+            raise ValueError(
+                "Question {} has no answers or an empty one.".format(index))
+
+
+def load_questions_file(path: str) -> QuestionBank:
+    """Loads and validates a new question bank from a questions module.
+
+    The module is run on its own rather than imported, so the bank that's
+    already loaded isn't touched.
+
+    :param str path: Path to a module like data/questions.py.
+    :rtype: QuestionBank
+    :return:
+    :raises ValueError: If the module has no valid DEFAULT_QUESTIONS.
+    """
+
+    questions = runpy.run_path(path).get("DEFAULT_QUESTIONS")
+    validate_questions(questions)
+
+    return load_questions(questions)
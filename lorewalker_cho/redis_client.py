@@ -0,0 +1,299 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains the asyncio Redis client used by the bot.
+
+Every call goes through a shared connection pool with a per-call timeout, and
+a circuit breaker stops calling Redis for a while after repeated failures. A
+slow or unreachable Redis then costs callers at most one timeout before they
+start failing fast, instead of stalling the whole shard.
+"""
+
+import asyncio
+import logging
+import time
+
+import aioredis
+
+DEFAULT_TIMEOUT_SECS = 0.5
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT_SECS = 10.0
+
+# Errors that indicate Redis itself is unhealthy, rather than a bad command.
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    aioredis.ConnectionClosedError,
+    aioredis.PoolClosedError,
+)
+
+LOGGER = logging.getLogger("cho")
+
+
+class RedisUnavailable(Exception):
+    """Raised when Redis can't be reached or the circuit breaker is open."""
+
+
+class CircuitBreaker():
+    """Tracks consecutive failures and decides when calls may be attempted.
+
+    The breaker opens after a number of consecutive failures. While open every
+    call fails fast, until the reset timeout passes and a single trial call is
+    let through. The breaker closes again once a call succeeds.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT_SECS):
+        """Initializes a closed circuit breaker.
+
+        :param int failure_threshold:
+        :param float reset_timeout:
+        """
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls are currently being rejected."""
+
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Checks if a call may be attempted right now.
+
+        :rtype: bool
+        :return:
+        """
+
+        if self.opened_at is None:
+            return True
+
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Let a trial call through, and push the next trial out in case
+            # this one hangs until its timeout.
+            self.opened_at = time.monotonic()
+            return True
+
+        return False
+
+    def record_success(self):
+        """Closes the breaker after a successful call."""
+
+        if self.opened_at is not None:
+            LOGGER.info("Redis is reachable again, closing circuit breaker.")
+
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        """Counts a failure, opening the breaker past the threshold."""
+
+        self.failures += 1
+
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                LOGGER.warning(
+                    "Redis failed %d times in a row, opening circuit breaker.",
+                    self.failures)
+            self.opened_at = time.monotonic()
+
+
+class AsyncRedis():
+    """Pooled asyncio Redis client with timeouts and a circuit breaker."""
+
+    def __init__(self, url: str, minsize=1, maxsize=10,
+                 timeout=DEFAULT_TIMEOUT_SECS, breaker: CircuitBreaker = None):
+        """Initializes the client. Connections are opened on first use.
+
+        :param str url:
+        :param int minsize: Connections kept open in the pool.
+        :param int maxsize: Maximum connections in the pool.
+        :param float timeout: Seconds before a call is abandoned.
+        :param CircuitBreaker breaker:
+        """
+
+        self.url = url
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.__pool = None
+        self.__pool_lock = None
+
+    async def __get_pool(self):
+        """Gets the connection pool, creating it if needed.
+
+        :rtype: aioredis.Redis
+        :return:
+        """
+
+        if self.__pool is not None:
+            return self.__pool
+
+        if self.__pool_lock is None:
+            self.__pool_lock = asyncio.Lock()
+
+        async with self.__pool_lock:
+            if self.__pool is None:
+                self.__pool = await aioredis.create_redis_pool(
+                    self.url,
+                    minsize=self.minsize,
+                    maxsize=self.maxsize,
+                    timeout=self.timeout)
+
+        return self.__pool
+
+    async def call(self, method: str, *args, **kwargs):
+        """Runs a Redis command through the pool.
+
+        :param str method: Name of the aioredis command method.
+        :rtype: object
+        :return: The command's reply.
+        :raises RedisUnavailable: If Redis is unreachable or too slow.
+        """
+
+        return await self.__run(
+            method, lambda pool: getattr(pool, method)(*args, **kwargs))
+
+    async def __run(self, name: str, command):
+        """Runs a command against the pool with the timeout and breaker.
+
+        :param str name: Name of the command for error messages.
+        :param callable command: Takes the pool and returns an awaitable.
+        :rtype: object
+        :return: The command's reply.
+        :raises RedisUnavailable: If Redis is unreachable or too slow.
+        """
+
+        if not self.breaker.allow():
+            raise RedisUnavailable("Redis circuit breaker is open.")
+
+        try:
+            pool = await asyncio.wait_for(self.__get_pool(), self.timeout)
+            result = await asyncio.wait_for(command(pool), self.timeout)
+        except CONNECTION_ERRORS as exc:
+            self.breaker.record_failure()
+            raise RedisUnavailable(
+                "Redis {} failed: {!r}".format(name, exc)) from exc
+
+        self.breaker.record_success()
+
+        return result
+
+    async def get(self, key: str) -> bytes:
+        """Gets the value of a key.
+
+        :param str key:
+        :rtype: bytes
+        :return:
+        """
+
+        return await self.call("get", key)
+
+    async def set(self, key: str, value, expire=0):
+        """Sets the value of a key, optionally expiring it.
+
+        :param str key:
+        :param value:
+        :param int expire: Seconds until the key expires, zero for never.
+        """
+
+        return await self.call("set", key, value, expire=expire)
+
+    async def delete(self, *keys: str) -> int:
+        """Deletes keys.
+
+        :param str keys:
+        :rtype: int
+        :return: Number of keys that were deleted.
+        """
+
+        return await self.call("delete", *keys)
+
+    async def hgetall(self, key: str) -> dict:
+        """Gets every field of a hash.
+
+        :param str key:
+        :rtype: dict
+        :return: Field names and values as bytes, empty if there's no hash.
+        """
+
+        return await self.call("hgetall", key)
+
+    async def hset_many(self, key: str, fields: dict, expire=0):
+        """Sets several hash fields and the key's expiry atomically.
+
+        :param str key:
+        :param dict fields:
+        :param int expire: Seconds until the key expires, zero for never.
+        """
+
+        def command(pool):
+            transaction = pool.multi_exec()
+            transaction.hmset_dict(key, fields)
+            if expire:
+                transaction.expire(key, expire)
+            return transaction.execute()
+
+        return await self.__run("hset_many", command)
+
+    async def publish(self, channel: str, message) -> int:
+        """Publishes a message to a pub/sub channel.
+
+        :param str channel:
+        :param message:
+        :rtype: int
+        :return: Number of subscribers that received the message.
+        """
+
+        return await self.call("publish", channel, message)
+
+    async def subscribe(self, channel: str):
+        """Subscribes to a pub/sub channel.
+
+        The subscription uses the pool's dedicated pub/sub connection, and the
+        returned channel stops yielding messages if that connection is lost.
+
+        :param str channel:
+        :rtype: aioredis.Channel
+        :return:
+        """
+
+        channels = await self.call("subscribe", channel)
+        return channels[0]
+
+    async def ping(self) -> float:
+        """Pings Redis.
+
+        :rtype: float
+        :return: Round trip time in seconds.
+        """
+
+        start = time.perf_counter()
+        await self.call("ping")
+
+        return time.perf_counter() - start
+
+    async def close(self):
+        """Closes every connection in the pool."""
+
+        if self.__pool is not None:
+            self.__pool.close()
+            await self.__pool.wait_closed()
+            self.__pool = None
@@ -0,0 +1,138 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains the per-guild question rotation used to avoid repeats."""
+
+import random
+
+FEISTEL_ROUNDS = 4
+MIN_DOMAIN_BITS = 2
+
+MASK_64 = 0xffffffffffffffff
+
+
+def _mix(value: int) -> int:
+    """Scrambles a 64-bit integer (splitmix64 finalizer).
+
+    :param int value:
+    :rtype: int
+    :return:
+    """
+
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & MASK_64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & MASK_64
+    return value ^ (value >> 31)
+
+
+def get_domain_bits(bank_size: int) -> int:
+    """Gets the smallest even bit width that can index the whole bank.
+
+    The width is even so the Feistel network can be split into two equally
+    sized halves. This keeps the domain at most four times the bank size, so
+    cycle walking skips at most three out of every four positions.
+
+    :param int bank_size:
+    :rtype: int
+    :return:
+    """
+
+    bits = max(MIN_DOMAIN_BITS, (bank_size - 1).bit_length())
+    return bits + (bits % 2)
+
+
+class QuestionRotation():
+    """A guild's walk through a pseudo-random permutation of the bank.
+
+    Rather than storing which questions were asked, the rotation only stores a
+    seed and a cursor. The seed keys a Feistel network that permutes every
+    position in a power of two sized domain, and the cursor marks how far the
+    guild has walked through that permutation. Positions that map outside of
+    the bank are skipped (cycle walking), so no question is repeated until the
+    whole domain has been walked and a new round with a new seed begins.
+
+    Questions appended to the bank mid-round are picked up as long as their
+    index fits in the current domain, otherwise they are included once the
+    next round starts.
+    """
+
+    def __init__(self, seed: int = None, cursor: int = 0, domain_bits: int = 0):
+        """Creates a rotation, starting a fresh one if no seed is passed.
+
+        :param int seed:
+        :param int cursor:
+        :param int domain_bits:
+        """
+
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.cursor = cursor
+        self.domain_bits = domain_bits
+
+    def __new_round(self, bank_size: int):
+        """Starts walking a new permutation sized for the current bank.
+
+        :param int bank_size:
+        """
+
+        self.seed = random.getrandbits(63)
+        self.cursor = 0
+        self.domain_bits = get_domain_bits(bank_size)
+
+    def __permute(self, position: int) -> int:
+        """Maps a position in the domain to a question index.
+
+        :param int position:
+        :rtype: int
+        :return:
+        """
+
+        half_bits = self.domain_bits // 2
+        half_mask = (1 << half_bits) - 1
+
+        left = position >> half_bits
+        right = position & half_mask
+
+        for round_index in range(FEISTEL_ROUNDS):
+            round_key = _mix(self.seed + (round_index << 56) + right)
+            left, right = right, left ^ (round_key & half_mask)
+
+        return (left << half_bits) | right
+
+    def draw(self, bank_size: int, count: int) -> list:
+        """Advances the rotation and returns the next question indices.
+
+        :param int bank_size:
+        :param int count:
+        :rtype: list
+        :return:
+        """
+
+        indices = []
+        count = min(count, bank_size)
+
+        while len(indices) < count:
+            if (self.domain_bits == 0
+                    or self.cursor >= (1 << self.domain_bits)):
+                self.__new_round(bank_size)
+
+            index = self.__permute(self.cursor)
+            self.cursor += 1
+
+            # A new round may start in the middle of a draw, so make sure a
+            # question from the previous round isn't asked twice in one game.
+            if index < bank_size and index not in indices:
+                indices.append(index)
+
+        return indices
@@ -19,14 +19,48 @@
 import logging
 import sqlalchemy as sa
 
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, insert
 from sqlalchemy.engine.interfaces import Connectable
 from sqlalchemy.engine.result import ResultProxy
 
-from lorewalker_cho.sql.schema import GUILDS, ACTIVE_GAMES
+from lorewalker_cho.sql import repository
+from lorewalker_cho.sql.instrument import instrumented
+from lorewalker_cho.sql.schema import ACTIVE_GAMES
+
+GET_INCOMPLETE_GAMES = sa.select([
+    ACTIVE_GAMES.c.discord_guild_id,
+    ACTIVE_GAMES.c.game_state,
+]).where(ACTIVE_GAMES.c.game_state['complete'] == "false")
+IS_GAME = sa.and_(
+    ACTIVE_GAMES.c.discord_guild_id == sa.bindparam("guild_id"),
+    ACTIVE_GAMES.c.channel_id == sa.bindparam("channel_id"),
+)
+GAME_KEY = [ACTIVE_GAMES.c.discord_guild_id, ACTIVE_GAMES.c.channel_id]
+
+GET_GAME_STATE = sa.select([ACTIVE_GAMES.c.game_state]) \
+    .where(IS_GAME) \
+    .limit(1)
+SAVE_GAME_STATE = insert(ACTIVE_GAMES)
+SAVE_GAME_STATE = SAVE_GAME_STATE.on_conflict_do_update(
+    index_elements=GAME_KEY,
+    set_={"game_state": SAVE_GAME_STATE.excluded.game_state})
+SAVE_GAME_STATES = insert(ACTIVE_GAMES).from_select(
+    ["discord_guild_id", "channel_id", "game_state"],
+    sa.select([
+        sa.func.unnest(sa.bindparam("guild_ids", type_=ARRAY(sa.BigInteger))),
+        sa.func.unnest(
+            sa.bindparam("channel_ids", type_=ARRAY(sa.BigInteger))),
+        sa.func.unnest(sa.bindparam("game_states", type_=ARRAY(JSONB))),
+    ]))
+SAVE_GAME_STATES = SAVE_GAME_STATES.on_conflict_do_update(
+    index_elements=GAME_KEY,
+    set_={"game_state": SAVE_GAME_STATES.excluded.game_state})
+CLEAR_GAME_STATE = ACTIVE_GAMES.delete(None).where(IS_GAME)
 
 LOGGER = logging.getLogger("cho")
 
 
+@instrumented
 def get_incomplete_games(conn: Connectable) -> list:
     """Queries for games that haven't finished (usually present on restart).
 
@@ -36,35 +70,31 @@ def get_incomplete_games(conn: Connectable) -> list:
     :return:
     """
 
-    query = sa.select([GUILDS.c.discord_guild_id, ACTIVE_GAMES.c.game_state]) \
-        .select_from(
-            sa.join(ACTIVE_GAMES, GUILDS,
-                    ACTIVE_GAMES.c.guild_id == GUILDS.c.id)) \
-        .where(ACTIVE_GAMES.c.game_state['complete'] == "false")
-    return conn.execute(query).fetchall()
+    with repository.connect(conn) as connection:
+        return connection.execute(GET_INCOMPLETE_GAMES).fetchall()
 
 
-def get_game_state(conn: Connectable, guild_id: int) -> tuple:
+@instrumented
+def get_game_state(
+        conn: Connectable,
+        guild_id: int,
+        channel_id: int) -> tuple:
     """Retrieves an existing game state.
 
     :param c conn:
     :param int guild_id:
+    :param int channel_id:
     :type c: sqlalchemy.engine.interfaces.Connectable
     :rtype: tuple
     :return:
     """
 
-    query = sa.select([GUILDS.c.id]) \
-        .where(GUILDS.c.discord_guild_id == guild_id) \
-        .limit(1)
-    guild_id_fkey = conn.execute(query).first()
-
-    query = sa.select([ACTIVE_GAMES.c.game_state]) \
-        .where(ACTIVE_GAMES.c.guild_id == guild_id_fkey[0]) \
-        .limit(1)
-    return conn.execute(query).first()
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            GET_GAME_STATE, guild_id=guild_id, channel_id=channel_id).first()
 
 
+@instrumented
 def save_game_state(conn: Connectable, game_state) -> ResultProxy:
     """Saves a game state to the database.
 
@@ -77,49 +107,50 @@ def save_game_state(conn: Connectable, game_state) -> ResultProxy:
     :return:
     """
 
-    query = sa.select([GUILDS.c.id]) \
-        .where(GUILDS.c.discord_guild_id == game_state.guild_id) \
-        .limit(1)
-    guild_id_fkey = conn.execute(query).first()
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            SAVE_GAME_STATE,
+            discord_guild_id=game_state.guild_id,
+            channel_id=game_state.channel_id,
+            game_state=game_state.serialize())
 
-    query = sa.select([ACTIVE_GAMES.c.id]) \
-        .where(ACTIVE_GAMES.c.guild_id == guild_id_fkey[0]) \
-        .limit(1)
-    existing_game_id = conn.execute(query).first()
 
-    if existing_game_id is not None:
-        LOGGER.debug("Updating existing game state.")
+@instrumented
+def save_game_states(conn: Connectable, game_states: list) -> ResultProxy:
+    """Saves several game states to the database in a single statement.
 
-        query = ACTIVE_GAMES.update(None).values({
-            "game_state": game_state.serialize(),
-        }).where(ACTIVE_GAMES.c.id == existing_game_id[0])
-        return conn.execute(query)
-    else:
-        LOGGER.debug("Creating new game state.")
+    :param c conn:
+    :param list game_states:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :type r: sqlalchemy.engine.result.ResultProxy
+    :rtype: r
+    :return:
+    """
 
-        query = ACTIVE_GAMES.insert(None).values({
-            "guild_id": guild_id_fkey[0],
-            "game_state": game_state.serialize(),
-        })
-        return conn.execute(query)
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            SAVE_GAME_STATES,
+            guild_ids=[game_state.guild_id for game_state in game_states],
+            channel_ids=[game_state.channel_id for game_state in game_states],
+            game_states=[game_state.serialize() for game_state in game_states])
 
 
-def clear_game_state(conn: Connectable, guild_id: int) -> ResultProxy:
+@instrumented
+def clear_game_state(
+        conn: Connectable,
+        guild_id: int,
+        channel_id: int) -> ResultProxy:
     """Removes an existing game state from the database.
 
     :param c conn:
     :param int guild_id:
+    :param int channel_id:
     :type c: sqlalchemy.engine.interfaces.Connectable
     :type r: sqlalchemy.engine.result.ResultProxy
     :rtype: r
     :return:
     """
 
-    query = sa.select([GUILDS.c.id]) \
-        .where(GUILDS.c.discord_guild_id == guild_id) \
-        .limit(1)
-    guild_id_fkey = conn.execute(query).first()
-
-    query = ACTIVE_GAMES.delete(None) \
-        .where(ACTIVE_GAMES.c.guild_id == guild_id_fkey[0])
-    return conn.execute(query)
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            CLEAR_GAME_STATE, guild_id=guild_id, channel_id=channel_id)
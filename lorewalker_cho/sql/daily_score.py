@@ -0,0 +1,155 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains functions for daily score rollups and time windowed scoreboards.
+
+Games add their scores to one row per guild, day and user as they complete.
+Weekly and monthly scoreboards sum a guild's rows since the start of the
+window, which is a range scan of the primary key that reads at most a month
+of rollups no matter how many games were played.
+"""
+
+import datetime
+import logging
+
+import sqlalchemy as sa
+
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine.interfaces import Connectable
+from sqlalchemy.engine.result import ResultProxy
+
+from lorewalker_cho.sql import repository
+from lorewalker_cho.sql.instrument import instrumented
+from lorewalker_cho.sql.schema import DAILY_SCORES
+
+DEFAULT_LIMIT = 10
+
+WINDOW_WEEK = "week"
+WINDOW_MONTH = "month"
+WINDOWS = (WINDOW_WEEK, WINDOW_MONTH)
+
+WINDOW_SCORE = sa.func.sum(DAILY_SCORES.c.score).label("score")
+GET_WINDOW_SCORES = sa.select([
+    DAILY_SCORES.c.discord_user_id,
+    WINDOW_SCORE,
+]).where(sa.and_(
+    DAILY_SCORES.c.discord_guild_id == sa.bindparam("guild_id"),
+    DAILY_SCORES.c.day >= sa.bindparam("since", type_=sa.Date),
+)).group_by(
+    DAILY_SCORES.c.discord_user_id,
+).order_by(
+    WINDOW_SCORE.desc(),
+    DAILY_SCORES.c.discord_user_id,
+).limit(sa.bindparam("limit"))
+
+ADD_DAILY_SCORES = insert(DAILY_SCORES).from_select(
+    ["discord_guild_id", "day", "discord_user_id", "score"],
+    sa.select([
+        sa.bindparam("guild_id", type_=sa.BigInteger),
+        sa.bindparam("day", type_=sa.Date),
+        sa.func.unnest(sa.bindparam("user_ids", type_=ARRAY(sa.BigInteger))),
+        sa.func.unnest(sa.bindparam("scores", type_=ARRAY(sa.Integer))),
+    ]))
+ADD_DAILY_SCORES = ADD_DAILY_SCORES.on_conflict_do_update(
+    index_elements=[
+        DAILY_SCORES.c.discord_guild_id,
+        DAILY_SCORES.c.day,
+        DAILY_SCORES.c.discord_user_id,
+    ],
+    set_={"score": DAILY_SCORES.c.score + ADD_DAILY_SCORES.excluded.score})
+
+LOGGER = logging.getLogger("cho")
+
+
+def get_today() -> datetime.date:
+    """Gets the current UTC day, which rollups are bucketed by.
+
+    :rtype: datetime.date
+    :return:
+    """
+
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def get_window_start(window: str, today: datetime.date) -> datetime.date:
+    """Gets the first day of the week (starting on Monday) or month.
+
+    :param str window: Either WINDOW_WEEK or WINDOW_MONTH.
+    :param datetime.date today:
+    :rtype: datetime.date
+    :return:
+    """
+
+    if window == WINDOW_WEEK:
+        return today - datetime.timedelta(days=today.weekday())
+    if window == WINDOW_MONTH:
+        return today.replace(day=1)
+
+    raise ValueError("Unknown scoreboard window: {}".format(window))
+
+
+@instrumented
+def get_window_scores(
+        conn: Connectable,
+        guild_id: int,
+        window: str,
+        limit=DEFAULT_LIMIT) -> list:
+    """Retrieves a guild's top scores for the current week or month.
+
+    :param c conn:
+    :param int guild_id:
+    :param str window: Either WINDOW_WEEK or WINDOW_MONTH.
+    :param int limit:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :rtype: list
+    :return: User ID and score pairs, highest score first.
+    """
+
+    since = get_window_start(window, get_today())
+
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            GET_WINDOW_SCORES,
+            guild_id=guild_id,
+            since=since,
+            limit=limit).fetchall()
+
+
+@instrumented
+def add_daily_scores(
+        conn: Connectable,
+        guild_id: int,
+        scores: dict) -> ResultProxy:
+    """Adds the scores from a game to today's rollups for the guild.
+
+    :param c conn:
+    :param int guild_id:
+    :param dict scores: Scores keyed by integer user ID.
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :type r: sqlalchemy.engine.result.ResultProxy
+    :rtype: r
+    :return:
+    """
+
+    user_ids = sorted(scores)
+
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            ADD_DAILY_SCORES,
+            guild_id=guild_id,
+            day=get_today(),
+            user_ids=user_ids,
+            scores=[scores[user_id] for user_id in user_ids])
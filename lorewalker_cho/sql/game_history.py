@@ -0,0 +1,359 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains functions for archiving finished games and their partitions.
+
+Finished games are moved out of active_games into game_history, which is
+partitioned by the month they finished in. Partitions are created a few months
+ahead of time and expired ones are dropped whole, which is far cheaper than
+deleting (and vacuuming) old rows one at a time.
+"""
+
+import datetime
+import logging
+
+import sqlalchemy as sa
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine.interfaces import Connectable
+from sqlalchemy.engine.result import ResultProxy
+
+from lorewalker_cho.sql import repository
+from lorewalker_cho.sql.instrument import instrumented
+from lorewalker_cho.sql.schema import ACTIVE_GAMES, GAME_HISTORY
+
+DEFAULT_RETENTION_MONTHS = 12
+PARTITIONS_AHEAD = 2
+
+PARTITION_PREFIX = "game_history_p"
+PARTITION_NAME_FORMAT = PARTITION_PREFIX + "{:%Y%m}"
+
+# Only one worker needs to maintain partitions, the others skip their turn.
+MAINTENANCE_LOCK_ID = 0x63686f01
+
+# Removes the game from active_games and inserts its results into history in
+# a single statement, so a game is never in both tables or in neither.
+MOVED_GAME = ACTIVE_GAMES.delete(None) \
+    .where(sa.and_(
+        ACTIVE_GAMES.c.discord_guild_id == sa.bindparam("guild_id"),
+        ACTIVE_GAMES.c.channel_id == sa.bindparam("channel_id"),
+    )) \
+    .returning(ACTIVE_GAMES.c.discord_guild_id, ACTIVE_GAMES.c.channel_id) \
+    .cte("moved_game")
+ARCHIVE_GAME = GAME_HISTORY.insert(None).from_select(
+    [
+        GAME_HISTORY.c.discord_guild_id,
+        GAME_HISTORY.c.channel_id,
+        GAME_HISTORY.c.stopped,
+        GAME_HISTORY.c.questions_asked,
+        GAME_HISTORY.c.scores,
+    ],
+    sa.select([
+        MOVED_GAME.c.discord_guild_id,
+        MOVED_GAME.c.channel_id,
+        sa.bindparam("stopped", type_=sa.Boolean),
+        sa.bindparam("questions_asked", type_=sa.SmallInteger),
+        sa.bindparam("scores", type_=postgresql.JSONB),
+    ]))
+
+# Batch version of ARCHIVE_GAME, for games that are archived without being
+# played to the end (see GameMixin.reap_orphaned_games).
+REAPED_GAMES = sa.select([
+    sa.func.unnest(sa.bindparam("guild_ids", type_=ARRAY(sa.BigInteger)))
+    .label("guild_id"),
+    sa.func.unnest(sa.bindparam("channel_ids", type_=ARRAY(sa.BigInteger)))
+    .label("channel_id"),
+    sa.func.unnest(sa.bindparam("stopped", type_=ARRAY(sa.Boolean)))
+    .label("stopped"),
+    sa.func.unnest(
+        sa.bindparam("questions_asked", type_=ARRAY(sa.SmallInteger)))
+    .label("questions_asked"),
+    sa.func.unnest(sa.bindparam("scores", type_=ARRAY(postgresql.JSONB)))
+    .label("scores"),
+]).cte("reaped_games")
+IS_REAPED_GAME = sa.and_(
+    ACTIVE_GAMES.c.discord_guild_id == REAPED_GAMES.c.guild_id,
+    ACTIVE_GAMES.c.channel_id == REAPED_GAMES.c.channel_id,
+)
+MOVED_GAMES = ACTIVE_GAMES.delete(None) \
+    .where(IS_REAPED_GAME) \
+    .returning(ACTIVE_GAMES.c.discord_guild_id, ACTIVE_GAMES.c.channel_id) \
+    .cte("moved_games")
+ARCHIVE_GAMES = GAME_HISTORY.insert(None).from_select(
+    [
+        GAME_HISTORY.c.discord_guild_id,
+        GAME_HISTORY.c.channel_id,
+        GAME_HISTORY.c.stopped,
+        GAME_HISTORY.c.questions_asked,
+        GAME_HISTORY.c.scores,
+    ],
+    sa.select([
+        MOVED_GAMES.c.discord_guild_id,
+        MOVED_GAMES.c.channel_id,
+        REAPED_GAMES.c.stopped,
+        REAPED_GAMES.c.questions_asked,
+        REAPED_GAMES.c.scores,
+    ]).select_from(MOVED_GAMES.join(REAPED_GAMES, sa.and_(
+        MOVED_GAMES.c.discord_guild_id == REAPED_GAMES.c.guild_id,
+        MOVED_GAMES.c.channel_id == REAPED_GAMES.c.channel_id,
+    ))))
+
+TRY_MAINTENANCE_LOCK = sa.select([
+    sa.func.pg_try_advisory_xact_lock(sa.bindparam("lock_id")),
+])
+PRUNE_DEFAULT_PARTITION = sa.text(
+    "DELETE FROM game_history_default WHERE finished_at < :oldest_kept")
+GET_PARTITIONS = sa.text(
+    "SELECT child.relname FROM pg_inherits "
+    "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+    "WHERE parent.relname = :table_name")
+
+LOGGER = logging.getLogger("cho")
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    """Gets the first day of the month a number of months away.
+
+    :param datetime.date month:
+    :param int months: Months to add, which may be negative.
+    :rtype: datetime.date
+    :return:
+    """
+
+    month_index = month.year * 12 + month.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def get_partition_name(month: datetime.date) -> str:
+    """Gets the name of the history partition for a month.
+
+    :param datetime.date month:
+    :rtype: str
+    :return:
+    """
+
+    return PARTITION_NAME_FORMAT.format(month)
+
+
+def parse_partition_name(name: str) -> datetime.date:
+    """Gets the month a history partition covers from its name.
+
+    :param str name:
+    :rtype: datetime.date
+    :return: The month, or None if it isn't a monthly partition.
+    """
+
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+
+    try:
+        return datetime.datetime.strptime(
+            name[len(PARTITION_PREFIX):], "%Y%m").date()
+    except ValueError:
+        return None
+
+
+def get_results(game_state) -> dict:
+    """Gets the results of a game that are kept in the game history.
+
+    :param g game_state:
+    :type g: game_state.GameState
+    :rtype: dict
+    :return:
+    """
+
+    return {
+        "stopped": game_state.current_question < len(game_state.questions),
+        "questions_asked": min(
+            game_state.current_question, len(game_state.questions)),
+        "scores": game_state.serialize()["scores"],
+    }
+
+
+@instrumented
+def archive_game(conn: Connectable, game_state) -> ResultProxy:
+    """Moves a finished game from active_games into the game history.
+
+    Only the results are kept, the questions aren't needed once the game is
+    over. Games that were never saved to active_games aren't archived.
+
+    :param c conn:
+    :param g game_state:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :type r: sqlalchemy.engine.result.ResultProxy
+    :type g: game_state.GameState
+    :rtype: r
+    :return:
+    """
+
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            ARCHIVE_GAME,
+            guild_id=game_state.guild_id,
+            channel_id=game_state.channel_id,
+            **get_results(game_state))
+
+
+@instrumented
+def archive_games(conn: Connectable, game_states: list) -> ResultProxy:
+    """Moves many games from active_games into the game history at once.
+
+    :param c conn:
+    :param list game_states:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :type r: sqlalchemy.engine.result.ResultProxy
+    :rtype: r
+    :return:
+    """
+
+    results = [get_results(game_state) for game_state in game_states]
+
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            ARCHIVE_GAMES,
+            guild_ids=[game_state.guild_id for game_state in game_states],
+            channel_ids=[game_state.channel_id for game_state in game_states],
+            stopped=[result["stopped"] for result in results],
+            questions_asked=[
+                result["questions_asked"] for result in results],
+            scores=[result["scores"] for result in results])
+
+
+@instrumented
+def get_partition_months(conn: Connectable) -> list:
+    """Gets the months that have a history partition, oldest first.
+
+    :param c conn:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :rtype: list
+    :return:
+    """
+
+    with repository.connect(conn) as connection:
+        names = connection.execute(
+            GET_PARTITIONS, table_name=GAME_HISTORY.name).fetchall()
+
+    months = (parse_partition_name(name) for name, in names)
+    return sorted(month for month in months if month is not None)
+
+
+@instrumented
+def create_partition(conn: Connectable, month: datetime.date):
+    """Creates the history partition for a month.
+
+    Rows for the month may have already landed in the default partition, so
+    they're moved into the new table before it's attached.
+
+    :param c conn:
+    :param datetime.date month:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    """
+
+    name = get_partition_name(month)
+    bounds = {
+        "start": datetime.datetime.combine(
+            month, datetime.time(), datetime.timezone.utc),
+        "end": datetime.datetime.combine(
+            add_months(month, 1), datetime.time(), datetime.timezone.utc),
+    }
+
+    with repository.transaction(conn) as connection:
+        connection.execute(
+            "CREATE TABLE {name} (LIKE game_history INCLUDING DEFAULTS "
+            "INCLUDING CONSTRAINTS)".format(name=name))
+        connection.execute(
+            sa.text(
+                "WITH moved AS (DELETE FROM game_history_default "
+                "WHERE finished_at >= :start AND finished_at < :end "
+                "RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+                .format(name=name)),
+            **bounds)
+        connection.execute(
+            sa.text(
+                "ALTER TABLE game_history ATTACH PARTITION {name} "
+                "FOR VALUES FROM (:start) TO (:end)".format(name=name)),
+            **bounds)
+
+
+@instrumented
+def drop_partition(conn: Connectable, month: datetime.date):
+    """Drops the history partition for a month along with its games.
+
+    :param c conn:
+    :param datetime.date month:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    """
+
+    with repository.connect(conn) as connection:
+        connection.execute(
+            "DROP TABLE IF EXISTS {}".format(get_partition_name(month)))
+
+
+@instrumented
+def maintain_partitions(
+        conn: Connectable,
+        today: datetime.date,
+        retention_months=DEFAULT_RETENTION_MONTHS) -> tuple:
+    """Creates upcoming history partitions and drops expired ones.
+
+    Partitions are kept for the current month and the given number of
+    months before it. Expired games that landed in the default partition
+    (such as ones archived before their month's partition existed) are
+    deleted. Nothing is done if another worker is already running
+    maintenance.
+
+    :param c conn:
+    :param datetime.date today:
+    :param int retention_months: Months of history to keep, or 0 to keep
+        history forever.
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :rtype: tuple
+    :return: Months that were created and months that were dropped.
+    """
+
+    this_month = today.replace(day=1)
+    created = []
+    dropped = []
+
+    with repository.transaction(conn) as connection:
+        locked = connection.execute(
+            TRY_MAINTENANCE_LOCK, lock_id=MAINTENANCE_LOCK_ID).scalar()
+        if not locked:
+            return created, dropped
+
+        existing = set(get_partition_months(connection))
+
+        for months_ahead in range(PARTITIONS_AHEAD + 1):
+            month = add_months(this_month, months_ahead)
+            if month not in existing:
+                create_partition(connection, month)
+                created.append(month)
+
+        if retention_months:
+            oldest_kept = add_months(this_month, -retention_months)
+            for month in sorted(existing):
+                if month < oldest_kept:
+                    drop_partition(connection, month)
+                    dropped.append(month)
+
+            connection.execute(
+                PRUNE_DEFAULT_PARTITION,
+                oldest_kept=datetime.datetime.combine(
+                    oldest_kept, datetime.time(), datetime.timezone.utc))
+
+    return created, dropped
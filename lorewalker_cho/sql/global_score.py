@@ -0,0 +1,99 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains functions for the global scoreboard in postgres.
+
+Scores are added to each user's total as games complete rather than summed
+from every guild's scoreboard, so reading the top players is an index scan
+that costs the same no matter how many guilds there are.
+"""
+
+import logging
+import sqlalchemy as sa
+
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine.interfaces import Connectable
+from sqlalchemy.engine.result import ResultProxy
+
+from lorewalker_cho.sql import repository
+from lorewalker_cho.sql.instrument import instrumented
+from lorewalker_cho.sql.schema import GLOBAL_SCORES
+
+DEFAULT_LIMIT = 10
+
+# Both orderings match the score index, so it's scanned backwards.
+GET_TOP_SCORES = sa.select([
+    GLOBAL_SCORES.c.discord_user_id,
+    GLOBAL_SCORES.c.score,
+]).order_by(
+    GLOBAL_SCORES.c.score.desc(),
+    GLOBAL_SCORES.c.discord_user_id.desc(),
+).limit(sa.bindparam("limit"))
+
+SCORE_DELTAS = sa.select([
+    sa.func.unnest(
+        sa.bindparam("user_ids", type_=ARRAY(sa.BigInteger))
+    ).label("discord_user_id"),
+    sa.func.unnest(
+        sa.bindparam("scores", type_=ARRAY(sa.BigInteger))
+    ).label("score"),
+])
+ADD_SCORES = insert(GLOBAL_SCORES).from_select(
+    ["discord_user_id", "score"], SCORE_DELTAS)
+ADD_SCORES = ADD_SCORES.on_conflict_do_update(
+    index_elements=[GLOBAL_SCORES.c.discord_user_id],
+    set_={"score": GLOBAL_SCORES.c.score + ADD_SCORES.excluded.score})
+
+LOGGER = logging.getLogger("cho")
+
+
+@instrumented
+def get_top_scores(conn: Connectable, limit=DEFAULT_LIMIT) -> list:
+    """Retrieves the users with the highest scores across all guilds.
+
+    :param c conn:
+    :param int limit:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :rtype: list
+    :return: User ID and score pairs, highest score first.
+    """
+
+    with repository.connect(conn) as connection:
+        return connection.execute(GET_TOP_SCORES, limit=limit).fetchall()
+
+
+@instrumented
+def add_scores(conn: Connectable, scores: dict) -> ResultProxy:
+    """Adds the scores from a game to each user's global score.
+
+    Users are upserted in ID order, so games completing at the same time
+    lock shared users' rows in the same order and can't deadlock.
+
+    :param c conn:
+    :param dict scores: Scores keyed by integer user ID.
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :type r: sqlalchemy.engine.result.ResultProxy
+    :rtype: r
+    :return:
+    """
+
+    user_ids = sorted(scores)
+
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            ADD_SCORES,
+            user_ids=user_ids,
+            scores=[scores[user_id] for user_id in user_ids])
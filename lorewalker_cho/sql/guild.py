@@ -16,14 +16,50 @@
 
 """Contains CRUD functions for guilds in postgres."""
 
+import io
+
 import sqlalchemy as sa
+import sqlalchemy.dialects.postgresql as postgresql
 
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.engine.interfaces import Connectable
 from sqlalchemy.engine.result import ResultProxy
 
+from lorewalker_cho.sql import repository
+from lorewalker_cho.sql.instrument import instrumented
 from lorewalker_cho.sql.schema import GUILDS
 
-
+GET_GUILD = sa.select([GUILDS.c.discord_guild_id, GUILDS.c.config]) \
+    .where(GUILDS.c.discord_guild_id == sa.bindparam("guild_id")) \
+    .limit(1)
+CREATE_GUILD = GUILDS.insert(None)
+UPDATE_GUILD_CONFIG = GUILDS.update(None) \
+    .where(GUILDS.c.discord_guild_id == sa.bindparam("guild_id"))
+
+GUILD_IDS = sa.bindparam("guild_ids", type_=postgresql.ARRAY(sa.BigInteger))
+GET_GUILDS = sa.select([GUILDS.c.discord_guild_id, GUILDS.c.config]) \
+    .where(GUILDS.c.discord_guild_id == sa.any_(GUILD_IDS))
+CREATE_GUILDS = insert(GUILDS).from_select(
+    [GUILDS.c.discord_guild_id, GUILDS.c.config],
+    sa.select([sa.func.unnest(GUILD_IDS), sa.literal_column("'{}'::jsonb")]),
+).on_conflict_do_nothing(index_elements=[GUILDS.c.discord_guild_id])
+
+# Shards larger than this are registered by streaming ids into a temporary
+# table with COPY rather than sending them as one array parameter.
+COPY_THRESHOLD = 5000
+CREATE_COPY_TABLE = """
+    CREATE TEMPORARY TABLE new_guilds (discord_guild_id BIGINT NOT NULL)
+    ON COMMIT DROP
+"""
+COPY_GUILD_IDS = "COPY new_guilds (discord_guild_id) FROM STDIN"
+CREATE_GUILDS_FROM_COPY = """
+    INSERT INTO guilds (discord_guild_id, config)
+    SELECT discord_guild_id, '{}'::jsonb FROM new_guilds
+    ON CONFLICT (discord_guild_id) DO NOTHING
+"""
+
+
+@instrumented
 def get_guild(conn: Connectable, guild_id: int) -> tuple:
     """Retrieves config guild information.
 
@@ -34,12 +70,29 @@ def get_guild(conn: Connectable, guild_id: int) -> tuple:
     :return:
     """
 
-    query = sa.select([GUILDS.c.discord_guild_id, GUILDS.c.config]) \
-        .where(GUILDS.c.discord_guild_id == guild_id) \
-        .limit(1)
-    return conn.execute(query).first()
+    with repository.connect(conn) as connection:
+        return connection.execute(GET_GUILD, guild_id=guild_id).first()
+
+
+@instrumented
+def get_guilds(conn: Connectable, guild_ids: list) -> list:
+    """Retrieves config information for many guilds in one query.
+
+    Guilds that aren't in the database are left out of the results.
+
+    :param c conn:
+    :param list guild_ids:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :rtype: list
+    :return:
+    """
+
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            GET_GUILDS, guild_ids=list(guild_ids)).fetchall()
 
 
+@instrumented
 def create_guild(
         conn: Connectable,
         guild_id: int,
@@ -55,13 +108,12 @@ def create_guild(
     :return:
     """
 
-    query = GUILDS.insert(None).values({
-        "discord_guild_id": guild_id,
-        "config": config or {},
-    })
-    return conn.execute(query)
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            CREATE_GUILD, discord_guild_id=guild_id, config=config or {})
 
 
+@instrumented
 def update_guild_config(
         conn: Connectable,
         guild_id: int,
@@ -77,7 +129,44 @@ def update_guild_config(
     :return:
     """
 
-    query = GUILDS.update(None).values({
-        "config": config or {},
-    }).where(GUILDS.c.discord_guild_id == guild_id)
-    return conn.execute(query)
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            UPDATE_GUILD_CONFIG, guild_id=guild_id, config=config or {})
+
+
+@instrumented
+def create_guilds(conn: Connectable, guild_ids: list) -> int:
+    """Ensures many Discord guilds are in the database in one statement.
+
+    Guilds that already exist are left untouched. Large batches are loaded
+    with COPY into a temporary table that's merged into guilds, which keeps
+    the bind parameter small and avoids building a huge statement.
+
+    :param c conn:
+    :param list guild_ids:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :rtype: int
+    :return: The number of guilds that were newly registered.
+    """
+
+    guild_ids = list(guild_ids)
+    if not guild_ids:
+        return 0
+
+    if len(guild_ids) < COPY_THRESHOLD:
+        with repository.connect(conn) as connection:
+            return connection.execute(
+                CREATE_GUILDS, guild_ids=guild_ids).rowcount
+
+    with repository.transaction(conn) as connection:
+        connection.execute(CREATE_COPY_TABLE)
+
+        buffer = io.StringIO("".join(
+            "{}\n".format(guild_id) for guild_id in guild_ids))
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(COPY_GUILD_IDS, buffer)
+        finally:
+            cursor.close()
+
+        return connection.execute(CREATE_GUILDS_FROM_COPY).rowcount
@@ -0,0 +1,47 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains instrumentation shared by the sql helper functions."""
+
+import functools
+import time
+
+import lorewalker_cho.metrics as metrics
+import lorewalker_cho.sql.tracing as tracing
+
+
+def instrumented(func):
+    """Records the duration of a sql helper, labelled by its name.
+
+    Statements executed while the helper runs are attributed to it by the
+    query tracer.
+    """
+
+    helper = func.__name__
+    histogram = metrics.DB_QUERY_DURATION.labels(helper)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tracing.get_helper_stats(helper).calls += 1
+        token = tracing.CURRENT_HELPER.set(helper)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+            tracing.CURRENT_HELPER.reset(token)
+
+    return wrapper
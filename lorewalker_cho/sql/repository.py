@@ -0,0 +1,71 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains helpers for running prebuilt statements with cached compilation.
+
+Helpers define each statement shape once at import time, using bind parameters
+for anything that changes between calls. Executing them through `connect` or
+`transaction` uses a shared compiled cache, so SQLAlchemy compiles each shape
+once per process instead of building and compiling a new expression per call.
+
+psycopg2 has no support for server-side prepared statements, so postgres still
+plans each statement. Switching to a driver that prepares statements (such as
+psycopg 3 or asyncpg) only needs changes here.
+"""
+
+import contextlib
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine.interfaces import Connectable
+
+# Keys are statement objects, so this only grows with the number of shapes.
+COMPILED_CACHE = {}
+
+
+@contextlib.contextmanager
+def connect(conn: Connectable):
+    """Checks out a connection that uses the compiled statement cache.
+
+    Passing a connection (for example one from `transaction`) reuses it
+    instead of checking out another one from the pool.
+
+    :param c conn:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :rtype: sqlalchemy.engine.Connection
+    :return:
+    """
+
+    if isinstance(conn, Connection):
+        yield conn.execution_options(compiled_cache=COMPILED_CACHE)
+        return
+
+    with conn.connect() as connection:
+        yield connection.execution_options(compiled_cache=COMPILED_CACHE)
+
+
+@contextlib.contextmanager
+def transaction(conn: Connectable):
+    """Runs several helpers in one transaction on a single connection.
+
+    :param c conn:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :rtype: sqlalchemy.engine.Connection
+    :return:
+    """
+
+    with connect(conn) as connection:
+        with connection.begin():
+            yield connection
@@ -0,0 +1,83 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains CRUD functions for question rotations in postgres."""
+
+import logging
+import sqlalchemy as sa
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine.interfaces import Connectable
+from sqlalchemy.engine.result import ResultProxy
+
+from lorewalker_cho.sql import repository
+from lorewalker_cho.sql.instrument import instrumented
+from lorewalker_cho.sql.schema import QUESTION_ROTATIONS
+
+GET_ROTATION = sa.select([
+    QUESTION_ROTATIONS.c.seed,
+    QUESTION_ROTATIONS.c.cursor,
+    QUESTION_ROTATIONS.c.domain_bits,
+]).where(QUESTION_ROTATIONS.c.discord_guild_id == sa.bindparam("guild_id")) \
+    .limit(1)
+SAVE_ROTATION = insert(QUESTION_ROTATIONS)
+SAVE_ROTATION = SAVE_ROTATION.on_conflict_do_update(
+    index_elements=[QUESTION_ROTATIONS.c.discord_guild_id],
+    set_={
+        "seed": SAVE_ROTATION.excluded.seed,
+        "cursor": SAVE_ROTATION.excluded.cursor,
+        "domain_bits": SAVE_ROTATION.excluded.domain_bits,
+    })
+
+LOGGER = logging.getLogger("cho")
+
+
+@instrumented
+def get_rotation(conn: Connectable, guild_id: int) -> tuple:
+    """Retrieves the question rotation of a guild.
+
+    :param c conn:
+    :param int guild_id:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :rtype: tuple
+    :return: The seed, cursor and domain bits of the rotation.
+    """
+
+    with repository.connect(conn) as connection:
+        return connection.execute(GET_ROTATION, guild_id=guild_id).first()
+
+
+@instrumented
+def save_rotation(conn: Connectable, guild_id: int, rotation) -> ResultProxy:
+    """Saves the question rotation of a guild.
+
+    :param c conn:
+    :param int guild_id:
+    :param q rotation:
+    :type c: sqlalchemy.engine.interfaces.Connectable
+    :type r: sqlalchemy.engine.result.ResultProxy
+    :type q: rotation.QuestionRotation
+    :rtype: r
+    :return:
+    """
+
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            SAVE_ROTATION,
+            discord_guild_id=guild_id,
+            seed=rotation.seed,
+            cursor=rotation.cursor,
+            domain_bits=rotation.domain_bits)
@@ -36,26 +36,119 @@ ACTIVE_GAMES = sa.Table(
     "active_games",
     METADATA,
     sa.Column("id", sa.BigInteger, primary_key=True),
-    sa.Column("guild_id", sa.BigInteger, nullable=False),
+    sa.Column("discord_guild_id", sa.BigInteger, nullable=False),
+    sa.Column("channel_id", sa.BigInteger, nullable=False),
     sa.Column("game_state", postgresql.JSONB(), nullable=False),
     sa.ForeignKeyConstraint(
-        ["guild_id"],
-        ["guilds.id"],
+        ["discord_guild_id"],
+        ["guilds.discord_guild_id"],
         ondelete="CASCADE",
     ),
-    sa.Index("active_games_guild_id_idx", "guild_id", unique=True),
+    sa.Index(
+        "active_games_discord_guild_id_channel_id_idx",
+        "discord_guild_id",
+        "channel_id",
+        unique=True,
+    ),
 )
 
 SCOREBOARDS = sa.Table(
     "scoreboards",
     METADATA,
     sa.Column("id", sa.BigInteger, primary_key=True),
-    sa.Column("guild_id", sa.BigInteger, nullable=False),
+    sa.Column("discord_guild_id", sa.BigInteger, nullable=False),
     sa.Column("scores", postgresql.JSONB(), nullable=False),
     sa.ForeignKeyConstraint(
-        ["guild_id"],
-        ["guilds.id"],
+        ["discord_guild_id"],
+        ["guilds.discord_guild_id"],
+        ondelete="CASCADE",
+    ),
+    sa.Index(
+        "scoreboards_discord_guild_id_idx",
+        "discord_guild_id",
+        unique=True,
+    ),
+)
+
+QUESTION_ROTATIONS = sa.Table(
+    "question_rotations",
+    METADATA,
+    sa.Column("id", sa.BigInteger, primary_key=True),
+    sa.Column("discord_guild_id", sa.BigInteger, nullable=False),
+    sa.Column("seed", sa.BigInteger, nullable=False),
+    sa.Column("cursor", sa.Integer, nullable=False),
+    sa.Column("domain_bits", sa.SmallInteger, nullable=False),
+    sa.ForeignKeyConstraint(
+        ["discord_guild_id"],
+        ["guilds.discord_guild_id"],
+        ondelete="CASCADE",
+    ),
+    sa.Index(
+        "question_rotations_discord_guild_id_idx",
+        "discord_guild_id",
+        unique=True,
+    ),
+)
+
+# Each user's score in a guild per (UTC) day, which weekly and monthly
+# scoreboards are summed from with a range scan of the primary key.
+DAILY_SCORES = sa.Table(
+    "daily_scores",
+    METADATA,
+    sa.Column("discord_guild_id", sa.BigInteger, primary_key=True),
+    sa.Column("day", sa.Date, primary_key=True),
+    sa.Column("discord_user_id", sa.BigInteger, primary_key=True),
+    sa.Column("score", sa.Integer, nullable=False),
+    sa.ForeignKeyConstraint(
+        ["discord_guild_id"],
+        ["guilds.discord_guild_id"],
         ondelete="CASCADE",
     ),
-    sa.Index("scoreboards_guild_id_idx", "guild_id", unique=True),
+)
+
+# Every user's total score across all guilds. Games add their scores as they
+# complete, so the top players are read straight off the score index.
+GLOBAL_SCORES = sa.Table(
+    "global_scores",
+    METADATA,
+    sa.Column("discord_user_id", sa.BigInteger, primary_key=True),
+    sa.Column("score", sa.BigInteger, nullable=False),
+    sa.Index(
+        "global_scores_score_idx",
+        "score",
+        "discord_user_id",
+    ),
+)
+
+# Finished games, partitioned by month. Partitions are created ahead of time
+# and dropped once they fall out of retention by sql.game_history, and rows
+# outside of every partition land in the default one.
+GAME_HISTORY = sa.Table(
+    "game_history",
+    METADATA,
+    sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+    sa.Column(
+        "finished_at",
+        sa.DateTime(timezone=True),
+        primary_key=True,
+        server_default=sa.func.now(),
+    ),
+    sa.Column("discord_guild_id", sa.BigInteger, nullable=False),
+    sa.Column("channel_id", sa.BigInteger, nullable=False),
+    sa.Column("stopped", sa.Boolean, nullable=False),
+    sa.Column("questions_asked", sa.SmallInteger, nullable=False),
+    sa.Column("scores", postgresql.JSONB(), nullable=False),
+    sa.Index(
+        "game_history_discord_guild_id_idx",
+        "discord_guild_id",
+        "finished_at",
+    ),
+    postgresql_partition_by="RANGE (finished_at)",
+)
+
+sa.event.listen(
+    GAME_HISTORY,
+    "after_create",
+    sa.DDL("CREATE TABLE game_history_default PARTITION OF game_history "
+           "DEFAULT"),
 )
@@ -19,14 +19,26 @@
 import logging
 import sqlalchemy as sa
 
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.engine.interfaces import Connectable
 from sqlalchemy.engine.result import ResultProxy
 
-from lorewalker_cho.sql.schema import GUILDS, SCOREBOARDS
+from lorewalker_cho.sql import repository
+from lorewalker_cho.sql.instrument import instrumented
+from lorewalker_cho.sql.schema import SCOREBOARDS
+
+GET_SCOREBOARD = sa.select([SCOREBOARDS.c.scores]) \
+    .where(SCOREBOARDS.c.discord_guild_id == sa.bindparam("guild_id")) \
+    .limit(1)
+SAVE_SCOREBOARD = insert(SCOREBOARDS)
+SAVE_SCOREBOARD = SAVE_SCOREBOARD.on_conflict_do_update(
+    index_elements=[SCOREBOARDS.c.discord_guild_id],
+    set_={"scores": SAVE_SCOREBOARD.excluded.scores})
 
 LOGGER = logging.getLogger("cho")
 
 
+@instrumented
 def get_scoreboard(conn: Connectable, guild_id: int) -> tuple:
     """Retrieves an existing game state.
 
@@ -37,17 +49,11 @@ def get_scoreboard(conn: Connectable, guild_id: int) -> tuple:
     :return:
     """
 
-    query = sa.select([GUILDS.c.id]) \
-        .where(GUILDS.c.discord_guild_id == guild_id) \
-        .limit(1)
-    guild_id_fkey = conn.execute(query).first()
-
-    query = sa.select([SCOREBOARDS.c.scores]) \
-        .where(SCOREBOARDS.c.guild_id == guild_id_fkey[0]) \
-        .limit(1)
-    return conn.execute(query).first()
+    with repository.connect(conn) as connection:
+        return connection.execute(GET_SCOREBOARD, guild_id=guild_id).first()
 
 
+@instrumented
 def save_scoreboard(conn: Connectable, guild_id: int, scores) -> ResultProxy:
     """Saves a game state to the database.
 
@@ -60,28 +66,6 @@ def save_scoreboard(conn: Connectable, guild_id: int, scores) -> ResultProxy:
     :return:
     """
 
-    query = sa.select([GUILDS.c.id]) \
-        .where(GUILDS.c.discord_guild_id == guild_id) \
-        .limit(1)
-    guild_id_fkey = conn.execute(query).first()
-
-    query = sa.select([SCOREBOARDS.c.id]) \
-        .where(SCOREBOARDS.c.guild_id == guild_id_fkey[0]) \
-        .limit(1)
-    existing_scoreboard_id = conn.execute(query).first()
-
-    if existing_scoreboard_id is not None:
-        LOGGER.debug("Updating existing scoreboard.")
-
-        query = SCOREBOARDS.update(None).values({
-            "scores": scores or {},
-        }).where(SCOREBOARDS.c.id == existing_scoreboard_id[0])
-        return conn.execute(query)
-
-    LOGGER.debug("Creating new scoreboard.")
-
-    query = SCOREBOARDS.insert(None).values({
-        "guild_id": guild_id_fkey[0],
-        "scores": scores or {},
-    })
-    return conn.execute(query)
+    with repository.connect(conn) as connection:
+        return connection.execute(
+            SAVE_SCOREBOARD, discord_guild_id=guild_id, scores=scores or {})
@@ -0,0 +1,160 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains SQL statement tracing and the slow query log.
+
+Statements are attributed to the sql helper that issued them through a context
+variable set by the `instrumented` decorator. Each statement is tagged with a
+trailing comment naming the helper so it can be found in postgres' own logs
+and pg_stat_statements, and timings are aggregated per helper. Comparing the
+number of statements per helper call makes N+1 patterns easy to spot.
+"""
+
+import contextvars
+import logging
+import time
+
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+UNTRACKED_HELPER = "<none>"
+
+CURRENT_HELPER = contextvars.ContextVar("current_helper", default=None)
+
+LOGGER = logging.getLogger("cho")
+
+
+class HelperStats():
+    """Aggregated statement counts and timings of a single sql helper."""
+
+    __slots__ = ("calls", "statements", "total_secs", "max_secs")
+
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.total_secs = 0.0
+        self.max_secs = 0.0
+
+    @property
+    def statements_per_call(self) -> float:
+        """Average number of statements issued per call of the helper."""
+
+        return self.statements / self.calls if self.calls else 0.0
+
+
+HELPER_STATS = OrderedDict()
+
+
+def get_helper_stats(helper: str) -> HelperStats:
+    """Gets the aggregate stats of a helper, creating them if needed.
+
+    :param str helper:
+    :rtype: HelperStats
+    :return:
+    """
+
+    stats = HELPER_STATS.get(helper)
+    if stats is None:
+        stats = HELPER_STATS[helper] = HelperStats()
+
+    return stats
+
+
+def describe_binds(parameters) -> str:
+    """Describes the shape of bind parameters without their values.
+
+    Values can contain user data, so only names, types and sizes are logged.
+
+    :param parameters:
+    :rtype: str
+    :return:
+    """
+
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(
+            "{}: {}".format(key, type(value).__name__)
+            for key, value in parameters.items()) + "}"
+
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return "{} x {}".format(
+                len(parameters), describe_binds(parameters[0]))
+
+        return "(" + ", ".join(
+            type(value).__name__ for value in parameters) + ")"
+
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    """Tags a statement with its helper and starts timing it."""
+
+    helper = CURRENT_HELPER.get() or UNTRACKED_HELPER
+
+    # Kept on the execution context rather than the connection, so a
+    # statement that raises (and never reaches after_cursor_execute) can't
+    # leave a stale start time behind on a pooled connection.
+    if context is not None:
+        context.cho_query_start = time.perf_counter()
+
+    return "{} /* cho:{} */".format(statement, helper), parameters
+
+
+def attach_tracing(engine: Engine, slow_query_ms: float = None):
+    """Traces every statement executed through an engine.
+
+    :param e engine:
+    :param float slow_query_ms: Log statements slower than this, if set.
+    :type e: sqlalchemy.engine.Engine
+    """
+
+    def after_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "cho_query_start", None)
+        if start is None:
+            return
+
+        elapsed = time.perf_counter() - start
+        helper = CURRENT_HELPER.get() or UNTRACKED_HELPER
+
+        stats = get_helper_stats(helper)
+        stats.statements += 1
+        stats.total_secs += elapsed
+        stats.max_secs = max(stats.max_secs, elapsed)
+
+        if slow_query_ms is not None and elapsed * 1000 >= slow_query_ms:
+            LOGGER.warning(
+                "Slow query in %s took %.1f ms: %s binds=%s",
+                helper, elapsed * 1000, " ".join(statement.split()),
+                describe_binds(parameters))
+
+    event.listen(
+        engine, "before_cursor_execute", _before_cursor_execute, retval=True)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def log_query_stats():
+    """Logs the aggregated statement stats of every helper."""
+
+    for helper, stats in HELPER_STATS.items():
+        LOGGER.info(
+            "SQL %s: %d calls, %d statements (%.1f per call), "
+            "%.1f ms total, %.1f ms max",
+            helper, stats.calls, stats.statements, stats.statements_per_call,
+            stats.total_secs * 1000, stats.max_secs * 1000)
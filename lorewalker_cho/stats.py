@@ -0,0 +1,116 @@
+# Lorewalker Cho is a Discord bot that plays WoW-inspired trivia games.
+# Copyright (C) 2019  Walter Kuppens
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Contains the in-process runtime stats shown by the diag command.
+
+Prometheus histograms only keep bucket counts, which can't answer "what was
+slow just now" from inside the worker. The most recent samples are kept here
+instead, in bounded deques so recording one is a single append (which is
+also safe from executor threads). Summaries are only computed when they're
+asked for.
+"""
+
+import heapq
+
+from collections import deque
+
+RECENT_SAMPLES = 1024
+
+
+def percentile(values, fraction: float) -> float:
+    """Gets a percentile from a collection of values (nearest rank).
+
+    :param values:
+    :param float fraction:
+    :rtype: float
+    :return:
+    """
+
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class RuntimeStats():
+    """Recent loop lag, pool checkout and handler timings of the worker."""
+
+    __slots__ = ("loop_lags", "pool_waits", "handler_timings")
+
+    def __init__(self, samples=RECENT_SAMPLES):
+        """Creates empty sample buffers.
+
+        :param int samples: Number of recent samples of each kind to keep.
+        """
+
+        self.loop_lags = deque(maxlen=samples)
+        self.pool_waits = deque(maxlen=samples)
+        self.handler_timings = deque(maxlen=samples)
+
+    def record_loop_lag(self, secs: float):
+        """Records how late the event loop woke up from a sleep.
+
+        :param float secs:
+        """
+
+        self.loop_lags.append(secs)
+
+    def record_pool_wait(self, secs: float):
+        """Records how long a pool checkout waited for a connection.
+
+        :param float secs:
+        """
+
+        self.pool_waits.append(secs)
+
+    def record_handler(self, name: str, secs: float):
+        """Records how long a handler took to run.
+
+        :param str name:
+        :param float secs:
+        """
+
+        self.handler_timings.append((secs, name))
+
+    def get_slowest_handlers(self, count=5) -> list:
+        """Gets the slowest of the recently recorded handler runs.
+
+        :param int count:
+        :rtype: list
+        :return: Tuples of seconds and handler name, slowest first.
+        """
+
+        return heapq.nlargest(count, list(self.handler_timings))
+
+    def get_pool_waits(self, threshold=0.001) -> tuple:
+        """Gets how many recent checkouts had to wait for a connection.
+
+        :param float threshold: Seconds a checkout takes to count as a wait.
+        :rtype: tuple
+        :return: Number of waits, number of checkouts and the longest wait.
+        """
+
+        # Checkouts also happen in executor threads, so take a copy before
+        # iterating in case one is recorded in the meantime.
+        pool_waits = list(self.pool_waits)
+        waits = sum(1 for secs in pool_waits if secs > threshold)
+
+        return waits, len(pool_waits), max(pool_waits, default=0.0)
+
+
+STATS = RuntimeStats()
@@ -22,6 +22,7 @@ import os
 from collections import OrderedDict
 
 import jellyfish
+import numpy as np
 
 from discord.channel import TextChannel
 from discord.member import Member
@@ -133,13 +134,17 @@ def is_owner(member: Member) -> bool:
 
 
 def is_message_from_trivia_channel(message: Message, config: dict) -> bool:
-    """Checks if the message is from the trivia channel.
+    """Checks if the message is from one of the trivia channels.
 
     :param m message:
     :param dict config:
     :type m: discord.message.Message
     """
 
+    if "trivia_channels" in config:
+        return message.channel.id in config["trivia_channels"]
+
+    # Guilds configured before multiple channels were supported.
     if "trivia_channel" in config:
         return message.channel.id == config["trivia_channel"]
 
@@ -173,3 +178,123 @@ def levenshtein_ratio(source, target, ignore_case=True):
     target_len = len(target)
 
     return (source_len + target_len - distance) / (source_len + target_len)
+
+
+def _encode_strings(strings: list) -> tuple:
+    """Encodes strings as a zero padded matrix of code points.
+
+    :param list strings:
+    :rtype: tuple
+    :return: The code point matrix and an array of string lengths.
+    """
+
+    lengths = np.array([len(string) for string in strings], dtype=np.intp)
+    width = max(lengths.max(), 1)
+
+    padded = "".join(string.ljust(width, "\0") for string in strings)
+    codes = np.frombuffer(padded.encode("utf-32-le"), dtype=np.uint32)
+
+    return codes.reshape(len(strings), width), lengths
+
+
+def levenshtein_distances(sources: list, targets: list) -> np.ndarray:
+    """Calculates the levenshtein distance between every source and target.
+
+    This is Myers' bit-parallel algorithm run over every pair at once. Each
+    target is stored as a bit vector in a uint64, so a whole column of the
+    distance matrix is updated with a few integer operations, and each of
+    those operations covers every pair. Targets must be under 64 characters.
+
+    :param list sources:
+    :param list targets:
+    :rtype: numpy.ndarray
+    :return: A matrix of distances with a row per source, column per target.
+    """
+
+    source_codes, source_lengths = _encode_strings(sources)
+    target_codes, target_lengths = _encode_strings(targets)
+
+    if target_codes.shape[1] >= 64:
+        raise ValueError("Targets must be under 64 characters long.")
+
+    # Map characters to a small alphabet and build each target's match masks,
+    # so a source character's mask is one lookup instead of a comparison.
+    alphabet, symbols = np.unique(
+        np.concatenate([source_codes.ravel(), target_codes.ravel()]),
+        return_inverse=True)
+    source_symbols = symbols[:source_codes.size].reshape(source_codes.shape)
+
+    one = np.uint64(1)
+    bits = np.left_shift(one, np.arange(target_codes.shape[1], dtype=np.uint64))
+    matches = alphabet[:, None, None] == target_codes[None, :, :]
+    match_masks = np.bitwise_or.reduce(matches * bits, axis=2).ravel()
+
+    # Pairs are source major, a row per source and a column per target.
+    pair_count = len(sources) * len(targets)
+    pair_targets = np.tile(np.arange(len(targets)), len(sources))
+    pair_sources = np.repeat(np.arange(len(sources)), len(targets))
+    pair_source_lengths = source_lengths[pair_sources]
+
+    lengths = np.maximum(target_lengths[pair_targets], 1).astype(np.uint64)
+    mask = np.left_shift(one, lengths) - one
+    last_bit = np.left_shift(one, lengths - one)
+
+    positive = mask.copy()
+    negative = np.zeros(pair_count, dtype=np.uint64)
+    distances = target_lengths[pair_targets].copy()
+
+    for index in range(source_codes.shape[1]):
+        lookup = source_symbols[pair_sources, index] * len(targets)
+        equal = match_masks[lookup + pair_targets]
+
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | ~(horizontal | positive)
+        horizontal_negative = positive & horizontal
+
+        active = pair_source_lengths > index
+        distances += active & ((horizontal_positive & last_bit) != 0)
+        distances -= active & ((horizontal_negative & last_bit) != 0)
+
+        horizontal_positive = (horizontal_positive << one) | one
+        horizontal_negative = horizontal_negative << one
+        positive = (horizontal_negative | ~(vertical | horizontal_positive))
+        positive &= mask
+        negative = horizontal_positive & vertical & mask
+
+    # An empty target is stored as one character so the shifts stay valid.
+    empty = target_lengths[pair_targets] == 0
+    distances[empty] = pair_source_lengths[empty]
+
+    return distances.reshape(len(sources), len(targets))
+
+
+def levenshtein_ratios(
+        sources: list,
+        targets: list,
+        ignore_case=True) -> np.ndarray:
+    """Calculates the levenshtein ratio between every source and target.
+
+    This is a vectorized form of levenshtein_ratio that gives the same
+    results, meant for scoring a batch of guesses against all of a question's
+    answers in one go.
+
+    :param list sources:
+    :param list targets: Must be under 64 characters long.
+    :rtype: numpy.ndarray
+    :return: A matrix of ratios with a row per source, column per target.
+    """
+
+    if ignore_case:
+        distances = levenshtein_distances(
+            [source.lower().strip() for source in sources],
+            [target.lower().strip() for target in targets])
+    else:
+        distances = levenshtein_distances(sources, targets)
+
+    # The ratio uses the original lengths, same as levenshtein_ratio.
+    lengths = np.add.outer(
+        np.array([len(source) for source in sources]),
+        np.array([len(target) for target in targets]))
+
+    return (lengths - distances) / lengths
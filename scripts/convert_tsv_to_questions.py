@@ -19,9 +19,16 @@
 import argparse
 import csv
 
+from lorewalker_cho.question_bank import dedupe_answers
 
-def generate_questions_file(input_file, output_file):
-    """Maps a TSV questions file to a python file."""
+
+def generate_questions_file(input_file, output_file, keep_aliases=False):
+    """Maps a TSV questions file to a python file.
+
+    Aliases that only differ from an earlier alias by case, accents,
+    punctuation or spacing are dropped, as answer checking already accepts
+    those, unless keep_aliases is set.
+    """
 
     with open(input_file, "r") as tsvin, open(output_file, "w") as pyout:
         pyout.write("# ==================================\n")
@@ -35,9 +42,13 @@ def generate_questions_file(input_file, output_file):
 
             topic = row[0]
             question = row[1].replace("\"", "\\\"")
+            aliases = [x.strip() for x in row[2].split(",")]
+            if not keep_aliases:
+                aliases = dedupe_answers(aliases)
+
             answers = "[" + ", ".join(
-                ["\"{}\"".format(x.strip().replace("\"", "\\\""))
-                 for x in row[2].split(",")]) + "]"
+                ["\"{}\"".format(x.replace("\"", "\\\""))
+                 for x in aliases]) + "]"
 
             pyout.write("    {\n")
             pyout.write("        \"topic\": \"{}\",\n".format(topic))
@@ -70,9 +81,13 @@ def main():
         "--output",
         required=True,
         help="Specify an output location for the questions file.")
+    parser.add_argument(
+        "--keep-aliases",
+        action="store_true",
+        help="Keep aliases that answer checking would accept anyway.")
     args = parser.parse_args()
 
-    generate_questions_file(args.input, args.output)
+    generate_questions_file(args.input, args.output, args.keep_aliases)
 
 
 if __name__ == "__main__":
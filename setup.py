@@ -20,7 +20,7 @@ from setuptools import setup, find_packages
 
 setup(
     name="lorewalker_cho",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     entry_points={
         "console_scripts": ["lorewalker_cho = lorewalker_cho.__main__:main"]
     },